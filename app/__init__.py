@@ -1,15 +1,18 @@
-from flask import Flask, render_template
+from flask import Flask, render_template, request, session
 from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager
+from flask_login import LoginManager, current_user
 from flask_migrate import Migrate
 from flask_socketio import SocketIO
+from app.utils.db_pool import instrumented_engine_options
+from app.utils.replica import RoutingSession, init_replica
 from config import Config
 import os
 from pathlib import Path
 from datetime import datetime
 
 # Initialisation des extensions
-db = SQLAlchemy()
+# Session routée : lectures des vues read_replica sur la réplique (REPLICA_DATABASE_URL)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 migrate = Migrate()
 socketio = SocketIO()
@@ -27,6 +30,24 @@ def datetimeformat(value, format='%d/%m/%Y %H:%M'):
         return value
     return value.strftime(format)
 
+def socketio_options(config):
+    """
+    Options SocketIO issues de la configuration. Avec SOCKETIO_MESSAGE_QUEUE, chaque
+    emit transite par la file partagée et atteint les clients de tous les workers
+    (memory:// en test : transport Kombu en mémoire, limité au processus).
+    """
+    # Options toujours explicites : l'instance socketio est partagée et init_app
+    # conserve celles d'un appel précédent (gestionnaire de file compris)
+    options = {
+        'message_queue': config.get('SOCKETIO_MESSAGE_QUEUE') or None,
+        'async_mode': config.get('SOCKETIO_ASYNC_MODE') or None,
+    }
+    if options['message_queue']:
+        options['channel'] = config.get('SOCKETIO_CHANNEL', 'flask-socketio')
+    else:
+        options['client_manager'] = None
+    return options
+
 def create_app(config_class=Config):
     """Factory d'application Flask"""
     app = Flask(__name__)
@@ -40,6 +61,9 @@ def create_app(config_class=Config):
     app.config['UPLOAD_FOLDER'] = str(UPLOAD_FOLDER)
     app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'doc', 'docx', 'xls', 'xlsx', 'mp4', 'txt'}
     app.config['MAX_CONTENT_LENGTH'] = 200 * 1024 * 1024  # 200 MB maximum
+    # Morceaux en cours d'envoi, hors du dossier static
+    app.config['UPLOAD_TMP_FOLDER'] = str(BASE_DIR / 'instance' / 'uploads')
+    app.config['ATTACHMENT_STORAGE_ROOT'] = app.config.get('ATTACHMENT_STORAGE_ROOT') or str(BASE_DIR / 'instance' / 'attachments')
 
     # Créer le dossier uploads/messages s'il n'existe pas
     try:
@@ -56,17 +80,24 @@ def create_app(config_class=Config):
     config_class.init_app(app)
     
     # 2. Initialisation des extensions
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = instrumented_engine_options(app.config.get('SQLALCHEMY_ENGINE_OPTIONS'))
     db.init_app(app)
+    init_replica(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Veuillez vous connecter pour accéder à cette page.'
     login_manager.login_message_category = 'info'
     migrate.init_app(app, db)
-    socketio.init_app(app)
+    socketio.init_app(app, **socketio_options(app.config))
+    # Profilage SQL par requête : compteur, requêtes lentes, en-tête Server-Timing
+    from app.utils.profiling import init_profiling
+    init_profiling(app)
     
     # 3. Configuration des filtres Jinja2
     app.jinja_env.filters['format_number'] = format_number
     app.jinja_env.filters['datetimeformat'] = datetimeformat
+    from app.utils.storage import attachment_url
+    app.jinja_env.filters['attachment_url'] = attachment_url
     
     # 4. Gestion des erreurs
     @app.errorhandler(404)
@@ -96,6 +127,7 @@ def create_app(config_class=Config):
     from app.routes.data import data_bp
     from app.routes.data_viewer import data_viewer_bp
     from app.routes.messages import messages_bp
+    from app.routes.api import api_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(main_bp)
@@ -103,8 +135,13 @@ def create_app(config_class=Config):
     app.register_blueprint(data_bp)
     app.register_blueprint(data_viewer_bp)
     app.register_blueprint(messages_bp)
+    app.register_blueprint(api_bp)
+
+    # 6. Celery (tâches lancées par l'application web : notifications différées)
+    from app.tasks import make_celery
+    make_celery(app)
     
-    # 6. Configuration du user loader
+    # 7. Configuration du user loader
     @login_manager.user_loader
     def load_user(user_id):
         from app.models import User
@@ -113,19 +150,93 @@ def create_app(config_class=Config):
             app.logger.warning(f"Utilisateur introuvable: {user_id}")
         return user
     
-    # 7. SocketIO event handlers
+    # 8. Commandes CLI
+    @app.cli.command('refresh-performance')
+    def refresh_performance_command():
+        """Enregistre un instantané de performance pour toutes les régions."""
+        from app.utils.performance import refresh_performance_snapshots
+        count = refresh_performance_snapshots()
+        app.logger.info(f"{count} instantanés de performance enregistrés")
+        print(f"{count} instantanés de performance enregistrés.")
+
+    @app.cli.command('provision-conversations')
+    def provision_conversations_command():
+        """Crée les conversations de groupe et privées manquantes de tous les utilisateurs."""
+        from app.models import Location, User
+        from app.utils.conversations import provision_group_conversations, sync_user_memberships
+        created = provision_group_conversations(Location.query.filter_by(type='REG').all())
+        users = User.query.all()
+        if users:
+            sync_user_memberships(*users)
+        db.session.commit()
+        print(f"{len(created)} conversations de groupe créées, {len(users)} utilisateurs synchronisés.")
+
+    @app.cli.command('migrate-attachments')
+    def migrate_attachments_command():
+        """Range les anciennes pièces jointes (static) dans le stockage adressé par contenu."""
+        import shutil
+        import tempfile
+        from app.models import Message
+        from app.utils.storage import LEGACY_PREFIX, attachment_file, get_storage
+        storage = get_storage()
+        os.makedirs(storage.root, exist_ok=True)
+        paths = db.session.scalars(db.select(Message.attachment_path).distinct().where(
+            Message.attachment_path.startswith(LEGACY_PREFIX)
+        )).all()
+        migrated = []
+        for path in paths:
+            source = attachment_file(path)
+            if not os.path.exists(source):
+                continue
+            # Copie d'abord : l'original n'est supprimé qu'après la mise à jour des messages
+            with tempfile.NamedTemporaryFile(dir=storage.root, delete=False) as copy:
+                with open(source, 'rb') as original:
+                    shutil.copyfileobj(original, copy)
+            key = storage.put_file(copy.name, source.rsplit('.', 1)[-1])
+            db.session.execute(db.update(Message).where(Message.attachment_path == path).values(attachment_path=key))
+            migrated.append(source)
+        db.session.commit()
+        for source in migrated:
+            os.remove(source)
+        print(f"{len(migrated)} pièces jointes déplacées dans le stockage.")
+
+    @app.cli.command('generate-previews')
+    def generate_previews_command():
+        """Met en file la génération des aperçus des pièces jointes qui n'en ont pas."""
+        from app.models import Message
+        from app.tasks import generate_attachment_previews
+        message_ids = db.session.scalars(db.select(Message.id).where(
+            Message.attachment_type.in_(['image', 'video']),
+            Message.thumbnail_path.is_(None)
+        )).all()
+        for message_id in message_ids:
+            generate_attachment_previews.delay(message_id)
+        print(f"{len(message_ids)} aperçus mis en file.")
+
+    # 9. SocketIO event handlers
+    # Indicateur de saisie : réservé aux membres ayant rejoint la conversation sur cette
+    # connexion (adhésion vérifiée par 'join'), regroupé et arrêté automatiquement côté serveur.
+    from app.utils.typing_indicator import start_typing, stop_typing
+
+    def typing_conversation_id(data):
+        try:
+            conversation_id = int((data or {}).get('conversation_id'))
+        except (TypeError, ValueError):
+            return None
+        if not current_user.is_authenticated or conversation_id not in session.get('joined_conversations', ()):
+            return None
+        return conversation_id
+
     @socketio.on('typing')
     def handle_typing(data):
-        conversation_id = data['conversation_id']
-        user_name = data['user_name']
-        socketio.emit('typing', {
-            'user_name': user_name,
-            'conversation_id': conversation_id
-        }, room=conversation_id)
+        conversation_id = typing_conversation_id(data)
+        if conversation_id is not None:
+            start_typing(current_user, conversation_id, skip_sid=request.sid)
 
     @socketio.on('stop_typing')
     def handle_stop_typing(data):
-        conversation_id = data['conversation_id']
-        socketio.emit('stop_typing', {'conversation_id': conversation_id}, room=conversation_id)
+        conversation_id = typing_conversation_id(data)
+        if conversation_id is not None:
+            stop_typing(current_user.id, conversation_id)
 
     return app
\ No newline at end of file
@@ -5,7 +5,8 @@ from wtforms import (
     IntegerField, FloatField, TextAreaField, SelectMultipleField
 )
 from wtforms.validators import DataRequired, Length, Optional, ValidationError, EqualTo, NumberRange
-from app.models import User, Location
+from app.models import User
+from app.utils.locations import get_districts, get_location, get_location_index, get_regions, load_location
 from datetime import datetime
 from app import db
 
@@ -25,13 +26,13 @@ class RegistrationForm(FlaskForm):
 
     def load_locations(self):
         if self.role.data == 'data_entry':
-            self.location.choices = [(loc.id, loc.name) for loc in Location.query.filter_by(type='DIS').all()]
+            self.location.choices = [(loc.id, loc.name) for loc in get_districts()]
         elif self.role.data == 'team_lead':
-            self.location.choices = [(loc.id, loc.name) for loc in Location.query.filter_by(type='REG').all()]
+            self.location.choices = [(loc.id, loc.name) for loc in get_regions()]
         elif self.role.data == 'data_viewer':
             self.location.choices = [(0, 'Aucune')]
         else:
-            self.location.choices = [(loc.id, loc.name) for loc in Location.query.all()]
+            self.location.choices = [(loc.id, loc.name) for loc in get_location_index().by_id.values()]
 
     def validate_matriculate(self, field):
         if User.query.filter_by(matriculate=field.data).first():
@@ -44,7 +45,7 @@ class RegistrationForm(FlaskForm):
     def validate_location(self, field):
         if self.role.data == 'data_viewer':
             return  # Pas de validation pour data_viewer
-        location = Location.query.get(field.data)
+        location = load_location(field.data)
         if self.role.data == 'data_entry' and location and location.type != 'DIS':
             raise ValidationError('Un utilisateur de type Data Entry doit être assigné à un district, pas à une région.')
         if self.role.data == 'team_lead' and location and location.type != 'REG':
@@ -72,14 +73,14 @@ class DataEntryForm(FlaskForm):
         """Charge dynamiquement les localisations disponibles pour l'utilisateur."""
         if user_location_id:
             # Si l'utilisateur est lié à une localisation, limiter les choix à celle-ci
-            location = Location.query.get(user_location_id)
+            location = get_location(user_location_id)
             if location:
                 self.location.choices = [(location.id, location.name)]
             else:
                 self.location.choices = []
         else:
             # Sinon, charger toutes les localisations
-            self.location.choices = [(loc.id, loc.name) for loc in Location.query.all()]
+            self.location.choices = [(loc.id, loc.name) for loc in get_location_index().by_id.values()]
 
 class LocationForm(FlaskForm):
     """Formulaire pour créer ou modifier une localisation (région ou district)."""
@@ -91,7 +92,7 @@ class LocationForm(FlaskForm):
 
     def load_locations(self):
         """Charge dynamiquement les régions parentes disponibles."""
-        self.parent.choices = [(0, 'Aucune')] + [(loc.id, loc.name) for loc in Location.query.filter_by(type='REG').all()]
+        self.parent.choices = [(0, 'Aucune')] + [(loc.id, loc.name) for loc in get_regions()]
 
     def validate_parent(self, field):
         """Valide que le parent est une région si le type est un district."""
@@ -107,18 +108,13 @@ class TeamManagementForm(FlaskForm):
 
     def load_locations(self, region_id):
         """Charge dynamiquement les districts pour une région donnée."""
-        self.location.choices = [(loc.id, loc.name) 
-                               for loc in Location.query.filter_by(
-                                   parent_id=region_id,
-                                   type='DIS'
-                               ).all()]
+        self.location.choices = [(loc.id, loc.name) for loc in get_districts(region_id)]
 
     def load_members(self, region_id=None):
         """Charge les data_entry non assignés ou dans les districts de la région."""
         if region_id:
             # Récupérer les districts de la région
-            district_ids = [d.id for d in 
-                          Location.query.filter_by(parent_id=region_id, type='DIS').all()]
+            district_ids = [d.id for d in get_districts(region_id)]
             
             # Membres data_entry dans ces districts OU non assignés
             members = User.query.filter(
@@ -142,7 +138,7 @@ class SelectRegionForm(FlaskForm):
 
     def load_regions(self):
         """Charge dynamiquement les régions disponibles."""
-        self.region.choices = [(r.id, r.name) for r in Location.query.filter_by(type='REG').all()]
+        self.region.choices = [(r.id, r.name) for r in get_regions()]
 
 class ChangeLocationForm(FlaskForm):
     """Formulaire pour demander un changement de localisation."""
@@ -152,14 +148,14 @@ class ChangeLocationForm(FlaskForm):
 
     def load_regions(self):
         """Charge dynamiquement les régions disponibles."""
-        regions = Location.query.filter_by(type='REG').all()
+        regions = get_regions()
         if not regions:
             raise ValidationError("Aucune région disponible. Veuillez contacter l'administrateur.")
         self.region.choices = [(r.id, r.name) for r in regions]
 
     def load_districts(self, region_id):
         """Charge dynamiquement les districts pour une région donnée."""
-        districts = Location.query.filter_by(parent_id=region_id, type='DIS').all()
+        districts = get_districts(region_id)
         if not districts:
             raise ValidationError("Aucun district disponible pour cette région.")
         self.district.choices = [(d.id, d.name) for d in districts]  # Supprimé l'option "Aucun"
@@ -167,7 +163,7 @@ class ChangeLocationForm(FlaskForm):
     def validate_district(self, field):
         """Valide que le district sélectionné est valide."""
         if field.data:
-            district = Location.query.get(field.data)
+            district = load_location(field.data)
             if not district or district.type != 'DIS':
                 raise ValidationError("Le district sélectionné est invalide.")
 
@@ -178,7 +174,7 @@ class PromotionRequestForm(FlaskForm):
 
     def load_regions(self):
         """Charge dynamiquement les régions disponibles."""
-        self.region.choices = [(r.id, r.name) for r in Location.query.filter_by(type='REG').all()]
+        self.region.choices = [(r.id, r.name) for r in get_regions()]
 
 class MemberReportForm(FlaskForm):
     """Formulaire pour soumettre un rapport sur un membre de l'équipe."""
@@ -224,8 +220,8 @@ class DistrictTransferForm(FlaskForm):
 
     def load_districts(self, region_id):
         """Charge dynamiquement les districts pour une région donnée."""
-        self.district.choices = [(d.id, d.name) for d in Location.query.filter_by(parent_id=region_id, type='DIS').all()]
+        self.district.choices = [(d.id, d.name) for d in get_districts(region_id)]
 
     def load_regions(self):
         """Charge dynamiquement les régions disponibles."""
-        self.new_region.choices = [(r.id, r.name) for r in Location.query.filter_by(type='REG').all()]
\ No newline at end of file
+        self.new_region.choices = [(r.id, r.name) for r in get_regions()]
\ No newline at end of file
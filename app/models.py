@@ -25,9 +25,22 @@ class Location(db.Model):
     change_requests = db.relationship('ChangeRequest', back_populates='target_district')
     promotion_requests = db.relationship('PromotionRequest', back_populates='requested_region')
 
+    __table_args__ = (
+        db.Index('ix_locations_parent_id_type', 'parent_id', 'type'),
+    )
+
     def __repr__(self):
         return f"<Location {self.name}>"
 
+class LocationTreeVersion(db.Model):
+    """
+    Version de l'arborescence des localisations, partagée par tous les processus : incrémentée
+    dans la transaction qui modifie une localisation, elle invalide les index en mémoire.
+    """
+    __tablename__ = 'location_tree_version'
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
 # Ensuite, définir User, qui dépend de Location
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -50,6 +63,11 @@ class User(UserMixin, db.Model):
     promotion_requests = db.relationship('PromotionRequest', back_populates='user')
     team_reports_lead = db.relationship('TeamReport', foreign_keys='TeamReport.team_lead_id', back_populates='team_lead')
     team_reports_member = db.relationship('TeamReport', foreign_keys='TeamReport.member_id', back_populates='member')
+    conversation_memberships = db.relationship('ConversationParticipant', back_populates='user')
+
+    __table_args__ = (
+        db.Index('ix_users_role_location_id', 'role', 'location_id'),
+    )
 
     def set_password(self, password):
         self.password = generate_password_hash(password)
@@ -80,6 +98,8 @@ class DataEntry(db.Model):
 
     __table_args__ = (
         CheckConstraint('members = children + men + women', name='check_members_sum'),
+        db.Index('ix_data_entries_location_id_date', 'location_id', 'date'),
+        db.Index('ix_data_entries_user_id_date', 'user_id', 'date'),
     )
 
     def __repr__(self):
@@ -99,6 +119,10 @@ class PerformanceMetric(db.Model):
 
     region = db.relationship('Location', back_populates='performance_metrics')
 
+    __table_args__ = (
+        db.Index('ix_performance_metrics_region_id_created_at', 'region_id', 'created_at'),
+    )
+
     def __repr__(self):
         return f"<PerformanceMetric {self.id}>"
 
@@ -143,7 +167,8 @@ class ChangeRequest(db.Model):
         db.CheckConstraint(
             "team_lead_responded_at IS NULL OR team_lead_responded_at >= data_entry_responded_at",
             name='check_team_lead_response_timing'
-        )
+        ),
+        db.Index('ix_change_requests_status_target_district_id', 'status', 'target_district_id')
     )
 
     def __init__(self, **kwargs):
@@ -203,6 +228,10 @@ class ChangeRequest(db.Model):
                 raise ValueError("Utilisateur pour l'échange introuvable.")
         else:
             requester.location_id = self.target_district_id
+
+        # Import local : app.utils.conversations dépend de ce module
+        from app.utils.conversations import sync_user_memberships
+        sync_user_memberships(requester, *([exchange_user] if self.exchange_with_user_id else []))
         
         self.status = 'accepted'
         self.team_lead_responded_at = datetime.utcnow()
@@ -280,18 +309,49 @@ class Conversation(db.Model):
     type = db.Column(db.String(50), nullable=False)  # 'private' ou 'group'
     location_id = db.Column(db.Integer, db.ForeignKey('locations.id'))
     title = db.Column(db.String(100))  # Pour le groupe global
+    # Clé canonique d'une conversation privée : (plus petit, plus grand id des deux membres)
+    user_low_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    user_high_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    # Dernier message, ordre (timestamp, id) : tri et aperçu de la boîte de réception, tenus
+    # à jour à l'insertion
+    last_message_at = db.Column(db.DateTime)
+    last_message_id = db.Column(db.Integer)
 
     location = db.relationship('Location', back_populates='conversations')
     messages = db.relationship('Message', back_populates='conversation')
+    participants = db.relationship('ConversationParticipant', back_populates='conversation', cascade='all, delete-orphan')
 
     # Contraintes
     __table_args__ = (
         db.CheckConstraint("type IN ('private', 'group')", name='check_conversation_type'),
+        # Une seule conversation privée par paire ; les groupes (NULL) ne sont pas concernés
+        db.Index('uq_conversations_private_pair', 'user_low_id', 'user_high_id', unique=True),
     )
 
     def __repr__(self):
         return f"<Conversation {self.id} - {self.type}>"
 
+# Membres d'une conversation (accès en une recherche par clé primaire)
+class ConversationParticipant(db.Model):
+    __tablename__ = 'conversation_participants'
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversations.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    joined_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Dernier message lu : les non-lus sont les messages d'id supérieur (fan-out à la lecture)
+    last_read_message_id = db.Column(db.Integer, nullable=True)
+    # Non-lus du membre : +1 à chaque message reçu, recalculé quand le dernier lu avance
+    unread_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    conversation = db.relationship('Conversation', back_populates='participants')
+    user = db.relationship('User', back_populates='conversation_memberships')
+
+    __table_args__ = (
+        db.Index('ix_conversation_participants_user_id', 'user_id'),
+    )
+
+    def __repr__(self):
+        return f"<ConversationParticipant {self.user_id} in Conversation {self.conversation_id}>"
+
 # Définir Message, qui dépend de User et Conversation
 class Message(db.Model):
     __tablename__ = 'messages'
@@ -302,6 +362,9 @@ class Message(db.Model):
     conversation_id = db.Column(db.Integer, db.ForeignKey('conversations.id'), nullable=False)
     attachment_path = db.Column(db.String(255))
     attachment_type = db.Column(db.String(50))
+    # Vignette et aperçu WebP des images et vidéos, générés en tâche de fond
+    thumbnail_path = db.Column(db.String(255))
+    preview_path = db.Column(db.String(255))
     read = db.Column(db.Boolean, default=False)
 
     sender = db.relationship('User', back_populates='messages')
@@ -314,11 +377,35 @@ class Message(db.Model):
             "attachment_type IN ('image', 'file', 'video') OR attachment_type IS NULL",
             name='check_attachment_type'
         ),
+        db.Index('ix_messages_conversation_id_timestamp', 'conversation_id', 'timestamp'),
+        # Non-lus : messages d'id supérieur au dernier lu de chaque membre
+        db.Index('ix_messages_conversation_id_id', 'conversation_id', 'id'),
     )
 
     def __repr__(self):
         return f"<Message {self.id} in Conversation {self.conversation_id}>"
 
+class Upload(db.Model):
+    """Envoi de pièce jointe par morceaux (reprise possible), dédoublonné par empreinte sha256."""
+    __tablename__ = 'uploads'
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversations.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    sha256 = db.Column(db.String(64))
+    attachment_path = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_uploads_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('ix_uploads_sha256', 'sha256'),
+    )
+
+    def __repr__(self):
+        return f"<Upload {self.id} {self.filename}>"
+
 # Définir Notification, qui dépend de User et Message
 class Notification(db.Model):
     __tablename__ = 'notifications'
@@ -332,5 +419,9 @@ class Notification(db.Model):
     user = db.relationship('User', back_populates='notifications')
     message_rel = db.relationship('Message', back_populates='notifications')
 
+    __table_args__ = (
+        db.Index('ix_notifications_user_id_read_message_id', 'user_id', 'read', 'message_id'),
+    )
+
     def __repr__(self):
         return f"<Notification {self.id} for User {self.user_id}>"
\ No newline at end of file
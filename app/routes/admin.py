@@ -3,6 +3,8 @@ from flask_login import login_required, current_user
 from app.models import Location, User
 from app.forms import LocationForm
 from app.extensions import db
+from app.utils.conversations import provision_group_conversations
+from app.utils.locations import get_regions
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -13,7 +15,7 @@ def manage_locations():
         abort(403)
     
     form = LocationForm()
-    form.parent.choices = [(0, 'Aucun')] + [(loc.id, loc.name) for loc in Location.query.filter_by(type='REG')]
+    form.parent.choices = [(0, 'Aucun')] + [(loc.id, loc.name) for loc in get_regions()]
     
     if form.validate_on_submit():
         location = Location(
@@ -23,6 +25,8 @@ def manage_locations():
             parent_id=form.parent.data if form.parent.data != 0 else None
         )
         db.session.add(location)
+        if location.type == 'REG':
+            provision_group_conversations([location])
         db.session.commit()
         flash('Localisation créée!', 'success')
         return redirect(url_for('admin.manage_locations'))
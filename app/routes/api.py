@@ -1,8 +1,11 @@
-from flask import Blueprint, jsonify, request, abort
+from flask import Blueprint, jsonify, request, abort, current_app
 from flask_login import login_required, current_user
+from flask_wtf.csrf import validate_csrf
+from wtforms.validators import ValidationError
 from app.models import Location, User
 from app import db
-from datetime import datetime
+from app.utils.conversations import provision_group_conversations, sync_location_memberships
+from app.utils.db_pool import pool_status
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -11,28 +14,51 @@ def check_admin_role():
     if current_user.role not in ['data_viewer', 'team_lead']:
         abort(403)
 
+# Écritures sur les localisations : réservées aux data_viewers (comme /manage-locations),
+# avec le jeton CSRF du formulaire (en-tête X-CSRFToken ou champ csrf_token)
+def check_location_write():
+    if current_user.role != 'data_viewer':
+        abort(403)
+    if current_app.config.get('WTF_CSRF_ENABLED', True):
+        try:
+            validate_csrf(request.headers.get('X-CSRFToken') or request.form.get('csrf_token'))
+        except ValidationError:
+            abort(400)
+
 # 1. Récupérer toutes les localisations (arborescence complète)
 @api_bp.route('/locations', methods=['GET'])
 @login_required
 def get_all_locations():
     check_admin_role()
-    def build_tree(locations, parent_id=None):
-        tree = []
-        for loc in locations.filter_by(parent_id=parent_id).all():
-            node = {
-                'id': loc.id,
-                'code': loc.code,
-                'name': loc.name,
-                'type': loc.type,
-                'team_lead': loc.team_lead.name if loc.team_lead else None,
-                'children': build_tree(locations, loc.id)
-            }
+    # Une seule requête : localisations et chef d'équipe éventuel, assemblées en O(n)
+    rows = db.session.execute(
+        db.select(Location.id, Location.code, Location.name, Location.type, Location.parent_id, User.name)
+        .outerjoin(User, (User.location_id == Location.id) & (User.role == 'team_lead'))
+        .order_by(Location.id, User.id)
+    ).all()
+    nodes = {}
+    tree = []
+    for location_id, code, name, type_, parent_id, team_lead in rows:
+        if location_id in nodes:
+            continue  # Plusieurs chefs d'équipe : le premier est retenu
+        nodes[location_id] = ({
+            'id': location_id,
+            'code': code,
+            'name': name,
+            'type': type_,
+            'team_lead': team_lead,
+            'children': []
+        }, parent_id)
+    for node, parent_id in nodes.values():
+        if parent_id is None:
             tree.append(node)
-        return tree
-    
-    locations = Location.query
-    tree = build_tree(locations)
-    return jsonify(tree)
+        elif parent_id in nodes:
+            nodes[parent_id][0]['children'].append(node)
+
+    # ETag calculé sur le contenu : une arborescence inchangée renvoie 304 sans corps
+    response = jsonify(tree)
+    response.add_etag()
+    return response.make_conditional(request)
 
 # 2. Récupérer une localisation spécifique
 @api_bp.route('/locations/<int:location_id>', methods=['GET'])
@@ -40,20 +66,21 @@ def get_all_locations():
 def get_location(location_id):
     check_admin_role()
     location = Location.query.get_or_404(location_id)
+    team_lead = User.query.filter_by(role='team_lead', location_id=location.id).order_by(User.id).first()
     return jsonify({
         'id': location.id,
         'code': location.code,
         'name': location.name,
         'type': location.type,
         'parent_id': location.parent_id,
-        'team_lead': location.team_lead.name if location.team_lead else None
+        'team_lead': team_lead.name if team_lead else None
     })
 
 # 3. Créer une nouvelle localisation
 @api_bp.route('/locations', methods=['POST'])
 @login_required
 def create_location():
-    check_admin_role()
+    check_location_write()
     data = request.form if request.form else request.get_json()
     if not data or 'code' not in data or 'name' not in data or 'type' not in data:
         return jsonify({'error': 'Code, name, and type are required'}), 400
@@ -62,11 +89,12 @@ def create_location():
         code=data['code'],
         name=data['name'],
         type=data['type'],
-        parent_id=data.get('parent_id'),
-        created_at=datetime.utcnow()
+        parent_id=data.get('parent_id')
     )
     try:
         db.session.add(new_location)
+        if new_location.type == 'REG':
+            provision_group_conversations([new_location])
         db.session.commit()
         return jsonify({'id': new_location.id, 'message': 'Location created successfully'}), 201
     except Exception as e:
@@ -77,7 +105,7 @@ def create_location():
 @api_bp.route('/locations/<int:location_id>', methods=['PUT'])
 @login_required
 def update_location(location_id):
-    check_admin_role()
+    check_location_write()
     location = Location.query.get_or_404(location_id)
     data = request.form if request.form else request.get_json()
     
@@ -87,6 +115,9 @@ def update_location(location_id):
     location.parent_id = data.get('parent', location.parent_id) or None
     
     try:
+        if location.type == 'REG':
+            provision_group_conversations([location])
+        sync_location_memberships([location.id])
         db.session.commit()
         return jsonify({'message': 'Location updated successfully'}), 200
     except Exception as e:
@@ -97,9 +128,9 @@ def update_location(location_id):
 @api_bp.route('/locations/<int:location_id>', methods=['DELETE'])
 @login_required
 def delete_location(location_id):
-    check_admin_role()
+    check_location_write()
     location = Location.query.get_or_404(location_id)
-    if location.children.count() > 0:
+    if location.children:
         return jsonify({'error': 'Cannot delete location with children'}), 400
     if User.query.filter_by(location_id=location_id).count() > 0:
         return jsonify({'error': 'Cannot delete location with assigned users'}), 400
@@ -120,4 +151,15 @@ def get_locations_list():
     return jsonify([
         {'id': loc.id, 'code': loc.code, 'name': loc.name, 'type': loc.type}
         for loc in locations
-    ])
\ No newline at end of file
+    ])
+# 7. Métriques du pool de connexions (attente, saturation), base principale et réplique
+@api_bp.route('/metrics/db-pool', methods=['GET'])
+@login_required
+def db_pool_metrics():
+    if current_user.role != 'data_viewer':
+        abort(403)
+    replica_engine = current_app.extensions['read_replica']['engine']
+    return jsonify({
+        'primary': pool_status(db.engine),
+        'replica': pool_status(replica_engine) if replica_engine is not None else None
+    })
@@ -4,6 +4,7 @@ from flask_login import login_user, logout_user, login_required, current_user
 from app.models import User
 from app.forms import RegistrationForm, LoginForm
 from app import db
+from app.utils.conversations import sync_user_memberships
 from werkzeug.security import generate_password_hash, check_password_hash
 
 auth_bp = Blueprint('auth', __name__)
@@ -31,6 +32,7 @@ def register():
                 location_id=location_id  # Utiliser location_id corrigé
             )
             db.session.add(user)
+            sync_user_memberships(user)
             db.session.commit()
         flash('Inscription réussie ! Veuillez vous connecter.', 'success')
         return redirect(url_for('auth.login'))
@@ -3,10 +3,12 @@ from flask_login import login_required, current_user
 from wtforms import ValidationError
 from app import db
 from app.forms import DataEntryForm, ChangeLocationForm, PromotionRequestForm
-from app.models import DataEntry, Location, Notification, User, ChangeRequest, PromotionRequest
+from app.models import DataEntry, Location, User, ChangeRequest, PromotionRequest
 from datetime import datetime
 import logging
 from sqlalchemy.orm import joinedload
+from app.utils.notifications import notification_row, notify
+from app.utils.performance import refresh_location_performance
 
 # Création du blueprint pour les routes du rôle data_entry
 data_bp = Blueprint('data', __name__, url_prefix='/data')
@@ -32,11 +34,6 @@ def dashboard():
     current_app.logger.debug(f"Utilisateur {current_user.name} accède à data.dashboard")
     check_data_entry_role()
     
-    # Compter les notifications non lues pour la messagerie
-    unread_notifications = Notification.query.filter_by(user_id=current_user.id, read=False).filter(
-        Notification.message_id.isnot(None)  # Notifications liées à des messages
-    ).count()
-    
     with current_app.app_context():
         # Charger les entrées récentes de l'utilisateur
         entries = DataEntry.query.filter_by(user_id=current_user.id).order_by(DataEntry.date.desc()).limit(10).all()
@@ -105,8 +102,7 @@ def dashboard():
                           parent_region=current_user.location.parent if current_user.location else None,
                           pending_change=pending_change or initiated_change,
                           change_request_status=change_request_status,
-                          pending_promotion=pending_promotion,
-                          unread_notifications=unread_notifications)
+                          pending_promotion=pending_promotion)
 
 # Route : Faire une demande de changement de localisation
 @data_bp.route('/change_location', methods=['GET', 'POST'])
@@ -220,12 +216,7 @@ def change_location():
                     message = (f"Nouvelle demande d'échange de localisation avec {current_user.name} pour le district {target_district.name}."
                               if is_exchange else
                               f"Nouvelle demande de changement de localisation de {current_user.name} pour le district {target_district.name}.")
-                    notification = Notification(
-                        user_id=recipient.id,
-                        message=message,
-                        created_at=datetime.utcnow()
-                    )
-                    db.session.add(notification)
+                    notify([notification_row(recipient.id, message)])
                 db.session.commit()
 
                 flash(f"Demande de {'échange' if is_exchange else 'changement'} de localisation pour {target_district.name} envoyée avec succès.", 'success')
@@ -274,19 +265,16 @@ def respond_request(request_id):
             
             # Notifications
             message_prefix = "d'échange" if request_entry.exchange_with_user_id else "de transfert"
-            notifications = [
-                Notification(
-                    user_id=team_lead.id,
-                    message=f"Nouvelle demande {message_prefix} pour {district_name} de {request_entry.requester.name}",
-                    created_at=datetime.utcnow()
+            notify([
+                notification_row(
+                    team_lead.id,
+                    f"Nouvelle demande {message_prefix} pour {district_name} de {request_entry.requester.name}"
                 ),
-                Notification(
-                    user_id=request_entry.requester_id,
-                    message=f"Votre demande {message_prefix} pour {district_name} est en attente du Team Lead",
-                    created_at=datetime.utcnow()
+                notification_row(
+                    request_entry.requester_id,
+                    f"Votre demande {message_prefix} pour {district_name} est en attente du Team Lead"
                 )
-            ]
-            db.session.add_all(notifications)
+            ])
             flash("Demande transmise au Team Lead", 'success')
 
         elif action == 'reject':
@@ -300,11 +288,10 @@ def respond_request(request_id):
             request_entry.data_entry_responded_at = datetime.utcnow()
             request_entry.completed_at = datetime.utcnow()
             
-            db.session.add(Notification(
-                user_id=request_entry.requester_id,
-                message=f"Votre demande pour {district_name} a été rejetée. Raison: {reason}",
-                created_at=datetime.utcnow()
-            ))
+            notify([notification_row(
+                request_entry.requester_id,
+                f"Votre demande pour {district_name} a été rejetée. Raison: {reason}"
+            )])
             flash("Demande rejetée", 'info')
 
         db.session.commit()
@@ -389,6 +376,7 @@ def new_entry():
             try:
                 db.session.add(entry)
                 db.session.commit()
+                refresh_location_performance(entry.location_id)
                 flash('Données enregistrées avec succès !', 'success')
                 current_app.logger.debug("Entrée enregistrée, redirection vers data.dashboard")
                 return redirect(url_for('data.dashboard'))
@@ -429,6 +417,7 @@ def edit_entry(entry_id):
         
         with current_app.app_context():
             # Mettre à jour l'entrée
+            previous_location_id = entry.location_id
             entry.members = form.members.data
             entry.children = form.children.data
             entry.men = form.men.data
@@ -439,6 +428,7 @@ def edit_entry(entry_id):
             
             try:
                 db.session.commit()
+                refresh_location_performance(previous_location_id, entry.location_id)
                 flash('Entrée mise à jour avec succès !', 'success')
                 current_app.logger.debug("Entrée mise à jour, redirection vers data.dashboard")
                 return redirect(url_for('data.dashboard'))
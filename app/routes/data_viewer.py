@@ -1,12 +1,15 @@
-from flask import Blueprint, jsonify, render_template, request, redirect, url_for, flash, abort, send_file, current_app, Response
+from flask import Blueprint, jsonify, render_template, request, redirect, url_for, flash, abort, current_app
 from flask_login import login_required, current_user
 from app.models import ChangeRequest, User, Location, DataEntry, TeamReport
 from app.forms import LocationForm
 from app import db
 from datetime import datetime, timedelta
-import io
-import csv
-from app.utils.performance import calculate_regional_performance
+from app.utils.locations import get_district_ids, get_districts, get_region_location_ids
+from app.utils.performance import get_regional_performance
+from app.utils.conversations import provision_group_conversations
+from app.utils.exports import stream_csv, stream_rows
+from app.utils.replica import read_replica
+from app.utils.reporting import get_users_activity, user_activity_statement
 from sqlalchemy.orm import joinedload
 
 data_viewer_bp = Blueprint('data_viewer', __name__)
@@ -34,6 +37,7 @@ def create_region():
                 parent_id=None
             )
             db.session.add(new_region)
+            provision_group_conversations([new_region])
             db.session.commit()
             flash(f"Région {new_region.name} créée avec succès !", 'success')
         return redirect(url_for('main.dashboard'))
@@ -47,7 +51,7 @@ def team_details(region_id):
         with current_app.app_context():
             region = Location.query.get_or_404(region_id)
             team_lead = User.query.filter_by(role='team_lead', location_id=region.id).first()
-            districts = Location.query.filter_by(parent_id=region.id, type='DIS').all()
+            districts = get_districts(region.id)
             # Charger les data_entry pour chaque district
             district_data_entries = {}
             for district in districts:
@@ -58,7 +62,7 @@ def team_details(region_id):
                 joinedload(TeamReport.member)
             ).all()
             # Calculer la performance de la région
-            performance = calculate_regional_performance(region.id)
+            performance = get_regional_performance(region.id)
             # Charger les change_requests liés à la région (validés ou rejetés) avec les relations
             change_requests = ChangeRequest.query.join(Location, ChangeRequest.target_district_id == Location.id).filter(
                 Location.parent_id == region.id,
@@ -91,7 +95,7 @@ def weekly_data(region_id):
             region = Location.query.get_or_404(region_id)
             start_date = datetime.now() - timedelta(days=30)
             entries = DataEntry.query.join(Location).filter(
-                Location.id.in_([loc.id for loc in region.children] + [region.id]),
+                Location.id.in_(get_region_location_ids(region.id)),
                 DataEntry.date >= start_date
             ).all()
         weekly_data = []
@@ -111,38 +115,28 @@ def weekly_data(region_id):
 
 @data_viewer_bp.route('/export-weekly-data/<int:region_id>')
 @login_required
+@read_replica
 def export_weekly_data(region_id):
     check_data_viewer_role()
     try:
-        with current_app.app_context():
-            region = Location.query.get_or_404(region_id)
-            start_date = datetime.now() - timedelta(days=30)
-            entries = DataEntry.query.join(Location).filter(
-                Location.id.in_([loc.id for loc in region.children] + [region.id]),
-                DataEntry.date >= start_date
-            ).all()
-        weekly_data = []
-        for i in range(4):
-            week_start = start_date + timedelta(days=7 * i)
-            week_end = week_start + timedelta(days=7)
-            week_entries = [e for e in entries if week_start <= e.date < week_end]
-            weekly_data.append({
-                'week': f"Semaine {i + 1}",
-                'entries': len(week_entries),
-                'users': ', '.join([e.user.name for e in week_entries]) if week_entries else 'Aucun'
-            })
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['Semaine', "Nombre d'entrées", 'Utilisateurs'])
-        for data in weekly_data:
-            writer.writerow([data['week'], data['entries'], data['users']])
-        output.seek(0)
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8-sig')),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'weekly_data_region_{region.name}.csv'
+        region = Location.query.get_or_404(region_id)
+        location_ids = get_region_location_ids(region.id)
+        start_date = datetime.now() - timedelta(days=30)
+        weekly_data = [{'week': f"Semaine {i + 1}", 'entries': 0, 'users': []} for i in range(4)]
+        statement = db.select(DataEntry.date, User.name).outerjoin(User, DataEntry.user_id == User.id).where(
+            DataEntry.location_id.in_(location_ids),
+            DataEntry.date >= start_date
         )
+        for entry_date, user_name in stream_rows(statement):
+            week_index = (entry_date - start_date) // timedelta(days=7)
+            if 0 <= week_index < len(weekly_data):
+                weekly_data[week_index]['entries'] += 1
+                weekly_data[week_index]['users'].append(user_name or 'N/A')
+        rows = (
+            [data['week'], data['entries'], ', '.join(data['users']) if data['users'] else 'Aucun']
+            for data in weekly_data
+        )
+        return stream_csv(['Semaine', "Nombre d'entrées", 'Utilisateurs'], rows, f'weekly_data_region_{region.name}.csv')
     except Exception as e:
         current_app.logger.error(f"Erreur dans export_weekly_data : {str(e)}", exc_info=True)
         flash("Erreur lors de l'exportation des données.", 'danger')
@@ -150,44 +144,32 @@ def export_weekly_data(region_id):
 
 @data_viewer_bp.route('/export-monthly-data')
 @login_required
+@read_replica
 def export_monthly_data():
     check_data_viewer_role()
     try:
         region_id = request.args.get('region_id', 'all')
         role = request.args.get('role', 'all')
-        with current_app.app_context():
-            regions = Location.query.filter_by(type='REG').all()
-            start_date = datetime.now() - timedelta(days=365)
-            if region_id == 'all':
-                entries = DataEntry.query.filter(DataEntry.date >= start_date).all()
-            else:
-                region = Location.query.get_or_404(region_id)
-                entries = DataEntry.query.join(Location).filter(
-                    Location.id.in_([loc.id for loc in region.children] + [region.id]),
-                    DataEntry.date >= start_date
-                ).all()
+        start_date = datetime.now() - timedelta(days=365)
+        statement = db.select(DataEntry.date, DataEntry.members).where(DataEntry.date >= start_date)
+        if region_id != 'all':
+            region = Location.query.get_or_404(region_id)
+            statement = statement.where(DataEntry.location_id.in_(get_region_location_ids(region.id)))
         if role != 'all':
-            entries = [e for e in entries if e.user.role == role]
+            statement = statement.join(User, DataEntry.user_id == User.id).where(User.role == role)
         monthly_data = {}
         for i in range(12):
             month_date = (datetime.now() - timedelta(days=30 * i)).replace(day=1)
             month_key = month_date.strftime('%b %Y')
             monthly_data[month_key] = 0
-        for entry in entries:
-            month_key = entry.date.strftime('%b %Y')
+        for entry_date, members in stream_rows(statement):
+            month_key = entry_date.strftime('%b %Y')
             if month_key in monthly_data:
-                monthly_data[month_key] += entry.members
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['Mois', 'Nombre de membres'])
-        for month, members in monthly_data.items():
-            writer.writerow([month, members])
-        output.seek(0)
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8-sig')),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'monthly_data_region_{region_id}_role_{role}.csv'
+                monthly_data[month_key] += members
+        return stream_csv(
+            ['Mois', 'Nombre de membres'],
+            ([month, members] for month, members in monthly_data.items()),
+            f'monthly_data_region_{region_id}_role_{role}.csv'
         )
     except Exception as e:
         current_app.logger.error(f"Erreur dans export_monthly_data : {str(e)}", exc_info=True)
@@ -196,28 +178,23 @@ def export_monthly_data():
 
 @data_viewer_bp.route('/export-user-data')
 @login_required
+@read_replica
 def export_user_data():
     check_data_viewer_role()
     try:
-        with current_app.app_context():
-            users = User.query.all()
-            output = io.StringIO()
-            writer = csv.writer(output)
-            writer.writerow(['Nom', 'Rôle', 'District', 'Région', 'Entrées', 'Rapport'])
-            for user in users:
-                district = user.location.name if user.location and user.location.type == 'DIS' else 'N/A'
-                region = user.location.parent.name if user.location and user.location.parent else (user.location.name if user.location else 'N/A')
-                total_entries = DataEntry.query.filter_by(user_id=user.id).count()
-                report = DataEntry.query.filter_by(user_id=user.id).order_by(DataEntry.date.desc()).first()
-                report_text = report.commentaire[:20] if report and report.commentaire else 'Aucun'
-                writer.writerow([user.name, user.role, district, region, total_entries, report_text])
-        output.seek(0)
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8-sig')),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name='user_data.csv'
+        # Une seule requête agrégée pour tous les utilisateurs, lue en flux
+        rows = (
+            [
+                data['user']['name'],
+                data['user']['role'],
+                data['district']['name'] if data['district'] else 'N/A',
+                data['region']['name'] if data['region'] else 'N/A',
+                data['total_entries'],
+                data['last_comment']
+            ]
+            for data in get_users_activity(stream_rows(user_activity_statement()))
         )
+        return stream_csv(['Nom', 'Rôle', 'District', 'Région', 'Entrées', 'Rapport'], rows, 'user_data.csv')
     except Exception as e:
         current_app.logger.error(f"Erreur dans export_user_data : {str(e)}", exc_info=True)
         flash("Erreur lors de l'exportation des données.", 'danger')
@@ -233,7 +210,7 @@ def region_entries(region_id):
             if region.type != 'REG':
                 flash("L'identifiant spécifié ne correspond pas à une région.", 'danger')
                 return redirect(url_for('main.dashboard'))
-            district_ids = [loc.id for loc in Location.query.filter_by(parent_id=region.id, type='DIS').all()]
+            district_ids = get_district_ids(region.id)
             
             # Définir une plage de dates par défaut (30 derniers jours)
             interval_end = datetime.now()
@@ -291,47 +268,46 @@ def region_reports(region_id):
 
 @data_viewer_bp.route('/export_region_entries/<int:region_id>', endpoint='export_region_entries_endpoint')
 @login_required
+@read_replica
 def export_region_entries(region_id):
     check_data_viewer_role()
     try:
-        with current_app.app_context():
-            region = Location.query.get_or_404(region_id)
-            if region.type != 'REG':
-                flash("L'identifiant spécifié ne correspond pas à une région.", 'danger')
-                return redirect(url_for('main.dashboard'))
-            district_ids = [loc.id for loc in Location.query.filter_by(parent_id=region.id, type='DIS').all()]
-            entries = DataEntry.query.options(
-                joinedload(DataEntry.user),
-                joinedload(DataEntry.location)
-            ).filter(
-                DataEntry.location_id.in_(district_ids + [region.id])
-            ).order_by(DataEntry.date.desc()).all()
-            if not entries:
-                flash("Aucune entrée à exporter pour cette région.", 'warning')
-                return redirect(url_for('main.dashboard'))
-            
-            # Préparer les données pour l'export CSV
-            output = io.StringIO()
-            writer = csv.writer(output)
-            writer.writerow(['Date', 'Membres', 'Femmes', 'Hommes', 'Enfants', 'Tithe', 'Commentaire', 'Utilisateur', 'Localisation'])
-            for entry in entries:
-                writer.writerow([
-                    entry.date.strftime('%Y-%m-%d'),
-                    entry.members,
-                    entry.women,
-                    entry.men,
-                    entry.children,
-                    entry.tite,
-                    entry.commentaire,
-                    entry.user.name if entry.user else 'N/A',
-                    entry.location.name if entry.location else 'N/A'
-                ])
-            output.seek(0)
-            return Response(
-                output.getvalue(),
-                mimetype='text/csv',
-                headers={"Content-Disposition": f"attachment;filename=region_entries_{region_id}.csv"}
-            )
+        region = Location.query.get_or_404(region_id)
+        if region.type != 'REG':
+            flash("L'identifiant spécifié ne correspond pas à une région.", 'danger')
+            return redirect(url_for('main.dashboard'))
+        district_ids = get_district_ids(region.id)
+        location_filter = DataEntry.location_id.in_(district_ids + [region.id])
+        if not db.session.query(DataEntry.query.filter(location_filter).exists()).scalar():
+            flash("Aucune entrée à exporter pour cette région.", 'warning')
+            return redirect(url_for('main.dashboard'))
+
+        # Seules les colonnes exportées sont lues, en flux depuis le curseur serveur
+        statement = db.select(
+            DataEntry.date, DataEntry.members, DataEntry.women, DataEntry.men, DataEntry.children,
+            DataEntry.tite, DataEntry.commentaire, User.name, Location.name
+        ).outerjoin(User, DataEntry.user_id == User.id).outerjoin(
+            Location, DataEntry.location_id == Location.id
+        ).where(location_filter).order_by(DataEntry.date.desc())
+        rows = (
+            [
+                entry_date.strftime('%Y-%m-%d'),
+                members,
+                women,
+                men,
+                children,
+                tite,
+                commentaire,
+                user_name or 'N/A',
+                location_name or 'N/A'
+            ]
+            for entry_date, members, women, men, children, tite, commentaire, user_name, location_name in stream_rows(statement)
+        )
+        return stream_csv(
+            ['Date', 'Membres', 'Femmes', 'Hommes', 'Enfants', 'Tithe', 'Commentaire', 'Utilisateur', 'Localisation'],
+            rows,
+            f'region_entries_{region_id}.csv'
+        )
     except Exception as e:
         current_app.logger.error(f"Erreur dans export_region_entries : {str(e)}", exc_info=True)
         flash("Une erreur est survenue lors de l'exportation des données.", 'danger')
@@ -1,13 +1,17 @@
 from flask import Blueprint, abort, render_template, request, flash, redirect, url_for, current_app
 from flask_login import current_user, login_required
-from app.models import DataEntry, Location, Notification, User, ChangeRequest, PromotionRequest
+from app.models import DataEntry, Location, User, ChangeRequest, PromotionRequest
 from app.forms import DataEntryForm
 from app import db
 from datetime import date, datetime, timedelta
 from sqlalchemy.orm import joinedload
 from sqlalchemy.exc import SQLAlchemyError
 
-from app.utils.performance import calculate_regional_performance
+from app.utils.conversations import provision_group_conversations, sync_location_memberships, sync_user_memberships
+from app.utils.locations import get_district_ids, get_districts, get_regions
+from app.utils.performance import get_regions_performance
+from app.utils.replica import read_replica
+from app.utils.reporting import get_users_activity
 
 main_bp = Blueprint('main', __name__)
 
@@ -29,13 +33,9 @@ def home():
 
 @main_bp.route('/dashboard')
 @login_required
+@read_replica
 def dashboard():
     try:
-        # Compter les notifications non lues pour la messagerie
-        unread_notifications = Notification.query.filter_by(user_id=current_user.id, read=False).filter(
-            Notification.message_id.isnot(None)  # Notifications liées à des messages
-        ).count()
-
         if current_user.role == 'data_entry':
             return redirect(url_for('data.dashboard'))
         elif current_user.role == 'team_lead':
@@ -49,11 +49,10 @@ def dashboard():
                         pending_requests=[],
                         form=None,
                         district_entries=[],
-                        district_entries_data=[],
-                        unread_notifications=unread_notifications
+                        district_entries_data=[]
                     )
 
-                districts = Location.query.filter_by(parent_id=current_user.location_id, type='DIS').all()
+                districts = get_districts(current_user.location_id)
                 district_ids = [d.id for d in districts]
 
                 team_members_count = User.query.filter(
@@ -128,18 +127,25 @@ def dashboard():
                 pending_requests=valid_pending_requests,
                 form=form,
                 district_entries=district_entries,
-                district_entries_data=district_entries_data,
-                unread_notifications=unread_notifications
+                district_entries_data=district_entries_data
             )
         elif current_user.role == 'data_viewer':
             with current_app.app_context():
                 # Vérifier si l'utilisateur a une localisation valide
                 # Charger les régions
-                regions = Location.query.filter_by(type='REG').all()
+                regions = get_regions()
+                # Performance de toutes les régions (instantanés, recalcul groupé si périmés)
+                performances = get_regions_performance([region.id for region in regions])
+                team_leads = {}
+                for team_lead in User.query.filter(
+                    User.role == 'team_lead',
+                    User.location_id.in_([region.id for region in regions])
+                ).order_by(User.id).all():
+                    team_leads.setdefault(team_lead.location_id, team_lead)
                 regions_data = []
                 for region in regions:
-                    team_lead = User.query.filter_by(role='team_lead', location_id=region.id).first()
-                    performance = calculate_regional_performance(region.id)
+                    team_lead = team_leads.get(region.id)
+                    performance = performances[region.id]
                     regions_data.append({
                         'region': {
                             'id': region.id,
@@ -153,27 +159,8 @@ def dashboard():
                         'performance': performance
                     })
                 
-                # Charger les utilisateurs
-                users_data = []
-                users = User.query.all()
-                for user in users:
-                    total_entries = DataEntry.query.filter_by(user_id=user.id).count()
-                    last_entry = DataEntry.query.filter_by(user_id=user.id).order_by(DataEntry.date.desc()).first()
-                    # Charger la localisation de l'utilisateur
-                    location = Location.query.get(user.location_id) if user.location_id else None
-                    district = location if location and location.type == 'DIS' else None
-                    region = location.parent if district else (location if location and location.type == 'REG' else None)
-                    users_data.append({
-                        'user': {
-                            'id': user.id,
-                            'name': user.name,
-                            'role': user.role
-                        },
-                        'district': district,
-                        'region': region,
-                        'total_entries': total_entries,
-                        'last_comment': last_entry.commentaire[:20] if last_entry and last_entry.commentaire else 'Aucun'
-                    })
+                # Charger les utilisateurs (entrées, dernier commentaire et localisation en une requête)
+                users_data = list(get_users_activity())
                 
                 # Charger les données pour les graphiques (donut et barres)
                 start_date = datetime.now() - timedelta(days=365)
@@ -181,7 +168,7 @@ def dashboard():
                 bar_data = {}    # { region_id: { role: { total_districts: X, districts_with_entries: Y, percentage: Z } } }
 
                 for region in regions:
-                    district_ids = [loc.id for loc in Location.query.filter_by(parent_id=region.id, type='DIS').all()]
+                    district_ids = get_district_ids(region.id)
                     all_location_ids = district_ids + [region.id]
                     
                     # Charger les entrées pour la région (12 derniers mois)
@@ -241,8 +228,7 @@ def dashboard():
                 donut_data=donut_data,
                 bar_data=bar_data,
                 pending_change_requests=pending_change_requests,
-                pending_promotion_requests=pending_promotion_requests,
-                unread_notifications=unread_notifications
+                pending_promotion_requests=pending_promotion_requests
             )
         return abort(403)
 
@@ -288,7 +274,7 @@ def promote_data_entry():
         abort(403)
     try:
         with current_app.app_context():
-            regions = Location.query.filter_by(type='REG').all()
+            regions = get_regions()
         if request.method == 'POST':
             region_id = request.form.get('region_id')
             data_entry_id = request.form.get('data_entry_id')
@@ -301,6 +287,7 @@ def promote_data_entry():
                     return redirect(url_for('main.promote_data_entry'))
                 data_entry.role = 'team_lead'
                 data_entry.location_id = region.id
+                sync_user_memberships(data_entry)
                 db.session.commit()
                 flash(f"{data_entry.name} promu Team Lead pour {region.name}.", 'success')
             return redirect(url_for('main.dashboard'))
@@ -317,7 +304,7 @@ def promote_district():
         abort(403)
     try:
         with current_app.app_context():
-            regions = Location.query.filter_by(type='REG').all()
+            regions = get_regions()
             districts = Location.query.filter_by(type='DIS').all()
         if request.method == 'POST':
             region_id = request.form.get('region_id')
@@ -333,6 +320,8 @@ def promote_district():
                 for dist_id in assigned_districts:
                     dist = Location.query.get(dist_id)
                     dist.parent_id = new_region.id
+                provision_group_conversations([new_region])
+                sync_location_memberships([new_region.id] + [int(dist_id) for dist_id in assigned_districts])
                 db.session.commit()
                 flash("Région créée et districts assignés.", 'success')
             return redirect(url_for('main.dashboard'))
@@ -373,7 +362,7 @@ def validate_requests():
                         user.location_id = req.target_district_id
                         req.status = 'accepted'
                         req.responded_at = datetime.utcnow()
-                        db.session.flush()
+                        sync_user_memberships(user)
                         current_app.logger.info(f"Changement de localisation pour {user.name} (ID: {user.id}) : de location_id {old_location_id} à {user.location_id}")
                         flash(f"Changement de localisation validé pour {user.name}.", 'success')
                     elif action == 'reject':
@@ -389,7 +378,7 @@ def validate_requests():
                         user.location_id = req.requested_region_id
                         req.status = 'accepted'
                         req.responded_at = datetime.utcnow()
-                        db.session.flush()
+                        sync_user_memberships(user)
                         current_app.logger.info(f"Promotion de {user.name} (ID: {user.id}) en Team Lead, changement de localisation : de location_id {old_location_id} à {user.location_id}")
                         flash(f"Promotion validée pour {user.name} en Team Lead.", 'success')
                     elif action == 'reject':
@@ -1,196 +1,44 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, abort, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, abort, current_app, jsonify, session, send_file
 from flask_login import login_required, current_user
 from flask_socketio import SocketIO, join_room, leave_room
 from app import db, socketio
-from app.models import User, Location, Conversation, Message, Notification
+from app.models import Conversation, Message, Upload
+from app.tasks import generate_attachment_previews
 from datetime import datetime, UTC
+import mimetypes
 from werkzeug.utils import secure_filename
-import os
+from app.utils.conversations import (
+    MESSAGE_PAGE_SIZE, advance_read_marker, conversation_room, decode_cursor, get_message_page,
+    get_other_participant, is_participant, mark_conversation_read, participant_ids, push_unread_counts,
+    push_unread_increment, sender_label, user_room
+)
+from app.utils.inbox import get_inbox
+from app.utils.notifications import notification_row, notify
+from app.utils.replica import read_replica
+from app.utils.storage import attachment_url, get_storage
+from app.utils.typing_indicator import stop_all_typing
+from app.utils.uploads import (
+    UploadError, attachment_type_for, create_upload, get_completed_upload, received_bytes,
+    write_chunk
+)
+from werkzeug.http import parse_content_range_header
 
 messages_bp = Blueprint('messages', __name__)
 
-def get_team_lead_for_region(region_id):
-    """Récupère le team_lead d'une région donnée."""
-    return User.query.filter_by(role='team_lead', location_id=region_id).first()
-
 def can_access_conversation(user, conversation):
-    """Vérifie si l'utilisateur peut accéder à la conversation."""
-    if conversation.type == 'private':
-        messages = Message.query.filter_by(conversation_id=conversation.id).all()
-        if not messages:
-            return False
-        
-        participants = set()
-        senders = {msg.sender_id for msg in messages}
-        
-        for sender_id in senders:
-            sender = User.query.get(sender_id)
-            if not sender:
-                continue
-                
-            participants.add(sender.id)
-            
-            if sender.role == 'data_entry':
-                district = sender.location
-                if district and district.type == 'DIS':
-                    region = district.parent
-                    if region:
-                        team_lead = get_team_lead_for_region(region.id)
-                        if team_lead:
-                            participants.add(team_lead.id)
-            
-            elif sender.role == 'team_lead':
-                region = sender.location
-                if region and region.type == 'REG':
-                    districts = Location.query.filter_by(parent_id=region.id, type='DIS').all()
-                    data_entries = User.query.filter(
-                        User.location_id.in_([d.id for d in districts]),
-                        User.role == 'data_entry'
-                    ).all()
-                    for data_entry in data_entries:
-                        participants.add(data_entry.id)
-                
-                data_viewers = User.query.filter_by(role='data_viewer').all()
-                for dv in data_viewers:
-                    participants.add(dv.id)
-            
-            elif sender.role == 'data_viewer':
-                team_leads = User.query.filter_by(role='team_lead').all()
-                for tl in team_leads:
-                    participants.add(tl.id)
-        
-        return user.id in participants
-
-    elif conversation.type == 'group':
-        if conversation.title == 'Groupe Global des Team Leads':
-            return user.role in ['team_lead', 'data_viewer']
-        else:
-            region = conversation.location
-            if not region or region.type != 'REG':
-                return False
-            if user.role == 'data_viewer':
-                return True
-            if user.role == 'team_lead' and user.location_id == region.id:
-                return True
-            if user.role == 'data_entry':
-                user_district = user.location
-                if user_district and user_district.type == 'DIS':
-                    user_region = user_district.parent
-                    return user_region and user_region.id == region.id
-    return False
-
-def get_user_conversations(user):
-    """Récupère et initialise les conversations accessibles pour l'utilisateur."""
-    conversations = []
-
-    if user.role == 'data_entry':
-        district = user.location
-        if district and district.type == 'DIS':
-            region = district.parent
-            if region:
-                team_lead = get_team_lead_for_region(region.id)
-                if team_lead:
-                    conversation = get_or_create_private_conversation(user, team_lead)
-                    if conversation:
-                        conversations.append(conversation)
-
-    elif user.role == 'team_lead':
-        region = user.location
-        if region and region.type == 'REG':
-            for data_entry in get_region_data_entries(region.id):
-                conversation = get_or_create_private_conversation(user, data_entry)
-                if conversation:
-                    conversations.append(conversation)
-
-            for data_viewer in User.query.filter_by(role='data_viewer').all():
-                conversation = get_or_create_private_conversation(user, data_viewer)
-                if conversation:
-                    conversations.append(conversation)
-
-    elif user.role == 'data_viewer':
-        for team_lead in User.query.filter_by(role='team_lead').all():
-            conversation = get_or_create_private_conversation(user, team_lead)
-            if conversation:
-                conversations.append(conversation)
-
-    for region in Location.query.filter_by(type='REG').all():
-        conversation = get_or_create_group_conversation(region)
-        if can_access_conversation(user, conversation):
-            conversations.append(conversation)
-
-    global_group = get_or_create_global_team_lead_group()
-    if can_access_conversation(user, global_group):
-        conversations.append(global_group)
-
-    return conversations
-
-def get_or_create_private_conversation(user1, user2):
-    """Trouve ou crée une conversation privée entre deux utilisateurs."""
-    conversation = Conversation.query.filter_by(type='private').join(Message).filter(
-        (Message.sender_id == user1.id) | (Message.sender_id == user2.id)
-    ).group_by(Conversation.id).having(db.func.count(Message.id) > 0).first()
-
-    if not conversation:
-        conversation = Conversation(type='private')
-        db.session.add(conversation)
-        db.session.flush()
-        initial_message = Message(
-            conversation_id=conversation.id,
-            sender_id=user1.id,
-            content="Conversation initiée",
-            timestamp=datetime.now(UTC),
-            read=False
-        )
-        db.session.add(initial_message)
-        db.session.commit()
-    return conversation
-
-def get_or_create_group_conversation(region):
-    """Trouve ou crée une conversation de groupe pour une région."""
-    conversation = Conversation.query.filter_by(type='group', location_id=region.id).first()
-    if not conversation:
-        conversation = Conversation(type='group', location_id=region.id)
-        db.session.add(conversation)
-        db.session.commit()
-    return conversation
-
-def get_or_create_global_team_lead_group():
-    """Trouve ou crée le groupe global des team leads."""
-    conversation = Conversation.query.filter_by(type='group', title='Groupe Global des Team Leads').first()
-    if not conversation:
-        conversation = Conversation(type='group', title='Groupe Global des Team Leads')
-        db.session.add(conversation)
-        db.session.commit()
-    return conversation
-
-def get_region_data_entries(region_id):
-    """Récupère tous les data_entries d'une région."""
-    districts = Location.query.filter_by(parent_id=region_id, type='DIS').all()
-    return User.query.filter(User.location_id.in_([d.id for d in districts]), User.role == 'data_entry').all()
+    """Vérifie si l'utilisateur peut accéder à la conversation (table conversation_participants)."""
+    return is_participant(user.id, conversation.id)
 
 @messages_bp.route('/messages')
 @login_required
+@read_replica
 def index():
     """Affiche la liste des conversations avec dernières infos."""
-    conversations = get_user_conversations(current_user)
-    conversations_data = []
-    
-    for conversation in conversations:
-        last_message = Message.query.filter_by(conversation_id=conversation.id).order_by(Message.timestamp.desc()).first()
-        message_ids = [msg.id for msg in Message.query.filter_by(conversation_id=conversation.id).all()]
-        unread_count = Notification.query.filter(
-            Notification.user_id == current_user.id,
-            Notification.read == False,
-            Notification.message_id.in_(message_ids)
-        ).count()
-        
-        conversations_data.append({
-            'conversation': conversation,
-            'last_message': last_message,
-            'unread_count': unread_count
-        })
-    
-    return render_template('messages/index.html', conversations_data=conversations_data)
+    # Lecture seule : les conversations sont créées lors des changements de régions,
+    # de rôles et de localisations (provision_group_conversations, sync_user_memberships)
+    page = request.args.get('page', 1, type=int)
+    pagination, conversations_data = get_inbox(current_user, page=page)
+    return render_template('messages/index.html', conversations_data=conversations_data, pagination=pagination)
 
 @messages_bp.route('/conversation/<int:conversation_id>')
 @login_required
@@ -202,38 +50,66 @@ def conversation(conversation_id):
         flash("Accès non autorisé à cette conversation.", 'danger')
         return redirect(url_for('messages.index'))
 
-    # Marquer les messages comme lus
-    messages = Message.query.filter_by(conversation_id=conversation_id).all()
-    for message in messages:
-        if message.sender_id != current_user.id and not message.read:
-            message.read = True
-    db.session.commit()
+    # Seule la page la plus récente est chargée ; les plus anciennes via conversation_messages
+    messages, older_cursor = get_message_page(conversation.id)
 
-    # Marquer les notifications comme lues
-    message_ids = [msg.id for msg in messages]
-    Notification.query.filter(
-        Notification.user_id == current_user.id,
-        Notification.read == False,
-        Notification.message_id.in_(message_ids)
-    ).update({'read': True})
-    db.session.commit()
+    # Marquer les messages et notifications comme lus (mises à jour groupées)
+    mark_conversation_read(conversation.id, current_user.id)
 
-    other_user = None
-    if conversation.type == 'private':
-        first_message = messages[0] if messages else None
-        if first_message:
-            other_user = first_message.sender if first_message.sender.id != current_user.id else None
-            if not other_user and len(messages) > 1:
-                for msg in messages[1:]:
-                    if msg.sender.id != current_user.id:
-                        other_user = msg.sender
-                        break
+    other_user = get_other_participant(conversation.id, current_user.id) if conversation.type == 'private' else None
 
     return render_template('messages/conversation.html', 
                          conversation=conversation, 
                          messages=messages,
+                         older_cursor=older_cursor,
                          other_user=other_user)
 
+@messages_bp.route('/conversation/<int:conversation_id>/read', methods=['POST'])
+@login_required
+def mark_read(conversation_id):
+    """Marque comme lus les messages reçus jusqu'au message up_to (tous si absent)."""
+    conversation = Conversation.query.get_or_404(conversation_id)
+    if not can_access_conversation(current_user, conversation):
+        abort(403)
+    data = request.get_json(silent=True) or request.form
+    up_to = data.get('up_to')
+    if up_to is not None:
+        try:
+            up_to = int(up_to)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Identifiant de message invalide'}), 400
+    updated = mark_conversation_read(conversation.id, current_user.id, up_to=up_to)
+    return jsonify({'updated': updated})
+
+@messages_bp.route('/conversation/<int:conversation_id>/messages')
+@login_required
+def conversation_messages(conversation_id):
+    """Page de messages plus anciens (JSON), par curseur ?before=."""
+    conversation = Conversation.query.get_or_404(conversation_id)
+    if not can_access_conversation(current_user, conversation):
+        abort(403)
+    before = decode_cursor(request.args.get('before'))
+    if request.args.get('before') and before is None:
+        return jsonify({'error': 'Curseur invalide'}), 400
+    limit = min(request.args.get('limit', MESSAGE_PAGE_SIZE, type=int), MESSAGE_PAGE_SIZE)
+    messages, older_cursor = get_message_page(conversation.id, before=before, limit=max(limit, 1))
+    return jsonify({
+        'messages': [{
+            'id': message.id,
+            'content': message.content,
+            'sender': sender_label(message, conversation),
+            'sender_id': message.sender_id,
+            'timestamp': message.timestamp.strftime('%H:%M'),
+            'attachment_path': message.attachment_path,
+            'attachment_type': message.attachment_type,
+            'attachment_url': attachment_url(message.attachment_path),
+            'thumbnail_url': attachment_url(message.thumbnail_path),
+            'preview_url': attachment_url(message.preview_path),
+            'read': bool(message.read)
+        } for message in messages],
+        'next_cursor': older_cursor
+    })
+
 @messages_bp.route('/send', methods=['POST'])
 @login_required
 def send_message():
@@ -249,31 +125,145 @@ def send_message():
         flash("Accès non autorisé.", 'danger')
         return redirect(url_for('messages.index'))
 
-    if not content and not file:
+    if not content and not file and not request.form.get('upload_id'):
         flash("Message vide non autorisé.", 'danger')
         return redirect(url_for('messages.conversation', conversation_id=conversation.id))
 
-    attachment_path, attachment_type = handle_file_upload(file, conversation.id) if file else (None, None)
+    upload_id = request.form.get('upload_id')
+    if upload_id:
+        # Pièce jointe déjà transmise par morceaux (/uploads)
+        upload = get_completed_upload(upload_id, current_user.id, conversation.id)
+        if upload is None:
+            flash("Pièce jointe introuvable ou incomplète.", 'danger')
+            return redirect(url_for('messages.conversation', conversation_id=conversation.id))
+        attachment_path, attachment_type = upload.attachment_path, attachment_type_for(upload.filename)
+    else:
+        attachment_path, attachment_type = handle_file_upload(file, conversation.id) if file else (None, None)
     print(f"After handle_file_upload: attachment_path={attachment_path}, attachment_type={attachment_type}")  # Debug
 
     message = create_message(conversation, content, attachment_path, attachment_type)
-    create_notifications(conversation, message)
+    recipients = create_notifications(conversation, message)
 
     db.session.commit()
+    push_unread_increment(conversation.id, recipients)
+    if message.attachment_type in ('image', 'video'):
+        try:
+            generate_attachment_previews.delay(message.id)
+        except Exception as e:
+            # Le message est déjà enregistré : sans broker, l'aperçu sera rattrapé par
+            # la commande generate-previews
+            current_app.logger.error(f"Mise en file de l'aperçu du message {message.id} impossible : {e}", exc_info=True)
 
     # Emit SocketIO event for new message
     socketio.emit('new_message', {
+        'id': message.id,
         'content': message.content,
         'sender': current_user.name,
+        'sender_id': current_user.id,
         'timestamp': message.timestamp.strftime('%H:%M'),
         'attachment_path': message.attachment_path,
         'attachment_type': message.attachment_type,
+        'attachment_url': attachment_url(message.attachment_path),
+        'thumbnail_url': attachment_url(message.thumbnail_path),
+        'preview_url': attachment_url(message.preview_path),
         'conversation_id': str(conversation.id)
-    }, room=str(conversation_id))
+    }, room=conversation_room(conversation.id))
 
     flash("Message envoyé.", 'success')
     return redirect(url_for('messages.conversation', conversation_id=conversation.id))
 
+def upload_status(upload):
+    return {
+        'upload_id': upload.id,
+        'offset': received_bytes(upload),
+        'size': upload.size,
+        'chunk_size': current_app.config['UPLOAD_CHUNK_SIZE'],
+        'complete': upload.completed_at is not None
+    }
+
+def get_own_upload(upload_id):
+    upload = Upload.query.get_or_404(upload_id)
+    if upload.user_id != current_user.id:
+        abort(403)
+    return upload
+
+@messages_bp.route('/uploads', methods=['POST'])
+@login_required
+def start_upload():
+    """Ouvre un envoi par morceaux : {conversation_id, filename, size}."""
+    data = request.get_json(silent=True) or {}
+    conversation = Conversation.query.get_or_404(data.get('conversation_id'))
+    if not can_access_conversation(current_user, conversation):
+        abort(403)
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Taille de fichier invalide'}), 400
+    try:
+        upload = create_upload(current_user, conversation.id, secure_filename(data.get('filename') or ''), size)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    return jsonify(upload_status(upload)), 201
+
+@messages_bp.route('/uploads/<upload_id>')
+@login_required
+def upload_progress(upload_id):
+    """Position de reprise d'un envoi interrompu."""
+    return jsonify(upload_status(get_own_upload(upload_id)))
+
+@messages_bp.route('/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def upload_chunk(upload_id):
+    """
+    Reçoit un morceau (corps brut, en-tête Content-Range: bytes début-fin/total), écrit
+    directement sur disque. Le dernier morceau termine l'envoi.
+    """
+    upload = get_own_upload(upload_id)
+    content_range = parse_content_range_header(request.headers.get('Content-Range'))
+    if content_range is None or content_range.units != 'bytes' or content_range.length != upload.size:
+        return jsonify({'error': 'En-tête Content-Range invalide'}), 400
+    length = content_range.stop - content_range.start
+    if request.content_length != length:
+        return jsonify({'error': 'Longueur du morceau incohérente'}), 400
+    try:
+        write_chunk(upload, request.stream, content_range.start, length)
+    except UploadError as e:
+        return jsonify(dict(upload_status(upload), error=str(e))), e.status
+    return jsonify(dict(upload_status(upload), attachment_path=upload.attachment_path))
+
+@messages_bp.route('/attachments/<path:key>')
+@login_required
+def attachment(key):
+    """
+    Sert une pièce jointe du stockage adressé par contenu. Le contenu d'une clé ne change
+    jamais : ETag = nom de la clé et cache d'un an. send_file gère les requêtes Range
+    (lecture vidéo) et conditionnelles, et X-Sendfile avec USE_X_SENDFILE ; derrière nginx,
+    ATTACHMENT_ACCEL_REDIRECT délègue l'envoi au serveur web (X-Accel-Redirect).
+    """
+    storage = get_storage()
+    try:
+        if not storage.exists(key):
+            abort(404)
+    except ValueError:
+        abort(404)
+    etag = key.rsplit('/', 1)[-1]
+    accel_prefix = current_app.config.get('ATTACHMENT_ACCEL_REDIRECT')
+    if accel_prefix:
+        response = current_app.response_class(
+            mimetype=mimetypes.guess_type(key)[0] or 'application/octet-stream'
+        )
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{key}"
+        response.set_etag(etag)
+        response.make_conditional(request)
+    else:
+        response = send_file(storage.local_path(key), conditional=True, etag=etag)
+    # Réservé aux utilisateurs connectés : pas de cache partagé
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config['ATTACHMENT_CACHE_MAX_AGE']
+    response.cache_control.immutable = True
+    return response
+
 def allowed_file(filename):
     """Vérifie si le fichier a une extension autorisée."""
     return '.' in filename and \
@@ -285,22 +275,11 @@ def handle_file_upload(file, conversation_id):
         print(f"File received: {file.filename}, allowed_extensions={current_app.config['ALLOWED_EXTENSIONS']}")  # Debug
         if allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            timestamp = datetime.now(UTC).strftime('%Y%m%d_%H%M%S')
-            unique_filename = f"message_{conversation_id}_{timestamp}_{filename}"
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-            print(f"Saving file to {file_path}")  # Debug
             try:
-                file.save(file_path)
-                print(f"File saved: {os.path.exists(file_path)}")  # Debug
-                if not os.path.exists(file_path):
-                    print(f"Error: File not found after saving at {file_path}")  # Debug
-                    flash("Erreur : le fichier n'a pas pu être enregistré.", 'danger')
-                    return None, None
-                
-                ext = filename.rsplit('.', 1)[1].lower()
-                attachment_type = 'image' if ext in {'png', 'jpg', 'jpeg', 'gif'} else 'video' if ext == 'mp4' else 'file'
-                
-                return f"uploads/messages/{unique_filename}", attachment_type
+                # Stockage adressé par contenu : un fichier identique n'est conservé qu'une fois
+                key = get_storage().put_stream(file.stream, filename.rsplit('.', 1)[1])
+                current_app.logger.debug(f"Pièce jointe stockée : {key}")
+                return key, attachment_type_for(filename)
             except Exception as e:
                 print(f"Error saving file: {str(e)}")  # Debug
                 flash(f"Erreur lors de l'enregistrement du fichier : {str(e)}", 'danger')
@@ -330,55 +309,42 @@ def create_message(conversation, content, attachment_path, attachment_type):
     return message
 
 def create_notifications(conversation, message):
-    """Crée les notifications pour les participants."""
+    """
+    Crée les notifications des messages directs. Les messages de groupe n'écrivent rien
+    par destinataire : leurs non-lus sont calculés depuis le dernier message lu de chaque membre.
+    Retourne les destinataires, dont les compteurs de non-lus sont poussés après le commit.
+    """
+    advance_read_marker(conversation.id, current_user.id, message.id)
+    recipients = participant_ids(conversation.id)
+    recipients.discard(current_user.id)
     if conversation.type == 'private':
-        participants = {msg.sender_id for msg in Message.query.filter_by(conversation_id=conversation.id).all()}
-        participants.discard(current_user.id)
-        for user_id in participants:
-            db.session.add(Notification(
-                user_id=user_id,
-                message_id=message.id,
-                notification_message=f"Nouveau message de {current_user.name}",
-                created_at=datetime.now(UTC),
-                read=False
-            ))
-    else:
-        if conversation.title == 'Groupe Global des Team Leads':
-            users = User.query.filter(
-                User.role.in_(['team_lead', 'data_viewer']),
-                User.id != current_user.id
-            ).all()
-        else:
-            region = conversation.location
-            districts = Location.query.filter_by(parent_id=region.id, type='DIS').all()
-            users = User.query.filter(
-                (User.location_id == region.id) | 
-                (User.location_id.in_([d.id for d in districts])) | 
-                (User.role == 'data_viewer'),
-                User.id != current_user.id
-            ).all()
-
-        group_name = conversation.location.name if conversation.location else conversation.title
-        for user in users:
-            db.session.add(Notification(
-                user_id=user.id,
-                message_id=message.id,
-                notification_message=f"Nouveau message dans {group_name}",
-                created_at=datetime.now(UTC),
-                read=False
-            ))
+        notify(
+            notification_row(user_id, f"Nouveau message de {current_user.name}", message_id=message.id)
+            for user_id in sorted(recipients)
+        )
+    return recipients
 
 @socketio.on('connect')
 def handle_connect():
     if current_user.is_authenticated:
-        join_room(str(current_user.id))
+        join_room(user_room(current_user.id))
+        # Compteurs initiaux des badges ; ensuite mis à jour par incréments
+        push_unread_counts(current_user.id)
 
 @socketio.on('disconnect')
 def handle_disconnect():
     if current_user.is_authenticated:
-        leave_room(str(current_user.id))
+        leave_room(user_room(current_user.id))
+        stop_all_typing(current_user.id)
 
 @socketio.on('join')
 def handle_join(data):
-    conversation_id = data['conversation_id']
-    join_room(conversation_id)
\ No newline at end of file
+    """Rejoint le salon d'une conversation, réservé à ses membres."""
+    try:
+        conversation_id = int(data['conversation_id'])
+    except (KeyError, TypeError, ValueError):
+        return
+    if current_user.is_authenticated and is_participant(current_user.id, conversation_id):
+        join_room(conversation_room(conversation_id))
+        # Session propre à la connexion SocketIO : évite une requête par frappe pour 'typing'
+        session['joined_conversations'] = session.get('joined_conversations', []) + [conversation_id]
\ No newline at end of file
@@ -1,13 +1,17 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, current_app, send_file
 from flask_login import login_required, current_user
-from app.models import Notification, User, Location, DataEntry, ChangeRequest, TeamReport
+from app.models import User, Location, DataEntry, ChangeRequest, TeamReport
 from app.forms import (
     DataEntryForm, DistrictTransferForm, TeamManagementForm, SelectRegionForm,
     LocationForm, MemberReportForm, MonthlyReportForm
 )
 from app import db
 from datetime import datetime, timedelta
-from app.utils.performance import calculate_regional_performance
+from app.utils.conversations import sync_user_memberships
+from app.utils.notifications import notification_row, notify
+from app.utils.locations import get_district_ids
+from app.utils.performance import get_regional_performance, refresh_location_performance
+from app.utils.replica import read_replica
 from functools import wraps
 from weasyprint import HTML
 from io import BytesIO
@@ -66,12 +70,10 @@ def respond_request(request_id):
             request_entry.team_lead_id = current_user.id
             request_entry.team_lead_responded_at = datetime.utcnow()
             request_entry.completed_at = datetime.utcnow()
-            notification = Notification(
-                user_id=request_entry.requester_id,
-                message=f"Votre demande de changement de localisation pour {district_name} a été acceptée par le Team Lead.",
-                created_at=datetime.utcnow()
-            )
-            db.session.add(notification)
+            notify([notification_row(
+                request_entry.requester_id,
+                f"Votre demande de changement de localisation pour {district_name} a été acceptée par le Team Lead."
+            )])
             flash("Demande acceptée avec succès.", 'success')
         elif action == 'reject':
             reason = request.form.get('reason')
@@ -83,12 +85,10 @@ def respond_request(request_id):
             request_entry.team_lead_responded_at = datetime.utcnow()
             request_entry.completed_at = datetime.utcnow()
             request_entry.reason = reason
-            notification = Notification(
-                user_id=request_entry.requester_id,
-                message=f"Votre demande de changement de localisation pour {district_name} a été rejetée par le Team Lead. Raison : {reason}.",
-                created_at=datetime.utcnow()
-            )
-            db.session.add(notification)
+            notify([notification_row(
+                request_entry.requester_id,
+                f"Votre demande de changement de localisation pour {district_name} a été rejetée par le Team Lead. Raison : {reason}."
+            )])
             flash(f"Demande rejetée avec la raison : {reason}.", 'info')
 
         db.session.commit()
@@ -137,6 +137,7 @@ def manage_members():
                 flash(f"{member.name} est déjà assigné à {location.name}", "warning")
             else:
                 member.location_id = location.id
+                sync_user_memberships(member)
                 db.session.commit()
                 flash(f"{member.name} assigné à {location.name}", "success")
 
@@ -151,14 +152,14 @@ def manage_members():
                 flash("Ce membre ne fait pas partie de vos districts", "danger")
             else:
                 member.location_id = None
+                sync_user_memberships(member)
                 db.session.commit()
                 flash("Membre retiré avec succès", "success")
         
         return redirect(url_for('team_lead.manage_members'))
 
     # Récupérer les data_entry des districts de la région pour l'affichage
-    districts = Location.query.filter_by(parent_id=current_user.location_id, type='DIS').all()
-    district_ids = [d.id for d in districts]
+    district_ids = get_district_ids(current_user.location_id)
     
     team_members = User.query.filter(
         User.role == 'data_entry',
@@ -325,6 +326,7 @@ def change_region():
             flash(f"Demande de changement de région envoyée à {existing_team_lead.name}.", 'info')
         else:
             current_user.location_id = new_region.id
+            sync_user_memberships(current_user)
             db.session.commit()
             flash(f"Région changée à {new_region.name}.", 'success')
         return redirect(url_for('main.dashboard'))
@@ -332,8 +334,9 @@ def change_region():
     return render_template('team_lead/change_region.html', form=form)
 
 @team_lead_bp.route('/performance_report')
+@read_replica
 def performance_report():
-    performance = calculate_regional_performance(current_user.location_id)
+    performance = get_regional_performance(current_user.location_id)
     
     start_date = datetime.now() - timedelta(days=180)
     entries = DataEntry.query.filter(
@@ -438,6 +441,7 @@ def new_entry():
             )
             db.session.add(entry)
             db.session.commit()
+            refresh_location_performance(entry.location_id)
             flash('Données enregistrées avec succès !', 'success')
             return redirect(url_for('main.dashboard'))
     return render_template('team_lead/new_entry.html', form=form)
@@ -464,11 +468,7 @@ def dashboard():
 
     try:
         # Get districts under this region
-        districts = Location.query.filter_by(
-            parent_id=user_location.id,
-            type='DIS'
-        ).all()
-        district_ids = [d.id for d in districts]
+        district_ids = get_district_ids(user_location.id)
 
         # Get pending change requests
         pending_requests = ChangeRequest.query.filter(
@@ -483,7 +483,7 @@ def dashboard():
         # Calculate team metrics
         current_month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         metrics = {
-            'districts_count': len(districts),
+            'districts_count': len(district_ids),
             'team_members': User.query.filter(
                 User.role == 'data_entry',
                 User.location_id.in_(district_ids)
@@ -11,6 +11,9 @@ document.addEventListener('DOMContentLoaded', () => {
         return;
     }
 
+    // Jeton CSRF du formulaire d'édition, exigé par les écritures de l'API
+    const csrfToken = () => (EDIT_FORM.elements['csrf_token'] || {}).value || '';
+
     // 1. Fonctionnalité de recherche avec débouncing
     let searchTimeout;
     SEARCH_INPUT.addEventListener('input', (e) => {
@@ -98,7 +101,8 @@ document.addEventListener('DOMContentLoaded', () => {
             method: 'PUT',
             body: formData,
             headers: {
-                'Accept': 'application/json'
+                'Accept': 'application/json',
+                'X-CSRFToken': csrfToken()
             }
         })
         .then(response => {
@@ -121,7 +125,8 @@ document.addEventListener('DOMContentLoaded', () => {
             fetch(`/api/locations/${locationId}`, {
                 method: 'DELETE',
                 headers: {
-                    'Accept': 'application/json'
+                    'Accept': 'application/json',
+                    'X-CSRFToken': csrfToken()
                 }
             })
             .then(response => {
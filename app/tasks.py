@@ -0,0 +1,91 @@
+# app/tasks.py
+from datetime import datetime
+from celery import Celery, Task, group, shared_task
+from celery.schedules import crontab
+from flask import current_app
+from app import db
+from app.models import Location, Message
+from app.utils.notifications import insert_notifications
+from app.utils.performance import refresh_performance_snapshots
+from app.utils.uploads import purge_abandoned_uploads
+
+def make_celery(app):
+    """
+    Construit l'application Celery liée à une application Flask.
+    L'application Flask est créée une seule fois par processus worker ;
+    chaque tâche s'exécute dans son contexte d'application.
+    """
+    class FlaskTask(Task):
+        def __call__(self, *args, **kwargs):
+            with app.app_context():
+                return self.run(*args, **kwargs)
+
+    celery = Celery(app.import_name, task_cls=FlaskTask)
+    celery.conf.update(
+        broker_url=app.config['CELERY_BROKER_URL'],
+        result_backend=app.config['CELERY_RESULT_BACKEND'],
+        task_always_eager=app.config['CELERY_TASK_ALWAYS_EAGER'],
+        task_eager_propagates=app.config['CELERY_TASK_ALWAYS_EAGER'],
+        beat_schedule={
+            'update-performance-metrics-nightly': {
+                'task': 'update_performance_metrics',
+                'schedule': crontab(hour=app.config['PERFORMANCE_REFRESH_HOUR'], minute=0)
+            },
+            'purge-abandoned-uploads-hourly': {
+                'task': 'purge_abandoned_uploads',
+                'schedule': crontab(minute=30)
+            }
+        }
+    )
+    celery.set_default()
+    app.extensions['celery'] = celery
+    return celery
+
+def chunk_region_ids(region_ids, chunk_size):
+    """Découpe la liste des régions en lots de taille chunk_size."""
+    return [region_ids[i:i + chunk_size] for i in range(0, len(region_ids), chunk_size)]
+
+@shared_task(name='update_performance_metrics', ignore_result=True)
+def update_performance_metrics(chunk_size=None):
+    """Répartit le recalcul des performances de toutes les régions en sous-tâches parallèles."""
+    chunk_size = chunk_size or current_app.config['PERFORMANCE_CHUNK_SIZE']
+    region_ids = [r.id for r in db.session.query(Location.id).filter_by(type='REG').order_by(Location.id).all()]
+    chunks = chunk_region_ids(region_ids, chunk_size)
+    if chunks:
+        group(update_performance_metrics_chunk.s(chunk) for chunk in chunks).apply_async()
+    current_app.logger.info(f"Recalcul des performances lancé : {len(region_ids)} régions en {len(chunks)} lots")
+    return len(chunks)
+
+@shared_task(name='update_performance_metrics_chunk')
+def update_performance_metrics_chunk(region_ids):
+    """Calcule et insère en bloc les instantanés PerformanceMetric d'un lot de régions."""
+    count = refresh_performance_snapshots(region_ids)
+    current_app.logger.info(f"Métriques mises à jour pour {count} régions à {datetime.utcnow()}")
+    return count
+
+@shared_task(name='persist_notifications', ignore_result=True)
+def persist_notifications(rows):
+    """
+    Écrit une file de notifications différées en un INSERT groupé.
+    Utilise sa propre connexion : la session de la requête émettrice est déjà validée.
+    """
+    for row in rows:
+        row['created_at'] = datetime.fromisoformat(row['created_at'])
+    with db.engine.begin() as connection:
+        return insert_notifications(rows, connection=connection)
+
+@shared_task(name='generate_attachment_previews', ignore_result=True)
+def generate_attachment_previews(message_id):
+    """Vignette et aperçu WebP de la pièce jointe d'un message, hors du cycle de la requête."""
+    # Import local : Pillow n'est chargé que par les workers qui génèrent les aperçus
+    from app.utils.previews import generate_previews
+    message = db.session.get(Message, message_id)
+    if message is not None:
+        generate_previews(message)
+
+@shared_task(name='purge_abandoned_uploads', ignore_result=True)
+def purge_abandoned_uploads_task():
+    """Supprime les envois par morceaux abandonnés et leurs fichiers partiels."""
+    removed = purge_abandoned_uploads()
+    current_app.logger.info(f"{removed} fichiers partiels d'envois abandonnés supprimés")
+    return removed
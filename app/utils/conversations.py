@@ -0,0 +1,416 @@
+# app/utils/conversations.py
+from datetime import datetime
+from sqlalchemy import and_, event, func, insert, or_, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from app import db, socketio
+from app.models import Conversation, ConversationParticipant, Message, Notification, User
+from app.utils.locations import district_ids_select, load_location, load_locations
+
+GLOBAL_GROUP_TITLE = 'Groupe Global des Team Leads'
+# Nombre de messages chargés à l'ouverture d'une conversation et par page plus ancienne
+MESSAGE_PAGE_SIZE = 50
+
+# Salons SocketIO préfixés : un utilisateur et une conversation de même id ne partagent
+# pas le même salon (les compteurs de non-lus d'un utilisateur restent privés)
+def user_room(user_id):
+    return f'user:{user_id}'
+
+def conversation_room(conversation_id):
+    return f'conversation:{conversation_id}'
+
+def is_participant(user_id, conversation_id):
+    """Contrôle d'accès : recherche par clé primaire dans conversation_participants."""
+    return db.session.execute(
+        db.select(ConversationParticipant.user_id).filter_by(conversation_id=conversation_id, user_id=user_id)
+    ).first() is not None
+
+def participant_ids(conversation_id):
+    return set(db.session.scalars(
+        db.select(ConversationParticipant.user_id).filter_by(conversation_id=conversation_id)
+    ))
+
+def get_other_participant(conversation_id, user_id):
+    """Interlocuteur d'une conversation privée."""
+    return User.query.join(ConversationParticipant, ConversationParticipant.user_id == User.id).filter(
+        ConversationParticipant.conversation_id == conversation_id,
+        ConversationParticipant.user_id != user_id
+    ).order_by(User.id).first()
+
+def _last_message_id(conversation_id):
+    return db.session.scalar(db.select(func.max(Message.id)).filter_by(conversation_id=conversation_id))
+
+def _last_message_ids(conversation_ids):
+    """Dernier message de plusieurs conversations, en une requête groupée."""
+    return dict(db.session.execute(
+        db.select(Message.conversation_id, func.max(Message.id))
+        .where(Message.conversation_id.in_(list(conversation_ids)))
+        .group_by(Message.conversation_id)
+    ).all())
+
+def add_participants(conversation_id, user_ids):
+    """
+    Ajoute les membres absents d'une conversation (insertion groupée).
+    L'historique existant est considéré comme lu par les nouveaux membres.
+    """
+    missing = set(user_ids) - participant_ids(conversation_id)
+    if missing:
+        now = datetime.utcnow()
+        last_message_id = _last_message_id(conversation_id)
+        db.session.execute(insert(ConversationParticipant), [
+            {'conversation_id': conversation_id, 'user_id': user_id, 'joined_at': now,
+             'last_read_message_id': last_message_id}
+            for user_id in sorted(missing)
+        ])
+    return missing
+
+def private_pair_key(user_id, other_id):
+    """Clé canonique d'une conversation privée, indépendante de l'ordre des membres."""
+    return min(user_id, other_id), max(user_id, other_id)
+
+def get_private_conversations(user_id, other_ids):
+    """
+    Conversations privées existantes entre user_id et chacun des other_ids, en une
+    recherche sur l'index unique (user_low_id, user_high_id).
+    Retourne {other_id: conversation}.
+    """
+    pairs = [private_pair_key(user_id, other_id) for other_id in set(other_ids)]
+    if not pairs:
+        return {}
+    conversations = Conversation.query.filter(
+        tuple_(Conversation.user_low_id, Conversation.user_high_id).in_(pairs)
+    ).all()
+    return {
+        conversation.user_high_id if conversation.user_low_id == user_id else conversation.user_low_id: conversation
+        for conversation in conversations
+    }
+
+def create_private_conversations(user_id, other_ids):
+    """
+    Crée les conversations privées manquantes de user_id avec les other_ids, sans valider
+    la transaction. Chaque création a lieu dans un point de sauvegarde : si une requête
+    concurrente crée la même paire, l'index unique la rejette et l'existante est conservée.
+    Retourne les interlocuteurs pour lesquels une création a été tentée.
+    """
+    other_ids = set(other_ids) - {user_id}
+    missing = other_ids - get_private_conversations(user_id, other_ids).keys()
+    for other_id in sorted(missing):
+        low, high = private_pair_key(user_id, other_id)
+        try:
+            with db.session.begin_nested():
+                conversation = Conversation(type='private', user_low_id=low, user_high_id=high)
+                db.session.add(conversation)
+                db.session.flush()
+                add_participants(conversation.id, [low, high])
+        except IntegrityError:
+            continue
+    return missing
+
+def get_or_create_private_conversations(user_id, other_ids):
+    """Conversations privées de user_id avec chacun des other_ids, créées si absentes."""
+    if create_private_conversations(user_id, other_ids):
+        db.session.commit()
+    return get_private_conversations(user_id, other_ids)
+
+def private_counterpart_ids(user, location):
+    """
+    Interlocuteurs directs attendus selon le rôle et la localisation (lue en base) :
+    - data_entry : team_lead de la région de son district ;
+    - team_lead : data_entries des districts de sa région et data_viewers ;
+    - data_viewer : team_leads.
+    """
+    if user.role == 'data_entry':
+        if location is None or location.type != 'DIS' or location.parent_id is None:
+            return set()
+        condition = (User.role == 'team_lead') & (User.location_id == location.parent_id)
+    elif user.role == 'team_lead':
+        if location is None or location.type != 'REG':
+            return set()
+        condition = (
+            (User.role == 'data_viewer') |
+            ((User.role == 'data_entry') & User.location_id.in_(district_ids_select(location.id)))
+        )
+    elif user.role == 'data_viewer':
+        condition = User.role == 'team_lead'
+    else:
+        return set()
+    return set(db.session.scalars(db.select(User.id).where(condition))) - {user.id}
+
+def group_member_ids(conversation):
+    """
+    Membres attendus d'une conversation de groupe :
+    - groupe global : team_leads et data_viewers ;
+    - groupe régional : data_viewers, team_lead de la région et data_entries de ses districts.
+    """
+    if conversation.title == GLOBAL_GROUP_TITLE:
+        condition = User.role.in_(['team_lead', 'data_viewer'])
+    else:
+        region = load_location(conversation.location_id)
+        if region is None or region.type != 'REG':
+            return set()
+        condition = (
+            (User.role == 'data_viewer') |
+            ((User.role == 'team_lead') & (User.location_id == region.id)) |
+            ((User.role == 'data_entry') & User.location_id.in_(district_ids_select(region.id)))
+        )
+    return set(db.session.scalars(db.select(User.id).where(condition)))
+
+def sync_group_members(conversation):
+    """Aligne les membres d'une conversation de groupe sur les règles de rôle et de localisation."""
+    expected = group_member_ids(conversation)
+    extra = participant_ids(conversation.id) - expected
+    if extra:
+        db.session.execute(db.delete(ConversationParticipant).where(
+            ConversationParticipant.conversation_id == conversation.id,
+            ConversationParticipant.user_id.in_(extra)
+        ))
+    add_participants(conversation.id, expected)
+
+def _create_group(**values):
+    conversation = Conversation(type='group', **values)
+    db.session.add(conversation)
+    db.session.flush()
+    sync_group_members(conversation)
+    return conversation
+
+def provision_group_conversations(regions=()):
+    """
+    Crée, sans valider la transaction, les conversations de groupe manquantes des régions
+    données et le groupe global des team leads, avec leurs membres.
+    Appelée à la création ou à la promotion d'une région : la boîte de réception n'a plus
+    rien à créer à la lecture.
+    """
+    db.session.flush()
+    region_ids = [region.id for region in regions]
+    existing = set(db.session.scalars(db.select(Conversation.location_id).where(
+        Conversation.type == 'group', Conversation.location_id.in_(region_ids)
+    ))) if region_ids else set()
+    created = [_create_group(location_id=region_id) for region_id in region_ids if region_id not in existing]
+    if db.session.scalar(db.select(Conversation.id).filter_by(type='group', title=GLOBAL_GROUP_TITLE)) is None:
+        created.append(_create_group(title=GLOBAL_GROUP_TITLE))
+    return created
+
+def _expected_group_ids(user, location, groups):
+    """Conversations de groupe auxquelles l'utilisateur doit appartenir."""
+    expected = set()
+    for conversation_id, location_id, title in groups:
+        if title == GLOBAL_GROUP_TITLE:
+            if user.role in ('team_lead', 'data_viewer'):
+                expected.add(conversation_id)
+        elif user.role == 'data_viewer':
+            expected.add(conversation_id)
+        elif location is None:
+            continue
+        elif user.role == 'team_lead' and location.type == 'REG' and location.id == location_id:
+            expected.add(conversation_id)
+        elif user.role == 'data_entry' and location.type == 'DIS' and location.parent_id == location_id:
+            expected.add(conversation_id)
+    return expected
+
+def sync_user_memberships(*users):
+    """
+    Met à jour les groupes d'utilisateurs dont le rôle ou la localisation a changé et crée
+    leurs conversations privées avec les nouveaux interlocuteurs attendus.
+    Les conversations privées existantes conservent leurs deux membres.
+    """
+    db.session.flush()
+    groups = db.session.execute(
+        db.select(Conversation.id, Conversation.location_id, Conversation.title).filter_by(type='group')
+    ).all()
+    group_ids = [group.id for group in groups]
+    # Localisations lues en base : l'index en mémoire peut être en retard sur un autre processus
+    locations = load_locations(user.location_id for user in users)
+    for user in users:
+        location = locations.get(user.location_id)
+        current = set(db.session.scalars(db.select(ConversationParticipant.conversation_id).where(
+            ConversationParticipant.user_id == user.id,
+            ConversationParticipant.conversation_id.in_(group_ids)
+        )))
+        expected = _expected_group_ids(user, location, groups)
+        if current - expected:
+            db.session.execute(db.delete(ConversationParticipant).where(
+                ConversationParticipant.user_id == user.id,
+                ConversationParticipant.conversation_id.in_(current - expected)
+            ))
+        if expected - current:
+            now = datetime.utcnow()
+            last_message_ids = _last_message_ids(expected - current)
+            db.session.execute(insert(ConversationParticipant), [
+                {'conversation_id': conversation_id, 'user_id': user.id, 'joined_at': now,
+                 'last_read_message_id': last_message_ids.get(conversation_id)}
+                for conversation_id in sorted(expected - current)
+            ])
+        create_private_conversations(user.id, private_counterpart_ids(user, location))
+
+def sync_location_memberships(location_ids):
+    """Resynchronise les utilisateurs rattachés aux localisations déplacées ou promues."""
+    users = User.query.filter(User.location_id.in_(list(location_ids))).all()
+    if users:
+        sync_user_memberships(*users)
+
+def encode_cursor(message):
+    """Curseur opaque (horodatage, id) désignant le plus ancien message déjà affiché."""
+    return f"{message.timestamp.isoformat()}_{message.id}"
+
+def decode_cursor(cursor):
+    try:
+        timestamp, message_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(timestamp), int(message_id)
+    except (AttributeError, ValueError):
+        return None
+
+def get_message_page(conversation_id, before=None, limit=MESSAGE_PAGE_SIZE):
+    """
+    Page de messages par clé (timestamp, id), servie par l'index
+    ix_messages_conversation_id_timestamp : le coût ne dépend pas de la longueur de l'historique.
+    Retourne (messages du plus ancien au plus récent, curseur de la page précédente ou None).
+    """
+    query = Message.query.options(
+        joinedload(Message.sender).joinedload(User.location)
+    ).filter(Message.conversation_id == conversation_id)
+    if before is not None:
+        timestamp, message_id = before
+        query = query.filter(or_(
+            Message.timestamp < timestamp,
+            and_(Message.timestamp == timestamp, Message.id < message_id)
+        ))
+    messages = query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit + 1).all()
+    has_more = len(messages) > limit
+    messages = messages[:limit][::-1]
+    return messages, (encode_cursor(messages[0]) if has_more else None)
+
+def sender_label(message, conversation):
+    """Nom affiché pour l'expéditeur (district pour les data_entry dans un groupe)."""
+    sender = message.sender
+    if sender.role == 'data_entry' and conversation.type == 'group':
+        if sender.location and sender.location.type == 'DIS':
+            return f"District {sender.location.name}"
+        return "Utilisateur sans district"
+    return sender.name
+
+def unread_counts(user_id, conversation_ids=None):
+    """
+    Non-lus par conversation, lus dans le compteur unread_count des lignes de
+    l'utilisateur (index ix_conversation_participants_user_id) : aucun comptage de
+    messages, la connexion SocketIO de chaque page reste peu coûteuse.
+    """
+    statement = db.select(ConversationParticipant.conversation_id, ConversationParticipant.unread_count).where(
+        ConversationParticipant.user_id == user_id,
+        ConversationParticipant.unread_count > 0
+    )
+    if conversation_ids is not None:
+        if not conversation_ids:
+            return {}
+        statement = statement.where(ConversationParticipant.conversation_id.in_(conversation_ids))
+    return dict(db.session.execute(statement).all())
+
+def push_unread_counts(user_id, conversation_ids=None):
+    """
+    Envoie les non-lus au salon SocketIO de l'utilisateur : toutes ses conversations
+    à la connexion ('unread_counts'), ou seulement celles indiquées après une lecture
+    ('unread_count', une émission par conversation).
+    """
+    counts = unread_counts(user_id, conversation_ids)
+    if conversation_ids is None:
+        socketio.emit('unread_counts', {
+            'total': sum(counts.values()),
+            'conversations': {str(conversation_id): count for conversation_id, count in counts.items()}
+        }, to=user_room(user_id))
+        return
+    for conversation_id in conversation_ids:
+        socketio.emit('unread_count', {
+            'conversation_id': str(conversation_id),
+            'count': counts.get(conversation_id, 0)
+        }, to=user_room(user_id))
+
+def push_unread_increment(conversation_id, user_ids):
+    """
+    Nouveau message : +1 chez chaque destinataire, en une émission et sans requête
+    (le compteur stocké est incrémenté à l'insertion du message).
+    """
+    rooms = [user_room(user_id) for user_id in sorted(user_ids)]
+    if rooms:
+        socketio.emit('unread_increment', {'conversation_id': str(conversation_id)}, to=rooms)
+
+def advance_read_marker(conversation_id, user_id, message_id):
+    """
+    Avance le dernier message lu d'un membre (jamais en arrière) et recalcule son
+    compteur de non-lus sur les seuls messages suivants (index ix_messages_conversation_id_id).
+    """
+    remaining = db.select(func.count(Message.id)).where(
+        Message.conversation_id == conversation_id,
+        Message.id > message_id,
+        Message.sender_id != user_id
+    ).scalar_subquery()
+    db.session.execute(
+        db.update(ConversationParticipant).where(
+            ConversationParticipant.conversation_id == conversation_id,
+            ConversationParticipant.user_id == user_id,
+            or_(
+                ConversationParticipant.last_read_message_id.is_(None),
+                ConversationParticipant.last_read_message_id < message_id
+            )
+        ).values(last_read_message_id=message_id, unread_count=remaining).execution_options(synchronize_session=False)
+    )
+
+def mark_conversation_read(conversation_id, user_id, up_to=None):
+    """
+    Accusés de lecture en UPDATE groupés (messages reçus, notifications directes,
+    dernier message lu du membre), validés dans une seule transaction. up_to limite
+    la lecture aux messages jusqu'à ce message inclus, dans l'ordre des id comme le
+    dernier message lu (index ix_messages_conversation_id_id).
+    Retourne le nombre de messages marqués comme lus.
+    """
+    messages = db.select(Message.id).where(Message.conversation_id == conversation_id)
+    if up_to is not None:
+        target = db.session.scalar(
+            db.select(Message.id).filter_by(id=up_to, conversation_id=conversation_id)
+        )
+        if target is None:
+            return 0
+        messages = messages.where(Message.id <= target)
+    try:
+        updated = db.session.execute(
+            db.update(Message).where(
+                Message.id.in_(messages),
+                Message.sender_id != user_id,
+                or_(Message.read == False, Message.read.is_(None))
+            ).values(read=True).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.execute(
+            db.update(Notification).where(
+                Notification.user_id == user_id,
+                Notification.read == False,
+                Notification.message_id.in_(messages)
+            ).values(read=True).execution_options(synchronize_session=False)
+        )
+        last_read_id = up_to if up_to is not None else _last_message_id(conversation_id)
+        if last_read_id is not None:
+            advance_read_marker(conversation_id, user_id, last_read_id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    push_unread_counts(user_id, [conversation_id])
+    return updated
+
+@event.listens_for(Message, 'after_insert')
+def _touch_conversation(mapper, connection, message):
+    """
+    Dernier message de la conversation (tri de la boîte de réception) et compteur de
+    non-lus des autres membres, mis à jour dans la transaction de l'envoi.
+    """
+    conversations = Conversation.__table__
+    connection.execute(conversations.update().where(
+        conversations.c.id == message.conversation_id,
+        or_(
+            conversations.c.last_message_at.is_(None),
+            conversations.c.last_message_at < message.timestamp,
+            and_(conversations.c.last_message_at == message.timestamp, conversations.c.last_message_id < message.id)
+        )
+    ).values(last_message_at=message.timestamp, last_message_id=message.id))
+    participants = ConversationParticipant.__table__
+    connection.execute(participants.update().where(
+        participants.c.conversation_id == message.conversation_id,
+        participants.c.user_id != message.sender_id
+    ).values(unread_count=participants.c.unread_count + 1))
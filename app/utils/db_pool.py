@@ -0,0 +1,111 @@
+# app/utils/db_pool.py
+import time
+from threading import Lock
+from flask import current_app, has_request_context
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
+
+# Attente (secondes) au-delà de laquelle une prise de connexion est comptée comme bloquée
+SLOW_CHECKOUT = 0.01
+
+class PoolMetrics:
+    """Compteurs d'un pool : attente à la prise de connexion et occupation maximale."""
+    def __init__(self):
+        self._lock = Lock()
+        self.checkouts = 0
+        self.slow_checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.peak_checked_out = 0
+
+    def record(self, wait, checked_out, timed_out=False):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.peak_checked_out = max(self.peak_checked_out, checked_out)
+            if wait >= SLOW_CHECKOUT:
+                self.slow_checkouts += 1
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'slow_checkouts': self.slow_checkouts,
+                'timeouts': self.timeouts,
+                'wait_avg_ms': round(1000 * self.wait_total / self.checkouts, 3) if self.checkouts else 0.0,
+                'wait_max_ms': round(1000 * self.wait_max, 3),
+                'peak_checked_out': self.peak_checked_out,
+            }
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool qui mesure le temps passé à attendre une connexion libre."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.metrics.record(time.perf_counter() - start, self.checkedout(), timed_out)
+
+    def recreate(self):
+        # Pool recréé (dispose, connexion invalidée) : les compteurs sont conservés
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+def instrumented_engine_options(options):
+    """Options du moteur avec le pool instrumenté, lorsque la configuration définit un pool."""
+    options = dict(options or {})
+    if 'pool_size' in options and 'poolclass' not in options:
+        options['poolclass'] = InstrumentedQueuePool
+    return options
+
+@event.listens_for(Session, 'after_begin')
+def _limit_statement_time(session, transaction, connection):
+    """
+    Borne la durée des instructions des transactions ouvertes pendant une requête web
+    (DB_STATEMENT_TIMEOUT). SET LOCAL ne vaut que pour la transaction : la connexion rendue
+    au pool, puis reprise par une migration, une commande CLI ou une tâche, n'est pas limitée.
+    """
+    if connection.dialect.name != 'postgresql' or not has_request_context():
+        return
+    timeout = current_app.config.get('DB_STATEMENT_TIMEOUT')
+    if timeout:
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout)}")
+
+def pool_status(engine):
+    """État du pool d'un moteur : capacité, connexions prises, saturation et attentes."""
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {'pool': type(pool).__name__}
+    # max_overflow négatif : débordement illimité, pas de saturation mesurable
+    capacity = pool.size() + pool._max_overflow if pool._max_overflow >= 0 else None
+    checked_out = pool.checkedout()
+    status = {
+        'pool': type(pool).__name__,
+        'size': pool.size(),
+        'max_overflow': pool._max_overflow,
+        'timeout': pool.timeout(),
+        'checked_in': pool.checkedin(),
+        'checked_out': checked_out,
+        'overflow': max(pool.overflow(), 0),
+        # Part de la capacité en cours d'utilisation ; à 1, les requêtes attendent
+        'saturation': round(checked_out / capacity, 3) if capacity else None,
+    }
+    metrics = getattr(pool, 'metrics', None)
+    if metrics is not None:
+        status.update(metrics.snapshot())
+    return status
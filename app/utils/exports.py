@@ -0,0 +1,54 @@
+# app/utils/exports.py
+import csv
+import io
+from urllib.parse import quote
+from flask import Response, stream_with_context
+from app import db
+
+# Nombre de lignes lues par aller-retour au curseur serveur
+EXPORT_BATCH_SIZE = 1000
+# Taille (caractères) à partir de laquelle le tampon CSV est envoyé au client
+EXPORT_FLUSH_SIZE = 64 * 1024
+
+def stream_rows(statement, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Exécute une requête SELECT en flux (yield_per / curseur côté serveur)
+    et produit les lignes sans matérialiser le résultat complet.
+    """
+    result = db.session.execute(statement.execution_options(yield_per=batch_size))
+    try:
+        for row in result:
+            yield row
+    finally:
+        result.close()
+
+def stream_csv(header, rows, filename):
+    """
+    Retourne une réponse CSV générée ligne par ligne.
+    Le BOM UTF-8 est envoyé en premier pour l'ouverture correcte dans Excel.
+    """
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        buffer.write('\ufeff')
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() >= EXPORT_FLUSH_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+        yield buffer.getvalue()
+
+    response = Response(stream_with_context(generate()), mimetype='text/csv')
+    response.headers['Content-Disposition'] = _content_disposition(filename)
+    return response
+
+def _content_disposition(filename):
+    """En-tête Content-Disposition compatible avec les noms de fichiers non ASCII."""
+    try:
+        filename.encode('ascii')
+        return f'attachment; filename="{filename}"'
+    except UnicodeEncodeError:
+        fallback = filename.encode('ascii', 'ignore').decode('ascii') or 'export.csv'
+        return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
@@ -0,0 +1,66 @@
+# app/utils/inbox.py
+from sqlalchemy.orm import joinedload
+from app import db
+from app.models import Conversation, ConversationParticipant, Message, User
+from app.utils.conversations import unread_counts
+
+INBOX_PER_PAGE = 20
+
+def get_inbox(user, page=1, per_page=INBOX_PER_PAGE):
+    """
+    Boîte de réception paginée : conversation, dernier message, nombre de non-lus et
+    interlocuteur (conversations privées), en un nombre constant de requêtes
+    quel que soit le nombre de conversations. Les non-lus viennent du dernier message lu
+    de chaque membre.
+    Retourne (pagination, conversations_data).
+    """
+    statement = db.select(Conversation).join(
+        ConversationParticipant, ConversationParticipant.conversation_id == Conversation.id
+    ).where(
+        ConversationParticipant.user_id == user.id
+    ).options(
+        joinedload(Conversation.location)
+    ).order_by(Conversation.last_message_at.desc().nulls_last(), Conversation.id.desc())
+    pagination = db.paginate(statement, page=page, per_page=per_page, error_out=False)
+
+    conversation_ids = [conversation.id for conversation in pagination.items]
+    last_messages = _last_messages(pagination.items)
+    unread = unread_counts(user.id, conversation_ids)
+    other_users = _other_participants(user, [c.id for c in pagination.items if c.type == 'private'])
+
+    conversations_data = [{
+        'conversation': conversation,
+        'last_message': last_messages.get(conversation.id),
+        'unread_count': unread.get(conversation.id, 0),
+        'other_user': other_users.get(conversation.id)
+    } for conversation in pagination.items]
+    return pagination, conversations_data
+
+def _last_messages(conversations):
+    """
+    Dernier message de chaque conversation, lu par clé primaire depuis last_message_id :
+    le coût ne dépend pas de la longueur des historiques.
+    """
+    message_ids = [conversation.last_message_id for conversation in conversations if conversation.last_message_id]
+    if not message_ids:
+        return {}
+    return {
+        message.conversation_id: message
+        for message in db.session.scalars(db.select(Message).where(Message.id.in_(message_ids)))
+    }
+
+def _other_participants(user, conversation_ids):
+    """Interlocuteur de chaque conversation privée."""
+    if not conversation_ids:
+        return {}
+    others = {}
+    for conversation_id, other in db.session.execute(
+        db.select(ConversationParticipant.conversation_id, User)
+        .join(User, ConversationParticipant.user_id == User.id)
+        .where(
+            ConversationParticipant.conversation_id.in_(conversation_ids),
+            ConversationParticipant.user_id != user.id
+        ).order_by(ConversationParticipant.conversation_id, User.id)
+    ):
+        others.setdefault(conversation_id, other)
+    return others
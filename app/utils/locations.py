@@ -0,0 +1,145 @@
+# app/utils/locations.py
+import itertools
+import threading
+import time
+from collections import namedtuple
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db
+from app.models import Location, LocationTreeVersion
+
+# Entrée immuable de l'index (mêmes attributs de base que Location, sans relations)
+LocationNode = namedtuple('LocationNode', ['id', 'code', 'name', 'type', 'parent_id'])
+LOCATION_COLUMNS = (Location.id, Location.code, Location.name, Location.type, Location.parent_id)
+
+_lock = threading.Lock()
+
+class LocationIndex:
+    """Index en mémoire de l'arborescence région → districts."""
+
+    def __init__(self, nodes, version):
+        self.version = version
+        self.checked_at = time.monotonic()
+        self.by_id = {node.id: node for node in nodes}
+        self.by_code = {node.code: node.id for node in nodes}
+        self.regions = [node for node in nodes if node.type == 'REG']
+        self.districts = [node for node in nodes if node.type == 'DIS']
+        self.children = {}
+        for node in nodes:
+            if node.parent_id is not None:
+                self.children.setdefault(node.parent_id, []).append(node)
+
+def _primary_execute(statement):
+    # Jamais sur la réplique : un index construit depuis une base en retard resterait
+    # associé à la version courante
+    return db.session.execute(statement, bind_arguments={'bind': db.engine})
+
+def _shared_version():
+    return _primary_execute(db.select(LocationTreeVersion.version).filter_by(id=1)).scalar() or 0
+
+def invalidate_location_cache():
+    """Oublie l'index du processus : la prochaine lecture relit la version partagée."""
+    if has_app_context():
+        current_app.extensions.pop('location_index', None)
+
+def get_location_index():
+    """
+    Retourne l'index de l'application courante. La version partagée (table
+    location_tree_version) est relue au plus toutes les LOCATION_VERSION_CHECK_INTERVAL
+    secondes et l'index reconstruit en une requête si un processus l'a modifiée.
+    Pour l'affichage : validations et écritures lisent la base (load_location, district_ids_select).
+    """
+    index = current_app.extensions.get('location_index')
+    now = time.monotonic()
+    if index is not None and now - index.checked_at < current_app.config.get('LOCATION_VERSION_CHECK_INTERVAL', 2):
+        return index
+    version = _shared_version()
+    if index is not None and index.version == version:
+        index.checked_at = now
+        return index
+    with _lock:
+        rows = _primary_execute(db.select(*LOCATION_COLUMNS).order_by(Location.id)).all()
+        index = LocationIndex([LocationNode(*row) for row in rows], version)
+        current_app.extensions['location_index'] = index
+    return index
+
+def load_locations(location_ids):
+    """Localisations lues en base principale, {id: LocationNode}, sans passer par l'index."""
+    location_ids = {int(location_id) for location_id in location_ids if location_id is not None}
+    if not location_ids:
+        return {}
+    rows = _primary_execute(db.select(*LOCATION_COLUMNS).where(Location.id.in_(location_ids))).all()
+    return {row.id: LocationNode(*row) for row in rows}
+
+def load_location(location_id):
+    """Localisation lue en base principale (validations, écritures), ou None."""
+    try:
+        return load_locations([location_id]).get(int(location_id)) if location_id is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def district_ids_select(region_id):
+    """Sous-requête des districts d'une région, évaluée par la base dans l'écriture qui l'utilise."""
+    return db.select(Location.id).where(Location.parent_id == region_id, Location.type == 'DIS')
+
+def get_location(location_id):
+    """Retourne la localisation (LocationNode) ou None."""
+    if location_id is None:
+        return None
+    try:
+        return get_location_index().by_id.get(int(location_id))
+    except (TypeError, ValueError):
+        return None
+
+def get_location_id_by_code(code):
+    return get_location_index().by_code.get(code)
+
+def get_regions():
+    return list(get_location_index().regions)
+
+def get_districts(region_id=None):
+    """Districts d'une région, ou tous les districts si region_id est None."""
+    index = get_location_index()
+    if region_id is None:
+        return list(index.districts)
+    return [node for node in index.children.get(region_id, []) if node.type == 'DIS']
+
+def get_district_ids(region_id):
+    return [node.id for node in get_districts(region_id)]
+
+def get_region_location_ids(region_id):
+    """Identifiants de la région et de tous ses enfants directs."""
+    return [node.id for node in get_location_index().children.get(region_id, [])] + [region_id]
+
+def get_region_id(location_id):
+    """Région d'une localisation : elle-même pour une région, son parent pour un district."""
+    location = get_location(location_id)
+    if location is None:
+        return None
+    return location.id if location.type == 'REG' else location.parent_id
+
+@event.listens_for(Session, 'after_flush')
+def _track_location_changes(session, flush_context):
+    if any(isinstance(obj, Location) for obj in itertools.chain(session.new, session.dirty, session.deleted)):
+        if not session.info.get('locations_changed'):
+            # Une incrémentation par transaction, validée ou annulée avec elle
+            versions = LocationTreeVersion.__table__
+            connection = session.connection()
+            bumped = connection.execute(versions.update().where(versions.c.id == 1).values(
+                version=versions.c.version + 1
+            ))
+            if not bumped.rowcount:
+                connection.execute(versions.insert().values(id=1, version=1))
+        session.info['locations_changed'] = True
+        invalidate_location_cache()
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('locations_changed', False):
+        invalidate_location_cache()
+
+@event.listens_for(Session, 'after_rollback')
+def _invalidate_after_rollback(session):
+    if session.info.pop('locations_changed', False):
+        invalidate_location_cache()
@@ -0,0 +1,67 @@
+# app/utils/notifications.py
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+from app import db
+from app.models import Notification
+
+def notification_row(user_id, text, message_id=None, created_at=None):
+    """Ligne prête pour l'insertion groupée dans notifications."""
+    return {
+        'user_id': user_id,
+        'notification_message': text,
+        'message_id': message_id,
+        'created_at': created_at or datetime.utcnow(),
+        'read': False
+    }
+
+def insert_notifications(rows, connection=None):
+    """Insère toutes les notifications en une seule instruction INSERT groupée."""
+    rows = list(rows)
+    if not rows:
+        return 0
+    if connection is None:
+        db.session.execute(insert(Notification), rows)
+    else:
+        connection.execute(insert(Notification.__table__), rows)
+    return len(rows)
+
+def notify(rows, defer=None):
+    """
+    Enregistre des notifications.
+    - Par défaut, elles sont insérées en bloc dans la transaction de la requête.
+    - En mode différé (NOTIFICATIONS_DEFERRED ou defer=True), elles sont mises en file
+      et confiées à la tâche Celery persist_notifications après le commit :
+      la requête répond sans attendre l'écriture.
+    """
+    rows = list(rows)
+    if not rows:
+        return 0
+    if defer is None:
+        defer = current_app.config.get('NOTIFICATIONS_DEFERRED', False)
+    if not defer:
+        return insert_notifications(rows)
+    db.session.info.setdefault('deferred_notifications', []).extend(rows)
+    return len(rows)
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch_deferred_notifications(session):
+    rows = session.info.pop('deferred_notifications', None)
+    if rows:
+        # Import local : app.tasks dépend des utilitaires de l'application
+        from app.tasks import persist_notifications
+        try:
+            persist_notifications.delay([
+                dict(row, created_at=row['created_at'].isoformat()) for row in rows
+            ])
+        except Exception as e:
+            # Broker indisponible : la transaction est déjà validée, les notifications sont
+            # écrites tout de suite plutôt que perdues (et la requête ne répond pas 500)
+            current_app.logger.error(f"Mise en file des notifications impossible : {e}", exc_info=True)
+            with db.engine.begin() as connection:
+                insert_notifications(rows, connection=connection)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_deferred_notifications(session):
+    session.info.pop('deferred_notifications', None)
@@ -1,7 +1,11 @@
 # app/utils/performance.py
 from collections import Counter
 from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import case, func, insert
+from app import db
 from app.models import DataEntry, Location, PerformanceMetric
+from app.utils.locations import get_regions
 
 WEIGHTS = {
     'tite': 0.4,
@@ -10,48 +14,180 @@ WEIGHTS = {
     'comments': 0.1
 }
 
+# Période d'évaluation (3 derniers mois)
+PERFORMANCE_WINDOW_DAYS = 90
+
 def calculate_regional_performance(region_id):
-    # Récupération des données
-    region = Location.query.get(region_id)
-    
-    # Récupérer les districts (enfants de la région)
-    districts = region.children if region else []
-    district_ids = [d.id for d in districts] + [region_id]
-    
-    # Période des 3 derniers mois
-    three_months_ago = datetime.utcnow() - timedelta(days=90)
-    
-    # Récupérer les entrées de données pour les districts et la région
-    entries = DataEntry.query.join(Location, DataEntry.location).filter(
-        Location.id.in_(district_ids),
+    """Calcule la performance d'une seule région (délègue au calcul groupé)."""
+    return calculate_regions_performance([region_id])[region_id]
+
+def calculate_regions_performance(region_ids=None):
+    """
+    Calcule la performance de plusieurs régions en une seule requête agrégée.
+    Retourne un dictionnaire { region_id: performance } avec la même structure
+    que calculate_regional_performance. Sans argument, toutes les régions sont calculées.
+    """
+    if region_ids is None:
+        region_ids = [region.id for region in get_regions()]
+    region_ids = list(region_ids)
+    if not region_ids:
+        return {}
+
+    three_months_ago = datetime.utcnow() - timedelta(days=PERFORMANCE_WINDOW_DAYS)
+
+    # Une entrée appartient à la région si elle est saisie sur la région elle-même
+    # ou sur l'un de ses districts (enfants directs)
+    region_key = func.coalesce(Location.parent_id, Location.id)
+    has_comment = case(
+        (func.length(func.trim(DataEntry.commentaire)) > 0, 1),
+        else_=0
+    )
+
+    rows = db.session.query(
+        region_key.label('region_id'),
+        func.count(DataEntry.id).label('entries'),
+        func.sum(DataEntry.tite).label('total_tite'),
+        func.sum(DataEntry.men + DataEntry.women).label('total_members'),
+        func.sum(has_comment).label('comments')
+    ).join(Location, DataEntry.location_id == Location.id).filter(
+        region_key.in_(region_ids),
         DataEntry.date >= three_months_ago
-    ).all()
-    
-    # Calcul des métriques de base
-    total_tite = sum(float(e.tite or 0) for e in entries)
-    members_data = [e.men + e.women for e in entries]
-    
+    ).group_by(region_key).all()
+
+    aggregates = {row.region_id: row for row in rows}
+    return {
+        region_id: _build_performance(aggregates.get(region_id))
+        for region_id in region_ids
+    }
+
+def refresh_performance_snapshots(region_ids=None):
+    """
+    Recalcule et enregistre un instantané PerformanceMetric pour chaque région.
+    Un seul instantané par région et par jour (UTC) : celui du jour est remplacé dans la
+    même transaction, la table ne conserve que l'historique quotidien.
+    Les lignes sont insérées en une seule instruction groupée. Retourne le nombre d'instantanés écrits.
+    """
+    performances = calculate_regions_performance(region_ids)
+    if not performances:
+        return 0
+
+    created_at = datetime.utcnow()
+    rows = [
+        {
+            'region_id': region_id,
+            'score': performance['total_score'],
+            'tite_score': performance['details']['tite'],
+            'members_score': performance['details']['members'],
+            'submission_score': performance['details']['submission'],
+            'comment_score': performance['details']['comments'],
+            'created_at': created_at
+        }
+        for region_id, performance in performances.items()
+    ]
+    day_start = datetime.combine(created_at.date(), datetime.min.time())
+    db.session.execute(db.delete(PerformanceMetric).where(
+        PerformanceMetric.region_id.in_(list(performances)),
+        PerformanceMetric.created_at >= day_start
+    ))
+    db.session.execute(insert(PerformanceMetric), rows)
+    db.session.commit()
+    return len(rows)
+
+def refresh_location_performance(*location_ids):
+    """Rafraîchit l'instantané des régions concernées par une modification de données."""
+    region_ids = set()
+    for location_id in location_ids:
+        location = db.session.get(Location, location_id) if location_id else None
+        if location:
+            region_ids.add(location.parent_id or location.id)
+    if not region_ids:
+        return 0
+    try:
+        return refresh_performance_snapshots(sorted(region_ids))
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Erreur lors du rafraîchissement des performances : {str(e)}", exc_info=True)
+        return 0
+
+def get_regional_performance(region_id, max_age=None):
+    """Performance d'une région à partir du dernier instantané (ou calcul direct si périmé)."""
+    return get_regions_performance([region_id], max_age=max_age)[region_id]
+
+def get_regions_performance(region_ids=None, max_age=None):
+    """
+    Lit le dernier instantané PerformanceMetric de chaque région.
+    Les régions sans instantané ou dont l'instantané est plus ancien que max_age secondes
+    (PERFORMANCE_SNAPSHOT_MAX_AGE par défaut) sont calculées directement.
+    """
+    if region_ids is None:
+        region_ids = [region.id for region in get_regions()]
+    region_ids = list(region_ids)
+    if not region_ids:
+        return {}
+    if max_age is None:
+        max_age = current_app.config.get('PERFORMANCE_SNAPSHOT_MAX_AGE', 3600)
+
+    fresh_after = datetime.utcnow() - timedelta(seconds=max_age)
+    latest = db.session.query(
+        PerformanceMetric.region_id,
+        func.max(PerformanceMetric.created_at).label('created_at')
+    ).filter(
+        PerformanceMetric.region_id.in_(region_ids)
+    ).group_by(PerformanceMetric.region_id).subquery()
+
+    snapshots = PerformanceMetric.query.join(
+        latest,
+        (PerformanceMetric.region_id == latest.c.region_id) &
+        (PerformanceMetric.created_at == latest.c.created_at)
+    ).filter(PerformanceMetric.created_at >= fresh_after).all()
+
+    results = {snapshot.region_id: _snapshot_performance(snapshot) for snapshot in snapshots}
+    stale_ids = [region_id for region_id in region_ids if region_id not in results]
+    if stale_ids:
+        results.update(calculate_regions_performance(stale_ids))
+    return {region_id: results[region_id] for region_id in region_ids}
+
+def _snapshot_performance(snapshot):
+    """Reconstruit la structure de performance à partir d'un instantané enregistré."""
+    scores = {
+        'tite': snapshot.tite_score or 0,
+        'members': snapshot.members_score or 0,
+        'submission': snapshot.submission_score or 0,
+        'comments': snapshot.comment_score or 0
+    }
+    return build_performance_result(scores, has_report=bool(snapshot.submission_score))
+
+def _build_performance(row):
+    """Construit le dictionnaire de performance à partir d'une ligne agrégée."""
+    entries = row.entries if row else 0
+    total_tite = float(row.total_tite or 0) if row else 0.0
+    total_members = float(row.total_members or 0) if row else 0.0
+    comments = int(row.comments or 0) if row else 0
+
     # Normalisation avec valeurs par défaut réalistes
     scores = {
         'tite': min(total_tite / 1_000_000, 1.0) if total_tite else 0,
-        'members': (sum(members_data) / len(members_data) / 500) if members_data else 0,  # Objectif 500 membres
-        'submission': len(entries) / 12,  # 12 dimanches attendus
-        'comments': sum(1 for e in entries if e.commentaire and e.commentaire.strip()) / len(entries) if entries else 0
+        'members': (total_members / entries / 500) if entries else 0,  # Objectif 500 membres
+        'submission': entries / 12,  # 12 dimanches attendus
+        'comments': comments / entries if entries else 0
     }
-    
-    # Calcul du score pondéré
+    return build_performance_result(scores, has_report=bool(entries))
+
+def build_performance_result(scores, has_report):
+    """Calcule le score pondéré et retourne la structure de performance."""
     total_score = sum(WEIGHTS[k] * v * 100 for k, v in scores.items())
-    
+    label, css_class = get_performance_rating(total_score)
+
     return {
         'total_score': round(total_score, 2),
-        'performance_label': get_performance_rating(total_score)[0],
-        'performance_class': get_performance_rating(total_score)[1],
+        'performance_label': label,
+        'performance_class': css_class,
         'details': scores,
-        'has_report': bool(entries)
+        'has_report': has_report
     }
 
 def get_performance_rating(score):
     if score >= 90: return ('🔥 Très bonne', 'very-good')
     elif score >= 70: return ('🟢 Bonne', 'good')
     elif score >= 50: return ('🟡 Moyenne', 'average')
-    else: return ('🔴 Faible', 'poor')
\ No newline at end of file
+    else: return ('🔴 Faible', 'poor')
@@ -0,0 +1,74 @@
+# app/utils/previews.py
+import os
+import shutil
+import subprocess
+import tempfile
+from flask import current_app
+from PIL import Image, ImageOps
+from app import db
+from app.utils.storage import attachment_file, file_sha256, get_storage, is_legacy
+
+# Vignette affichée dans la conversation et aperçu ouvert au clic (WebP, côté le plus long)
+THUMBNAIL_SIZE = (320, 320)
+PREVIEW_SIZE = (1280, 1280)
+
+def extract_poster(video_path, output_path):
+    """
+    Image de la première seconde d'une vidéo via ffmpeg (Pillow ne décode pas le mp4).
+    Retourne False si ffmpeg n'est pas installé ou échoue : la vidéo reste sans affiche.
+    """
+    ffmpeg = shutil.which(current_app.config.get('FFMPEG_BINARY', 'ffmpeg'))
+    if ffmpeg is None:
+        return False
+    try:
+        subprocess.run(
+            [ffmpeg, '-loglevel', 'error', '-y', '-ss', '1', '-i', video_path, '-frames:v', '1', output_path],
+            check=True, timeout=60, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return os.path.exists(output_path)
+
+def render_previews(source, thumbnail_path, preview_path):
+    """Réduit une image en vignette et en aperçu WebP."""
+    with Image.open(source) as image:
+        # Décodage JPEG directement à une résolution réduite quand c'est possible
+        image.draft('RGB', PREVIEW_SIZE)
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        for size, path, quality in ((PREVIEW_SIZE, preview_path, 80), (THUMBNAIL_SIZE, thumbnail_path, 70)):
+            image.thumbnail(size)
+            image.save(path, 'WEBP', quality=quality, method=4)
+
+def generate_previews(message):
+    """
+    Produit la vignette et l'aperçu de la pièce jointe image ou vidéo (affiche extraite)
+    d'un message, rangés dans le stockage comme dérivés du contenu : un contenu identique
+    (dédoublonné) réutilise les aperçus existants. Retourne leurs clés ou None.
+    """
+    attachment_path, attachment_type = message.attachment_path, message.attachment_type
+    if attachment_type not in ('image', 'video') or not attachment_path:
+        return None
+    source = attachment_file(attachment_path)
+    if not os.path.exists(source):
+        return None
+    storage = get_storage()
+    # Les anciennes pièces jointes (static) sont rattachées à la clé de leur contenu
+    key = storage.key_for(file_sha256(source), source.rsplit('.', 1)[-1]) if is_legacy(attachment_path) else attachment_path
+    thumbnail, preview = storage.derived_key(key, 'thumb.webp'), storage.derived_key(key, 'preview.webp')
+    if not (storage.exists(thumbnail) and storage.exists(preview)):
+        with tempfile.TemporaryDirectory() as workdir:
+            image = source
+            if attachment_type == 'video':
+                image = os.path.join(workdir, 'poster.jpg')
+                if not extract_poster(source, image):
+                    return None
+            thumbnail_file, preview_file = os.path.join(workdir, 'thumb.webp'), os.path.join(workdir, 'preview.webp')
+            render_previews(image, thumbnail_file, preview_file)
+            storage.put_derived(key, 'thumb.webp', thumbnail_file)
+            storage.put_derived(key, 'preview.webp', preview_file)
+
+    message.thumbnail_path, message.preview_path = thumbnail, preview
+    db.session.commit()
+    return thumbnail, preview
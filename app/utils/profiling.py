@@ -0,0 +1,99 @@
+# app/utils/profiling.py
+import re
+import time
+from flask import current_app, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Statistiques SQL de la requête HTTP en cours, rangées dans l'environnement WSGI comme
+# le marqueur REPLICA_ENVIRON_KEY (voir app/utils/replica.py)
+PROFILE_ENVIRON_KEY = 'app.sql_profile'
+# Longueur maximale d'une instruction dans les journaux
+STATEMENT_LOG_LENGTH = 200
+
+class RequestProfile:
+    """Nombre et durée des instructions SQL d'une requête, regroupées par texte."""
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.count = 0
+        self.duration = 0.0
+        self.statements = {}
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        stats = self.statements.setdefault(statement, [0, 0.0])
+        stats[0] += 1
+        stats[1] += duration
+
+    def top_statements(self, limit):
+        """Instructions les plus coûteuses (durée cumulée) : une boucle N+1 ressort en tête."""
+        return sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+
+def _short(statement):
+    statement = re.sub(r'\s+', ' ', statement).strip()
+    return statement if len(statement) <= STATEMENT_LOG_LENGTH else statement[:STATEMENT_LOG_LENGTH] + '…'
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started_at', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started_at')
+    if not started:
+        return
+    duration = time.perf_counter() - started.pop()
+    if not has_app_context() or not current_app.config.get('SQL_PROFILING', True):
+        return
+    if has_request_context():
+        profile = request.environ.get(PROFILE_ENVIRON_KEY)
+        if profile is not None:
+            profile.record(statement, duration)
+    threshold = current_app.config.get('SLOW_QUERY_THRESHOLD_MS', 200)
+    if duration * 1000 >= threshold:
+        current_app.logger.warning(f"Requête SQL lente ({duration * 1000:.1f} ms) : {_short(statement)}")
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    # Instruction en échec : after_cursor_execute n'est pas appelé, le départ est retiré ici
+    started = context.connection.info.get('query_started_at') if context.connection is not None else None
+    if started:
+        started.pop()
+
+def _start_profile():
+    if current_app.config.get('SQL_PROFILING', True):
+        request.environ[PROFILE_ENVIRON_KEY] = RequestProfile()
+
+def _finish_profile(response):
+    """
+    Journalise les requêtes au-delà des seuils (durée ou nombre d'instructions SQL) avec
+    leurs instructions principales, et ajoute l'en-tête Server-Timing si SERVER_TIMING.
+    Les réponses en flux ne comptent que les instructions exécutées avant l'envoi du corps.
+    """
+    profile = request.environ.get(PROFILE_ENVIRON_KEY)
+    if profile is None:
+        return response
+    config = current_app.config
+    total_ms = (time.perf_counter() - profile.started_at) * 1000
+    sql_ms = profile.duration * 1000
+    if config.get('SERVER_TIMING', False):
+        response.headers.add(
+            'Server-Timing', f'db;dur={sql_ms:.1f};desc="{profile.count} requêtes", app;dur={total_ms:.1f}'
+        )
+    if (total_ms >= config.get('SLOW_REQUEST_THRESHOLD_MS', 1000)
+            or profile.count >= config.get('SLOW_REQUEST_QUERY_COUNT', 50)):
+        lines = [
+            f"  {count} × {duration * 1000:.1f} ms : {_short(statement)}"
+            for statement, (count, duration) in profile.top_statements(config.get('PROFILING_TOP_STATEMENTS', 5))
+        ]
+        current_app.logger.warning(
+            f"Requête lente {request.method} {request.path} ({request.endpoint}) : {total_ms:.0f} ms, "
+            f"{profile.count} instructions SQL ({sql_ms:.0f} ms)\n" + "\n".join(lines)
+        )
+    return response
+
+def init_profiling(app):
+    """Compte et chronomètre les instructions SQL de chaque requête HTTP."""
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
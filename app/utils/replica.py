@@ -0,0 +1,89 @@
+# app/utils/replica.py
+import time
+from functools import wraps
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql.dml import UpdateBase
+from app.utils.db_pool import instrumented_engine_options
+from config import engine_options
+
+# Marqueur posé sur la requête (et non sur g : les vues poussent parfois un nouveau
+# contexte d'application, qui aurait son propre g) par les vues en lecture seule
+REPLICA_ENVIRON_KEY = 'app.read_replica'
+
+# Retard de la réplique (secondes) selon le moteur. PostgreSQL : 0 si tout le WAL reçu
+# est rejoué (un primaire inactif ne doit pas faire croire à un retard).
+LAG_QUERIES = {
+    'postgresql': (
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+    ),
+}
+
+class RoutingSession(Session):
+    """
+    Session qui envoie les lectures des vues marquées read_replica vers la réplique.
+    Écritures, flush et vues non marquées restent sur la base principale.
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and not isinstance(clause, UpdateBase)
+                and has_request_context() and request.environ.get(REPLICA_ENVIRON_KEY)):
+            engine = current_app.extensions['read_replica']['engine']
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def init_replica(app):
+    """
+    Moteur de la réplique (REPLICA_DATABASE_URL), créé hors de SQLALCHEMY_BINDS : aucun
+    modèle ne lui est rattaché, seule RoutingSession l'utilise pour les vues marquées.
+    Son pool est dimensionné pour sa propre URL (engine_options), pas repris du primaire.
+    """
+    url = app.config.get('REPLICA_DATABASE_URL')
+    engine = create_engine(url, **instrumented_engine_options(engine_options(url))) if url else None
+    app.extensions['read_replica'] = {'engine': engine, 'checked_at': None, 'available': False}
+
+def measure_replica_lag(engine):
+    """Retard de réplication en secondes ; 0 pour les moteurs sans mesure (SQLite)."""
+    query = LAG_QUERIES.get(engine.dialect.name)
+    if query is None:
+        return 0.0
+    with engine.connect() as connection:
+        return float(connection.execute(text(query)).scalar() or 0)
+
+def replica_available():
+    """
+    La réplique est-elle configurée, joignable et en retard de moins de REPLICA_MAX_LAG ?
+    Le résultat est conservé REPLICA_LAG_CHECK_INTERVAL secondes par processus.
+    """
+    state = current_app.extensions['read_replica']
+    engine = state['engine']
+    if engine is None:
+        return False
+    now = time.monotonic()
+    interval = current_app.config.get('REPLICA_LAG_CHECK_INTERVAL', 5)
+    if state['checked_at'] is None or now - state['checked_at'] >= interval:
+        try:
+            lag = measure_replica_lag(engine)
+            state['available'] = lag <= current_app.config.get('REPLICA_MAX_LAG', 30)
+            if not state['available']:
+                current_app.logger.warning(f"Réplique en retard de {lag:.1f} s : lectures sur la base principale")
+        except SQLAlchemyError as e:
+            state['available'] = False
+            current_app.logger.warning(f"Réplique injoignable, lectures sur la base principale : {e}")
+        state['checked_at'] = now
+    return state['available']
+
+def read_replica(view):
+    """
+    Marque une vue en lecture seule : ses requêtes SELECT sont servies par la réplique
+    si elle est disponible (réponses en flux comprises, le marqueur suivant la requête).
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if replica_available():
+            request.environ[REPLICA_ENVIRON_KEY] = True
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,70 @@
+# app/utils/reporting.py
+from sqlalchemy import func
+from sqlalchemy.orm import aliased
+from app import db
+from app.models import DataEntry, Location, User
+
+def user_activity_statement():
+    """
+    Requête unique donnant, pour chaque utilisateur : nombre d'entrées, dernier commentaire,
+    district et région. Remplace les 3 à 4 requêtes exécutées auparavant par utilisateur.
+    """
+    entry_stats = db.select(
+        DataEntry.user_id.label('user_id'),
+        func.count(DataEntry.id).label('total_entries')
+    ).group_by(DataEntry.user_id).subquery()
+
+    # Dernière entrée de chaque utilisateur (fonction de fenêtre)
+    ranked_entries = db.select(
+        DataEntry.user_id.label('user_id'),
+        DataEntry.commentaire.label('commentaire'),
+        func.row_number().over(
+            partition_by=DataEntry.user_id,
+            order_by=(DataEntry.date.desc(), DataEntry.id.desc())
+        ).label('rank')
+    ).subquery()
+    last_entry = db.select(ranked_entries.c.user_id, ranked_entries.c.commentaire).where(
+        ranked_entries.c.rank == 1
+    ).subquery()
+
+    location = aliased(Location)
+    parent = aliased(Location)
+    return db.select(
+        User.id,
+        User.name,
+        User.role,
+        location.id.label('location_id'),
+        location.name.label('location_name'),
+        location.type.label('location_type'),
+        parent.id.label('parent_id'),
+        parent.name.label('parent_name'),
+        func.coalesce(entry_stats.c.total_entries, 0).label('total_entries'),
+        last_entry.c.commentaire.label('last_comment')
+    ).outerjoin(location, User.location_id == location.id).outerjoin(
+        parent, location.parent_id == parent.id
+    ).outerjoin(entry_stats, entry_stats.c.user_id == User.id).outerjoin(
+        last_entry, last_entry.c.user_id == User.id
+    ).order_by(User.id)
+
+def get_users_activity(rows=None):
+    """
+    Retourne l'activité de chaque utilisateur sous forme de dictionnaires :
+    user, district, region ({'id', 'name'} ou None), total_entries et last_comment.
+    """
+    if rows is None:
+        rows = db.session.execute(user_activity_statement())
+    for row in rows:
+        district = region = None
+        if row.location_type == 'DIS':
+            district = {'id': row.location_id, 'name': row.location_name}
+            if row.parent_id:
+                region = {'id': row.parent_id, 'name': row.parent_name}
+        elif row.location_type == 'REG':
+            region = {'id': row.location_id, 'name': row.location_name}
+        yield {
+            'user': {'id': row.id, 'name': row.name, 'role': row.role},
+            'district': district,
+            'region': region,
+            'total_entries': row.total_entries,
+            'last_comment': row.last_comment[:20] if row.last_comment else 'Aucun'
+        }
@@ -0,0 +1,125 @@
+# app/utils/storage.py
+import hashlib
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from flask import current_app, url_for
+
+# Blocs de lecture pour l'empreinte et la copie des flux
+STREAM_BLOCK_SIZE = 64 * 1024
+# Anciennes pièces jointes, servies par le dossier static
+LEGACY_PREFIX = 'uploads/'
+
+class AttachmentStorage(ABC):
+    """
+    Interface de stockage des pièces jointes. Une clé désigne un contenu immuable :
+    deux fichiers identiques ont la même clé et ne sont stockés qu'une fois.
+    """
+    @staticmethod
+    def key_for(sha256, ext):
+        """Clé d'un contenu : répartie sur deux niveaux de répertoires par son empreinte."""
+        return f"{sha256[:2]}/{sha256[2:4]}/{sha256}.{ext.lower()}"
+
+    @abstractmethod
+    def put_file(self, path, ext):
+        """Range le fichier (déplacé) et retourne sa clé."""
+
+    @abstractmethod
+    def put_stream(self, stream, ext):
+        """Range le contenu d'un flux et retourne sa clé."""
+
+    @abstractmethod
+    def put_derived(self, key, suffix, path):
+        """Range un fichier dérivé d'un contenu (aperçu...) et retourne sa clé."""
+
+    def derived_key(self, key, suffix):
+        return f"{os.path.splitext(key)[0]}_{suffix}"
+
+    @abstractmethod
+    def exists(self, key):
+        """Le contenu de la clé est-il stocké ?"""
+
+    @abstractmethod
+    def local_path(self, key):
+        """Chemin disque du contenu, ou None si le stockage n'est pas local."""
+
+class LocalStorage(AttachmentStorage):
+    """
+    Stockage adressé par contenu sur le disque local : <racine>/ab/cd/<sha256>.<ext>.
+    Les deux niveaux de répertoires bornent le nombre de fichiers par dossier.
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def local_path(self, key):
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"Clé de stockage invalide : {key}")
+        return path
+
+    def exists(self, key):
+        return os.path.isfile(self.local_path(key))
+
+    def _store(self, source, key):
+        target = self.local_path(key)
+        if os.path.exists(target):
+            os.remove(source)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(source, target)
+        return key
+
+    def put_file(self, path, ext):
+        return self._store(path, self.key_for(file_sha256(path), ext))
+
+    def put_stream(self, stream, ext):
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        # Fichier temporaire sous la racine : os.replace reste sur le même système de fichiers
+        with tempfile.NamedTemporaryFile(dir=self.root, suffix='.part', delete=False) as partial:
+            try:
+                for block in iter(lambda: stream.read(STREAM_BLOCK_SIZE), b''):
+                    digest.update(block)
+                    partial.write(block)
+            except BaseException:
+                # Flux interrompu : le fichier temporaire ne doit pas rester sous la racine
+                partial.close()
+                os.remove(partial.name)
+                raise
+        return self._store(partial.name, self.key_for(digest.hexdigest(), ext))
+
+    def put_derived(self, key, suffix, path):
+        return self._store(path, self.derived_key(key, suffix))
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(STREAM_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def get_storage():
+    """Stockage des pièces jointes de l'application (créé à la première utilisation)."""
+    storage = current_app.extensions.get('attachment_storage')
+    if storage is None:
+        storage = current_app.extensions['attachment_storage'] = LocalStorage(
+            current_app.config['ATTACHMENT_STORAGE_ROOT']
+        )
+    return storage
+
+def is_legacy(attachment_path):
+    return attachment_path.startswith(LEGACY_PREFIX)
+
+def attachment_file(attachment_path):
+    """Chemin disque d'une pièce jointe, ancienne (static) ou adressée par contenu."""
+    if is_legacy(attachment_path):
+        return os.path.join(current_app.config['UPLOAD_FOLDER'], os.path.basename(attachment_path))
+    return get_storage().local_path(attachment_path)
+
+def attachment_url(attachment_path):
+    """URL d'une pièce jointe ou d'un aperçu (filtre Jinja2 attachment_url)."""
+    if not attachment_path:
+        return None
+    if is_legacy(attachment_path):
+        return url_for('static', filename=attachment_path)
+    return url_for('messages.attachment', key=attachment_path)
@@ -0,0 +1,81 @@
+# app/utils/typing_indicator.py
+import time
+from threading import Lock
+from flask import current_app
+from app import socketio
+from app.utils.conversations import conversation_room
+
+# (user_id, conversation_id) -> {'emitted_at': dernier emit 'typing', 'expires_at': arrêt automatique}
+# État propre au processus : la connexion SocketIO d'un utilisateur reste sur un même worker.
+_typing = {}
+_lock = Lock()
+
+def _settings():
+    config = current_app.config
+    return config.get('TYPING_EMIT_INTERVAL', 3), config.get('TYPING_TIMEOUT', 5)
+
+def start_typing(user, conversation_id, skip_sid=None):
+    """
+    Signale qu'un membre écrit dans une conversation. Les frappes sont regroupées :
+    au plus un emit 'typing' par utilisateur, par conversation et par intervalle
+    (TYPING_EMIT_INTERVAL) ; chaque frappe repousse l'arrêt automatique (TYPING_TIMEOUT).
+    Retourne True si l'événement a été diffusé.
+    """
+    interval, timeout = _settings()
+    now = time.monotonic()
+    key = (user.id, conversation_id)
+    with _lock:
+        state = _typing.get(key)
+        started = state is None
+        if started:
+            state = _typing[key] = {'emitted_at': None}
+        state['expires_at'] = now + timeout
+        broadcast = state['emitted_at'] is None or now - state['emitted_at'] >= interval
+        if broadcast:
+            state['emitted_at'] = now
+    if started:
+        socketio.start_background_task(_expire, key, timeout)
+    if broadcast:
+        socketio.emit('typing', {
+            'conversation_id': str(conversation_id),
+            'user_id': user.id,
+            'user_name': user.name
+        }, room=conversation_room(conversation_id), skip_sid=skip_sid)
+    return broadcast
+
+def stop_typing(user_id, conversation_id):
+    """Fin de saisie : un seul 'stop_typing', et seulement si l'utilisateur était signalé."""
+    with _lock:
+        state = _typing.pop((user_id, conversation_id), None)
+    if state is not None:
+        _emit_stop(user_id, conversation_id)
+    return state is not None
+
+def stop_all_typing(user_id):
+    """Déconnexion : arrête les indicateurs de l'utilisateur dans toutes ses conversations."""
+    with _lock:
+        keys = [key for key in _typing if key[0] == user_id]
+        for key in keys:
+            del _typing[key]
+    for _, conversation_id in keys:
+        _emit_stop(user_id, conversation_id)
+
+def _emit_stop(user_id, conversation_id):
+    socketio.emit('stop_typing', {
+        'conversation_id': str(conversation_id),
+        'user_id': user_id
+    }, room=conversation_room(conversation_id))
+
+def _expire(key, delay):
+    """Tâche de fond : arrêt automatique lorsque plus aucune frappe n'arrive."""
+    while True:
+        socketio.sleep(delay)
+        with _lock:
+            state = _typing.get(key)
+            if state is None:
+                return
+            delay = state['expires_at'] - time.monotonic()
+            if delay <= 0:
+                del _typing[key]
+                break
+    _emit_stop(*key)
@@ -0,0 +1,169 @@
+# app/utils/uploads.py
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func
+from app import db
+from app.models import Upload
+from app.utils.storage import STREAM_BLOCK_SIZE, get_storage
+
+UPLOAD_QUOTA_WINDOW = timedelta(days=1)
+
+class UploadError(ValueError):
+    """Envoi refusé ; status est le code HTTP à renvoyer."""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def attachment_type_for(filename):
+    ext = filename.rsplit('.', 1)[1].lower()
+    return 'image' if ext in {'png', 'jpg', 'jpeg', 'gif'} else 'video' if ext == 'mp4' else 'file'
+
+def used_quota(user_id):
+    """Octets déclarés par l'utilisateur sur la fenêtre de quota (envois en cours compris)."""
+    since = datetime.utcnow() - UPLOAD_QUOTA_WINDOW
+    return db.session.scalar(
+        db.select(func.coalesce(func.sum(Upload.size), 0)).where(
+            Upload.user_id == user_id, Upload.created_at >= since
+        )
+    )
+
+def create_upload(user, conversation_id, filename, size):
+    """Ouvre un envoi par morceaux après contrôle de l'extension, de la taille et du quota."""
+    if '.' not in filename or filename.rsplit('.', 1)[1].lower() not in current_app.config['ALLOWED_EXTENSIONS']:
+        raise UploadError(f"Type de fichier non autorisé : {filename}")
+    if size <= 0:
+        raise UploadError("Taille de fichier invalide")
+    if size > current_app.config['UPLOAD_MAX_SIZE']:
+        raise UploadError("Fichier trop volumineux", status=413)
+    if used_quota(user.id) + size > current_app.config['UPLOAD_DAILY_QUOTA']:
+        raise UploadError("Quota d'envoi quotidien dépassé", status=413)
+    upload = Upload(id=uuid.uuid4().hex, user_id=user.id, conversation_id=conversation_id,
+                    filename=filename, size=size)
+    db.session.add(upload)
+    db.session.commit()
+    return upload
+
+def _partial_path(upload):
+    folder = current_app.config['UPLOAD_TMP_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{upload.id}.part")
+
+def received_bytes(upload):
+    """Position de reprise : taille du fichier partiel déjà écrit sur disque."""
+    if upload.completed_at is not None:
+        return upload.size
+    path = _partial_path(upload)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+def write_chunk(upload, stream, start, length):
+    """
+    Écrit un morceau dans le fichier partiel en le copiant bloc par bloc depuis le flux de
+    la requête (jamais entièrement en mémoire). Le morceau doit commencer à la position de
+    reprise et ne pas dépasser la taille déclarée ; le dernier termine l'envoi.
+
+    Les morceaux d'un même envoi sont sérialisés par un verrou sur sa ligne (SELECT ... FOR
+    UPDATE, tenu jusqu'à la fin de l'écriture) : un morceau rejoué pendant qu'un autre est
+    encore en cours attend puis reçoit 409, et un seul termine l'envoi. L'écriture se fait
+    en plus à la position explicite du morceau, jamais en ajout. Retourne la nouvelle position.
+    """
+    db.session.execute(
+        db.select(Upload).filter_by(id=upload.id).with_for_update()
+        .execution_options(populate_existing=True)
+    )
+    try:
+        offset = _write_at(upload, stream, start, length)
+    except UploadError:
+        db.session.rollback()
+        raise
+    if offset == upload.size:
+        complete_upload(upload)
+    else:
+        db.session.commit()
+    return offset
+
+def _write_at(upload, stream, start, length):
+    if upload.completed_at is not None:
+        raise UploadError("Envoi déjà terminé", status=409)
+    offset = received_bytes(upload)
+    if start != offset:
+        raise UploadError(f"Position attendue : {offset}", status=409)
+    if length > current_app.config['UPLOAD_CHUNK_SIZE']:
+        raise UploadError("Morceau trop volumineux", status=413)
+    if start + length > upload.size:
+        raise UploadError("Le morceau dépasse la taille déclarée", status=413)
+
+    path = _partial_path(upload)
+    written = 0
+    with os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b') as partial:
+        partial.seek(start)
+        while written < length:
+            block = stream.read(min(STREAM_BLOCK_SIZE, length - written))
+            if not block:
+                break
+            partial.write(block)
+            written += len(block)
+        if written != length:
+            # Morceau interrompu : on revient à la dernière position valide pour la reprise
+            partial.truncate(start)
+            raise UploadError("Morceau incomplet", status=400)
+    return start + written
+
+def complete_upload(upload):
+    """
+    Termine l'envoi : le fichier reçu est rangé dans le stockage adressé par contenu
+    (empreinte sha256). Un contenu identique déjà présent est réutilisé et le fichier
+    partiel supprimé (stockage unique). Sans effet sur un envoi déjà terminé.
+    """
+    if upload.completed_at is not None:
+        return upload
+    key = get_storage().put_file(_partial_path(upload), upload.filename.rsplit('.', 1)[1])
+    upload.sha256 = os.path.basename(key).split('.')[0]
+    upload.attachment_path = key
+    upload.completed_at = datetime.utcnow()
+    db.session.commit()
+    return upload
+
+def get_completed_upload(upload_id, user_id, conversation_id):
+    """Envoi terminé appartenant à l'utilisateur, pour la conversation du message."""
+    return Upload.query.filter(
+        Upload.id == upload_id,
+        Upload.user_id == user_id,
+        Upload.conversation_id == conversation_id,
+        Upload.completed_at.isnot(None)
+    ).first()
+
+def purge_abandoned_uploads(max_age=None):
+    """
+    Supprime les envois non terminés depuis plus de UPLOAD_EXPIRY secondes et leurs
+    fichiers partiels, ainsi que les fichiers .part orphelins aussi anciens.
+    Retourne le nombre de fichiers partiels supprimés.
+    """
+    max_age = max_age if max_age is not None else current_app.config['UPLOAD_EXPIRY']
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+    expired = db.session.scalars(db.select(Upload.id).where(
+        Upload.completed_at.is_(None), Upload.created_at < cutoff
+    )).all()
+    if expired:
+        db.session.execute(db.delete(Upload).where(Upload.id.in_(expired)).execution_options(synchronize_session=False))
+    db.session.commit()
+
+    folder = current_app.config['UPLOAD_TMP_FOLDER']
+    if not os.path.isdir(folder):
+        return 0
+    expired = set(expired)
+    stale_before = time.time() - max_age
+    removed = 0
+    for name in os.listdir(folder):
+        if not name.endswith('.part'):
+            continue
+        path = os.path.join(folder, name)
+        try:
+            if name[:-len('.part')] in expired or os.path.getmtime(path) < stale_before:
+                os.remove(path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
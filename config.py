@@ -2,6 +2,23 @@
 import os
 from pathlib import Path
 
+def engine_options(database_uri, pool_size=5, max_overflow=10):
+    """
+    Options du moteur SQLAlchemy (pool de connexions) issues de l'environnement :
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT et DB_POOL_RECYCLE (secondes) et
+    DB_POOL_PRE_PING.
+    """
+    if not database_uri or ':memory:' in database_uri:
+        # Base en mémoire : connexion unique gérée par Flask-SQLAlchemy, sans pool
+        return {}
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', pool_size)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', max_overflow)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),
+    }
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(24).hex()
     SQLALCHEMY_TRACK_MODIFICATIONS = False
@@ -10,13 +27,78 @@ class Config:
         SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL').replace("postgres://", "postgresql://", 1)
     else:
         SQLALCHEMY_DATABASE_URI = f'sqlite:///{BASEDIR / "instance" / "your_database.db"}'
+    # Pool par processus : avec les workers gevent, toutes les connexions simultanées d'un
+    # worker le partagent (pool_size + max_overflow au plus, puis attente DB_POOL_TIMEOUT)
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    # Durée maximale d'une instruction SQL pendant une requête web (millisecondes,
+    # PostgreSQL ; 0 pour désactiver). Migrations, commandes CLI et tâches Celery n'y sont
+    # pas soumises.
+    DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 30000))
+    # Réplique en lecture : les vues marquées read_replica (tableaux de bord, exports, boîte
+    # de réception) y lisent tant que son retard reste sous REPLICA_MAX_LAG (secondes),
+    # vérifié au plus toutes les REPLICA_LAG_CHECK_INTERVAL secondes
+    REPLICA_DATABASE_URL = (os.environ.get('REPLICA_DATABASE_URL') or '').replace("postgres://", "postgresql://", 1) or None
+    REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 30))
+    REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get('REPLICA_LAG_CHECK_INTERVAL', 5))
+    # Profilage SQL par requête : journalise les requêtes HTTP au-delà de
+    # SLOW_REQUEST_THRESHOLD_MS ou SLOW_REQUEST_QUERY_COUNT instructions (avec les
+    # PROFILING_TOP_STATEMENTS plus coûteuses) et les instructions au-delà de SLOW_QUERY_THRESHOLD_MS
+    SQL_PROFILING = os.environ.get('SQL_PROFILING', 'true').lower() in ('1', 'true', 'yes')
+    SLOW_REQUEST_THRESHOLD_MS = float(os.environ.get('SLOW_REQUEST_THRESHOLD_MS', 1000))
+    SLOW_REQUEST_QUERY_COUNT = int(os.environ.get('SLOW_REQUEST_QUERY_COUNT', 50))
+    SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 200))
+    PROFILING_TOP_STATEMENTS = int(os.environ.get('PROFILING_TOP_STATEMENTS', 5))
+    # En-tête Server-Timing (durée SQL et totale) visible dans les outils du navigateur
+    SERVER_TIMING = os.environ.get('SERVER_TIMING', '').lower() in ('1', 'true', 'yes')
     DEBUG = False
+    # Durée de validité (secondes) d'un instantané de performance avant recalcul direct
+    PERFORMANCE_SNAPSHOT_MAX_AGE = int(os.environ.get('PERFORMANCE_SNAPSHOT_MAX_AGE', 3600))
+    # Nombre de régions traitées par sous-tâche Celery et heure du recalcul nocturne (UTC)
+    PERFORMANCE_CHUNK_SIZE = int(os.environ.get('PERFORMANCE_CHUNK_SIZE', 50))
+    PERFORMANCE_REFRESH_HOUR = int(os.environ.get('PERFORMANCE_REFRESH_HOUR', 2))
+    # Intervalle (secondes) entre deux lectures de la version partagée de l'arborescence des
+    # localisations ; borne le retard de l'index en mémoire sur les modifications d'un autre processus
+    LOCATION_VERSION_CHECK_INTERVAL = float(os.environ.get('LOCATION_VERSION_CHECK_INTERVAL', 2))
+
+    # Celery : broker partagé par le web, le worker et beat (ex. redis://, amqp://).
+    # Le broker en mémoire est réservé aux tests et au développement local.
+    CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL')
+    CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND')
+    CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER', '').lower() in ('1', 'true', 'yes')
+    # Notifications écrites par un worker Celery après la réponse (sinon dans la transaction de la requête)
+    NOTIFICATIONS_DEFERRED = os.environ.get('NOTIFICATIONS_DEFERRED', '').lower() in ('1', 'true', 'yes')
+
+    # SocketIO multi-processus : file de messages partagée entre workers (URL Kombu, ex. amqp://,
+    # ou redis://). Sans file, les événements n'atteignent que les clients du même processus.
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL', 'flask-socketio')
+    # 'gevent' ou 'threading' ; détecté automatiquement si absent
+    SOCKETIO_ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE')
+    # Pièces jointes envoyées par morceaux : taille d'un morceau, d'un fichier et volume
+    # quotidien par utilisateur (octets)
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024))
+    UPLOAD_MAX_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', 200 * 1024 * 1024))
+    UPLOAD_DAILY_QUOTA = int(os.environ.get('UPLOAD_DAILY_QUOTA', 1024 * 1024 * 1024))
+    # Envois non terminés supprimés (ligne et fichier partiel) au-delà de ce délai (secondes)
+    UPLOAD_EXPIRY = int(os.environ.get('UPLOAD_EXPIRY', 24 * 3600))
+    # Stockage adressé par contenu des pièces jointes (par défaut instance/attachments)
+    ATTACHMENT_STORAGE_ROOT = os.environ.get('ATTACHMENT_STORAGE_ROOT')
+    ATTACHMENT_CACHE_MAX_AGE = int(os.environ.get('ATTACHMENT_CACHE_MAX_AGE', 365 * 24 * 3600))
+    # Envoi délégué au serveur web : préfixe de la location interne nginx (X-Accel-Redirect),
+    # ou USE_X_SENDFILE pour Apache/lighttpd (X-Sendfile)
+    ATTACHMENT_ACCEL_REDIRECT = os.environ.get('ATTACHMENT_ACCEL_REDIRECT')
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+    # Binaire ffmpeg pour l'affiche des vidéos (aperçus ignorés s'il est absent)
+    FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+    # Indicateur de saisie : un emit au plus par intervalle, arrêt automatique sans frappe (secondes)
+    TYPING_EMIT_INTERVAL = float(os.environ.get('TYPING_EMIT_INTERVAL', 3))
+    TYPING_TIMEOUT = float(os.environ.get('TYPING_TIMEOUT', 5))
 
     @classmethod
     def init_app(cls, app):
         """Initialisation sécurisée de la base de données"""
         db_uri = app.config['SQLALCHEMY_DATABASE_URI']
-        if db_uri.startswith('sqlite:///'):
+        if db_uri.startswith('sqlite:///') and db_uri != 'sqlite:///:memory:':
             db_path = Path(db_uri.replace('sqlite:///', ''))
             db_path.parent.mkdir(parents=True, exist_ok=True)
             db_path.touch(mode=0o644, exist_ok=True)
@@ -25,10 +107,49 @@ class Config:
 class ProductionConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', '').replace(
         'postgres://', 'postgresql://') or Config.SQLALCHEMY_DATABASE_URI
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI, pool_size=10, max_overflow=20)
+
+    @classmethod
+    def init_app(cls, app):
+        # Un broker en mémoire est propre à chaque processus : beat, worker et web ne
+        # partageraient aucune tâche. Sans broker partagé, le travail différé (notifications,
+        # aperçus) s'exécute directement dans le processus web et le recalcul nocturne
+        # reste à lancer par la commande refresh-performance.
+        broker = app.config.get('CELERY_BROKER_URL') or ''
+        if not broker or broker.startswith('memory://'):
+            app.logger.warning(
+                "CELERY_BROKER_URL n'indique pas de broker partagé (redis://, amqp://) : "
+                "tâches exécutées dans le processus web"
+            )
+            app.config.update(
+                CELERY_BROKER_URL='memory://', CELERY_RESULT_BACKEND='cache+memory://',
+                CELERY_TASK_ALWAYS_EAGER=True
+            )
+        super().init_app(app)
 
 class DevelopmentConfig(Config):
     DEBUG = True
+    # Sans broker configuré, les tâches s'exécutent immédiatement dans le processus web
+    CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'memory://')
+    CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'cache+memory://')
+    CELERY_TASK_ALWAYS_EAGER = os.environ.get(
+        'CELERY_TASK_ALWAYS_EAGER', '' if os.environ.get('CELERY_BROKER_URL') else 'true'
+    ).lower() in ('1', 'true', 'yes')
+    SERVER_TIMING = os.environ.get('SERVER_TIMING', 'true').lower() in ('1', 'true', 'yes')
 
 class TestingConfig(Config):
     TESTING = True
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
\ No newline at end of file
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    REPLICA_DATABASE_URL = None
+    CELERY_BROKER_URL = 'memory://'
+    CELERY_RESULT_BACKEND = 'cache+memory://'
+    CELERY_TASK_ALWAYS_EAGER = True
+    # Processus unique en test ; memory:// permet d'exercer la file Kombu sans broker
+    SOCKETIO_MESSAGE_QUEUE = None
+
+config_map = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig
+}
@@ -0,0 +1,33 @@
+# gunicorn.conf.py
+# Profil de production : workers gevent pour les WebSockets (ou sync, sans WebSocket).
+# Avec plusieurs workers, définir SOCKETIO_MESSAGE_QUEUE (ex. amqp://, le broker Celery)
+# pour que chaque emit atteigne les clients connectés aux autres processus, et activer
+# l'affinité de session (sticky sessions) sur le répartiteur pour le transport long-polling.
+import multiprocessing
+import os
+
+WORKER_CLASSES = {
+    'gevent': 'geventwebsocket.gunicorn.workers.GeventWebSocketWorker',
+    'sync': 'sync',
+}
+
+worker_mode = os.environ.get('WEB_WORKER_CLASS', 'gevent')
+worker_class = WORKER_CLASSES.get(worker_mode, worker_mode)
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+# Connexions simultanées par worker asynchrone
+worker_connections = int(os.environ.get('WEB_WORKER_CONNECTIONS', 1000))
+bind = f"0.0.0.0:{os.environ.get('PORT', 7007)}"
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+keepalive = 5
+accesslog = '-'
+errorlog = '-'
+
+# Le mode asynchrone de SocketIO suit celui des workers
+os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'gevent' if worker_mode == 'gevent' else 'threading')
+
+def post_fork(server, worker):
+    # psycopg2 est une extension C : sans ce correctif, chaque requête SQL bloque toute
+    # la boucle gevent du worker (et les WebSockets de ses clients)
+    if worker_mode == 'gevent':
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
@@ -0,0 +1,25 @@
+"""Add (conversation_id, id) index on messages for unread counts
+
+Revision ID: 0b6e2f9a4c71
+Revises: f2a8d4c6b913
+Create Date: 2026-10-18 20:31:05.914227
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0b6e2f9a4c71'
+down_revision = 'f2a8d4c6b913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.create_index('ix_messages_conversation_id_id', ['conversation_id', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_messages_conversation_id_id')
@@ -0,0 +1,39 @@
+"""Add unread_count to conversation_participants
+
+Revision ID: 1c7f3a8e5d24
+Revises: 0b6e2f9a4c71
+Create Date: 2026-10-18 20:48:33.702518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1c7f3a8e5d24'
+down_revision = '0b6e2f9a4c71'
+branch_labels = None
+depends_on = None
+
+participants = sa.table(
+    'conversation_participants',
+    sa.column('conversation_id'), sa.column('user_id'), sa.column('last_read_message_id'), sa.column('unread_count')
+)
+messages = sa.table('messages', sa.column('id'), sa.column('conversation_id'), sa.column('sender_id'))
+
+
+def upgrade():
+    with op.batch_alter_table('conversation_participants', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('unread_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # Messages reçus après le dernier message lu de chaque membre
+    op.execute(participants.update().values(unread_count=sa.select(sa.func.count(messages.c.id)).where(
+        messages.c.conversation_id == participants.c.conversation_id,
+        messages.c.id > sa.func.coalesce(participants.c.last_read_message_id, 0),
+        messages.c.sender_id != participants.c.user_id
+    ).scalar_subquery()))
+
+
+def downgrade():
+    with op.batch_alter_table('conversation_participants', schema=None) as batch_op:
+        batch_op.drop_column('unread_count')
@@ -0,0 +1,30 @@
+"""Add location_tree_version
+
+Revision ID: 3e9b7d2f6a18
+Revises: 1c7f3a8e5d24
+Create Date: 2026-10-18 22:14:05.318274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e9b7d2f6a18'
+down_revision = '1c7f3a8e5d24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    table = op.create_table(
+        'location_tree_version',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(table, [{'id': 1, 'version': 1}])
+
+
+def downgrade():
+    op.drop_table('location_tree_version')
@@ -0,0 +1,63 @@
+"""Add composite indexes for hot query paths
+
+Revision ID: 5c3e8f1a9d27
+Revises: 902b4da2a34d
+Create Date: 2026-10-18 09:12:41.204518
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5c3e8f1a9d27'
+down_revision = '902b4da2a34d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('data_entries', schema=None) as batch_op:
+        batch_op.create_index('ix_data_entries_location_id_date', ['location_id', 'date'], unique=False)
+        batch_op.create_index('ix_data_entries_user_id_date', ['user_id', 'date'], unique=False)
+
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.create_index('ix_notifications_user_id_read_message_id', ['user_id', 'read', 'message_id'], unique=False)
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.create_index('ix_messages_conversation_id_timestamp', ['conversation_id', 'timestamp'], unique=False)
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index('ix_users_role_location_id', ['role', 'location_id'], unique=False)
+
+    with op.batch_alter_table('locations', schema=None) as batch_op:
+        batch_op.create_index('ix_locations_parent_id_type', ['parent_id', 'type'], unique=False)
+
+    with op.batch_alter_table('change_requests', schema=None) as batch_op:
+        batch_op.create_index('ix_change_requests_status_target_district_id', ['status', 'target_district_id'], unique=False)
+
+    with op.batch_alter_table('performance_metrics', schema=None) as batch_op:
+        batch_op.create_index('ix_performance_metrics_region_id_created_at', ['region_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('performance_metrics', schema=None) as batch_op:
+        batch_op.drop_index('ix_performance_metrics_region_id_created_at')
+
+    with op.batch_alter_table('change_requests', schema=None) as batch_op:
+        batch_op.drop_index('ix_change_requests_status_target_district_id')
+
+    with op.batch_alter_table('locations', schema=None) as batch_op:
+        batch_op.drop_index('ix_locations_parent_id_type')
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_role_location_id')
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_messages_conversation_id_timestamp')
+
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_index('ix_notifications_user_id_read_message_id')
+
+    with op.batch_alter_table('data_entries', schema=None) as batch_op:
+        batch_op.drop_index('ix_data_entries_user_id_date')
+        batch_op.drop_index('ix_data_entries_location_id_date')
@@ -0,0 +1,111 @@
+"""Add conversation_participants table
+
+Revision ID: 7a4d2c9e1b63
+Revises: 5c3e8f1a9d27
+Create Date: 2026-10-18 11:05:27.318402
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a4d2c9e1b63'
+down_revision = '5c3e8f1a9d27'
+branch_labels = None
+depends_on = None
+
+GLOBAL_GROUP_TITLE = 'Groupe Global des Team Leads'
+
+locations = sa.table('locations', sa.column('id'), sa.column('type'), sa.column('parent_id'))
+users = sa.table('users', sa.column('id'), sa.column('role'), sa.column('location_id'))
+conversations = sa.table('conversations', sa.column('id'), sa.column('type'), sa.column('location_id'), sa.column('title'))
+messages = sa.table('messages', sa.column('conversation_id'), sa.column('sender_id'))
+
+
+def upgrade():
+    participants = op.create_table(
+        'conversation_participants',
+        sa.Column('conversation_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('joined_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['conversation_id'], ['conversations.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('conversation_id', 'user_id')
+    )
+    with op.batch_alter_table('conversation_participants', schema=None) as batch_op:
+        batch_op.create_index('ix_conversation_participants_user_id', ['user_id'], unique=False)
+
+    rows = _backfill_rows(op.get_bind())
+    if rows:
+        op.bulk_insert(participants, rows)
+
+
+def downgrade():
+    with op.batch_alter_table('conversation_participants', schema=None) as batch_op:
+        batch_op.drop_index('ix_conversation_participants_user_id')
+
+    op.drop_table('conversation_participants')
+
+
+def _backfill_rows(connection):
+    """Reproduit les règles d'accès calculées jusqu'ici à chaque lecture de conversation."""
+    location_rows = {row.id: row for row in connection.execute(sa.select(locations))}
+    user_rows = {row.id: row for row in connection.execute(sa.select(users))}
+    by_role = {}
+    for user in user_rows.values():
+        by_role.setdefault(user.role, []).append(user)
+
+    def region_of(location_id):
+        location = location_rows.get(location_id)
+        if location is None or location.type != 'DIS':
+            return None
+        parent = location_rows.get(location.parent_id)
+        return parent.id if parent is not None and parent.type == 'REG' else None
+
+    def regional_members(region_id):
+        members = {user.id for user in by_role.get('data_viewer', [])}
+        members |= {user.id for user in by_role.get('team_lead', []) if user.location_id == region_id}
+        members |= {user.id for user in by_role.get('data_entry', []) if region_of(user.location_id) == region_id}
+        return members
+
+    senders = {}
+    for conversation_id, sender_id in connection.execute(
+            sa.select(messages.c.conversation_id, messages.c.sender_id).distinct()):
+        senders.setdefault(conversation_id, set()).add(sender_id)
+
+    now = datetime.utcnow()
+    rows = []
+    for conversation in connection.execute(sa.select(conversations)):
+        members = set()
+        if conversation.type == 'private':
+            # Expéditeurs et interlocuteurs possibles de chaque expéditeur
+            for sender_id in senders.get(conversation.id, ()):
+                sender = user_rows.get(sender_id)
+                if sender is None:
+                    continue
+                members.add(sender.id)
+                if sender.role == 'data_entry':
+                    region_id = region_of(sender.location_id)
+                    members |= {user.id for user in by_role.get('team_lead', []) if user.location_id == region_id}
+                elif sender.role == 'team_lead':
+                    location = location_rows.get(sender.location_id)
+                    if location is not None and location.type == 'REG':
+                        members |= {user.id for user in by_role.get('data_entry', [])
+                                    if region_of(user.location_id) == location.id}
+                    members |= {user.id for user in by_role.get('data_viewer', [])}
+                elif sender.role == 'data_viewer':
+                    members |= {user.id for user in by_role.get('team_lead', [])}
+        elif conversation.title == GLOBAL_GROUP_TITLE:
+            members = {user.id for user in user_rows.values() if user.role in ('team_lead', 'data_viewer')}
+        else:
+            region = location_rows.get(conversation.location_id)
+            if region is not None and region.type == 'REG':
+                members = regional_members(region.id)
+        rows.extend(
+            {'conversation_id': conversation.id, 'user_id': user_id, 'joined_at': now}
+            for user_id in sorted(members)
+        )
+    return rows
@@ -0,0 +1,34 @@
+"""Add last_message_id to conversations
+
+Revision ID: 8d1f4b6c2e57
+Revises: 3e9b7d2f6a18
+Create Date: 2026-10-18 22:41:19.560833
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d1f4b6c2e57'
+down_revision = '3e9b7d2f6a18'
+branch_labels = None
+depends_on = None
+
+conversations = sa.table('conversations', sa.column('id'), sa.column('last_message_id'))
+messages = sa.table('messages', sa.column('id'), sa.column('conversation_id'), sa.column('timestamp'))
+
+
+def upgrade():
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_message_id', sa.Integer(), nullable=True))
+
+    # Même ordre que la boîte de réception : (timestamp, id) le plus récent
+    op.execute(conversations.update().values(last_message_id=sa.select(messages.c.id).where(
+        messages.c.conversation_id == conversations.c.id
+    ).order_by(messages.c.timestamp.desc(), messages.c.id.desc()).limit(1).scalar_subquery()))
+
+
+def downgrade():
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.drop_column('last_message_id')
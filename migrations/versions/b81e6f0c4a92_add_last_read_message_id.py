@@ -0,0 +1,47 @@
+"""Add last_read_message_id to conversation_participants
+
+Revision ID: b81e6f0c4a92
+Revises: 7a4d2c9e1b63
+Create Date: 2026-10-18 14:22:09.671530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81e6f0c4a92'
+down_revision = '7a4d2c9e1b63'
+branch_labels = None
+depends_on = None
+
+participants = sa.table(
+    'conversation_participants',
+    sa.column('conversation_id'), sa.column('user_id'), sa.column('last_read_message_id')
+)
+messages = sa.table('messages', sa.column('id'), sa.column('conversation_id'))
+notifications = sa.table('notifications', sa.column('user_id'), sa.column('message_id'), sa.column('read'))
+
+
+def upgrade():
+    with op.batch_alter_table('conversation_participants', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_read_message_id', sa.Integer(), nullable=True))
+
+    # Dernier message lu : juste avant la plus ancienne notification non lue du membre,
+    # sinon le dernier message de la conversation
+    first_unread = sa.select(sa.func.min(messages.c.id) - 1).select_from(
+        messages.join(notifications, notifications.c.message_id == messages.c.id)
+    ).where(
+        messages.c.conversation_id == participants.c.conversation_id,
+        notifications.c.user_id == participants.c.user_id,
+        notifications.c.read == sa.false()
+    ).scalar_subquery()
+    last_message = sa.select(sa.func.max(messages.c.id)).where(
+        messages.c.conversation_id == participants.c.conversation_id
+    ).scalar_subquery()
+    op.execute(participants.update().values(last_read_message_id=sa.func.coalesce(first_unread, last_message)))
+
+
+def downgrade():
+    with op.batch_alter_table('conversation_participants', schema=None) as batch_op:
+        batch_op.drop_column('last_read_message_id')
@@ -0,0 +1,28 @@
+"""Add thumbnail_path and preview_path to messages
+
+Revision ID: d4e1f6a2b957
+Revises: c5d2a7f9e013
+Create Date: 2026-10-18 18:31:12.540829
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4e1f6a2b957'
+down_revision = 'c5d2a7f9e013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('thumbnail_path', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('preview_path', sa.String(length=255), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_column('preview_path')
+        batch_op.drop_column('thumbnail_path')
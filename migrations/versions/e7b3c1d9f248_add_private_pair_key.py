@@ -0,0 +1,159 @@
+"""Add canonical pair key to private conversations
+
+Revision ID: e7b3c1d9f248
+Revises: d4e1f6a2b957
+Create Date: 2026-10-18 19:04:37.218406
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b3c1d9f248'
+down_revision = 'd4e1f6a2b957'
+branch_labels = None
+depends_on = None
+
+conversations = sa.table(
+    'conversations', sa.column('id'), sa.column('type'), sa.column('user_low_id'), sa.column('user_high_id')
+)
+participants = sa.table(
+    'conversation_participants', sa.column('conversation_id'), sa.column('user_id'), sa.column('joined_at'),
+    sa.column('last_read_message_id')
+)
+messages = sa.table('messages', sa.column('id'), sa.column('conversation_id'), sa.column('sender_id'))
+notifications = sa.table('notifications', sa.column('user_id'), sa.column('message_id'), sa.column('read'))
+uploads = sa.table('uploads', sa.column('conversation_id'))
+
+
+def upgrade():
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('user_low_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('user_high_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_conversations_user_low_id_users', 'users', ['user_low_id'], ['id'])
+        batch_op.create_foreign_key('fk_conversations_user_high_id_users', 'users', ['user_high_id'], ['id'])
+
+    _normalise_private_conversations(op.get_bind())
+
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.create_index('uq_conversations_private_pair', ['user_low_id', 'user_high_id'], unique=True)
+
+
+def _normalise_private_conversations(connection):
+    """
+    Ramène chaque conversation privée à sa paire et lui donne la clé canonique.
+    Le remplissage de conversation_participants a pu y ajouter tous les interlocuteurs
+    possibles des expéditeurs : la paire est déduite des expéditeurs des messages, puis des
+    destinataires de leurs notifications, à défaut des deux seuls membres. Les membres hors
+    de la paire sont retirés ; les doublons d'une même paire sont fusionnés dans la plus
+    ancienne (messages et envois déplacés). Sans paire identifiable (plus de deux
+    expéditeurs), seuls les expéditeurs restent membres et la conversation reste sans clé.
+    """
+    private_ids = connection.execute(
+        sa.select(conversations.c.id).where(conversations.c.type == 'private').order_by(conversations.c.id)
+    ).scalars().all()
+    if not private_ids:
+        return
+    private = set(private_ids)
+    members, senders, recipients = {}, {}, {}
+    for conversation_id, user_id in connection.execute(sa.select(participants.c.conversation_id, participants.c.user_id)):
+        if conversation_id in private:
+            members.setdefault(conversation_id, set()).add(user_id)
+    for conversation_id, sender_id in connection.execute(
+            sa.select(messages.c.conversation_id, messages.c.sender_id).distinct()):
+        if conversation_id in private and sender_id is not None:
+            senders.setdefault(conversation_id, set()).add(sender_id)
+    for conversation_id, sender_id, user_id in connection.execute(
+        sa.select(messages.c.conversation_id, messages.c.sender_id, notifications.c.user_id).distinct()
+        .select_from(messages.join(notifications, notifications.c.message_id == messages.c.id))
+    ):
+        if conversation_id in private and user_id != sender_id:
+            recipients.setdefault(conversation_id, set()).add(user_id)
+
+    def canonical_pair(conversation_id):
+        conversation_senders = senders.get(conversation_id, set())
+        if len(conversation_senders) == 2:
+            return tuple(sorted(conversation_senders))
+        if len(conversation_senders) == 1:
+            others = recipients.get(conversation_id, set()) - conversation_senders
+            if len(others) == 1:
+                return tuple(sorted(conversation_senders | others))
+        conversation_members = members.get(conversation_id, set())
+        if len(conversation_senders) <= 1 and len(conversation_members) == 2 \
+                and conversation_senders <= conversation_members:
+            return tuple(sorted(conversation_members))
+        return None
+
+    kept, touched = {}, set()
+    for conversation_id in private_ids:
+        pair = canonical_pair(conversation_id)
+        if pair is None:
+            expected = senders.get(conversation_id)
+            if expected and members.get(conversation_id, set()) - expected:
+                _keep_members(connection, conversation_id, members[conversation_id], expected)
+            continue
+        target = kept.setdefault(pair, conversation_id)
+        if target != conversation_id:
+            # Doublon de la paire : fusion dans la conversation la plus ancienne
+            for table in (messages, uploads):
+                connection.execute(table.update().where(table.c.conversation_id == conversation_id)
+                                   .values(conversation_id=target))
+            connection.execute(participants.delete().where(participants.c.conversation_id == conversation_id))
+            connection.execute(conversations.delete().where(conversations.c.id == conversation_id))
+            touched.add(target)
+        else:
+            connection.execute(conversations.update().where(conversations.c.id == conversation_id)
+                               .values(user_low_id=pair[0], user_high_id=pair[1]))
+            if _keep_members(connection, conversation_id, members.get(conversation_id, set()), set(pair)):
+                touched.add(conversation_id)
+    # Messages fusionnés ou membres ajoutés : dernier message lu recalculé
+    for conversation_id in sorted(touched):
+        _reset_read_markers(connection, conversation_id)
+
+
+def _keep_members(connection, conversation_id, current, expected):
+    """Retire les membres hors de expected et ajoute ceux qui manquent (retourne True si ajout)."""
+    if current - expected:
+        connection.execute(participants.delete().where(
+            participants.c.conversation_id == conversation_id,
+            participants.c.user_id.in_(sorted(current - expected))
+        ))
+    if expected - current:
+        now = datetime.utcnow()
+        connection.execute(participants.insert(), [
+            {'conversation_id': conversation_id, 'user_id': user_id, 'joined_at': now}
+            for user_id in sorted(expected - current)
+        ])
+    return bool(expected - current)
+
+
+def _reset_read_markers(connection, conversation_id):
+    """
+    Dernier message lu des membres (même règle que b81e6f0c4a92) : juste avant la plus
+    ancienne notification non lue, sinon le dernier message de la conversation.
+    """
+    first_unread = sa.select(sa.func.min(messages.c.id) - 1).select_from(
+        messages.join(notifications, notifications.c.message_id == messages.c.id)
+    ).where(
+        messages.c.conversation_id == conversation_id,
+        notifications.c.user_id == participants.c.user_id,
+        notifications.c.read == sa.false()
+    ).scalar_subquery()
+    last_message = sa.select(sa.func.max(messages.c.id)).where(
+        messages.c.conversation_id == conversation_id
+    ).scalar_subquery()
+    connection.execute(participants.update().where(participants.c.conversation_id == conversation_id).values(
+        last_read_message_id=sa.func.coalesce(first_unread, last_message)
+    ))
+
+
+def downgrade():
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.drop_index('uq_conversations_private_pair')
+        batch_op.drop_constraint('fk_conversations_user_high_id_users', type_='foreignkey')
+        batch_op.drop_constraint('fk_conversations_user_low_id_users', type_='foreignkey')
+        batch_op.drop_column('user_high_id')
+        batch_op.drop_column('user_low_id')
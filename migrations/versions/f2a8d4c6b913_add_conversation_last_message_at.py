@@ -0,0 +1,33 @@
+"""Add last_message_at to conversations
+
+Revision ID: f2a8d4c6b913
+Revises: e7b3c1d9f248
+Create Date: 2026-10-18 20:12:48.306115
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a8d4c6b913'
+down_revision = 'e7b3c1d9f248'
+branch_labels = None
+depends_on = None
+
+conversations = sa.table('conversations', sa.column('id'), sa.column('last_message_at'))
+messages = sa.table('messages', sa.column('conversation_id'), sa.column('timestamp'))
+
+
+def upgrade():
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_message_at', sa.DateTime(), nullable=True))
+
+    op.execute(conversations.update().values(last_message_at=sa.select(sa.func.max(messages.c.timestamp)).where(
+        messages.c.conversation_id == conversations.c.id
+    ).scalar_subquery()))
+
+
+def downgrade():
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.drop_column('last_message_at')
@@ -1,15 +1,10 @@
 import os
 from app import create_app
-from config import DevelopmentConfig, ProductionConfig, TestingConfig
+from config import DevelopmentConfig, config_map
 from os import environ
 
 # Choisir la configuration en fonction de FLASK_ENV
 env = environ.get('FLASK_ENV', 'development')
-config_map = {
-    'development': DevelopmentConfig,
-    'production': ProductionConfig,
-    'testing': TestingConfig
-}
 config_class = config_map.get(env, DevelopmentConfig)  # Par défaut : DevelopmentConfig
 
 # Créer l'application avec un static_folder explicite
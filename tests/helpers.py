@@ -0,0 +1,22 @@
+from app import db
+from app.models import Conversation
+from app.utils.conversations import (
+    GLOBAL_GROUP_TITLE, get_or_create_private_conversations, provision_group_conversations
+)
+
+
+def group_conversation(region):
+    """Conversation de groupe d'une région, provisionnée comme à la création de la région."""
+    provision_group_conversations([region])
+    db.session.commit()
+    return Conversation.query.filter_by(type='group', location_id=region.id).one()
+
+
+def global_team_lead_group():
+    provision_group_conversations()
+    db.session.commit()
+    return Conversation.query.filter_by(type='group', title=GLOBAL_GROUP_TITLE).one()
+
+
+def private_conversation(user1, user2):
+    return get_or_create_private_conversations(user1.id, [user2.id])[user2.id]
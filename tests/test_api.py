@@ -0,0 +1,105 @@
+from sqlalchemy import event
+
+from app import db
+from app.models import Location, User
+
+
+def _login(client, user):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+
+
+def test_location_tree_single_query_and_etag(app):
+    region = Location(code='REG1', name='Région 1', type='REG')
+    db.session.add(region)
+    db.session.flush()
+    districts = [Location(code=f'DIS{i}', name=f'District {i}', type='DIS', parent_id=region.id) for i in range(3)]
+    viewer = User(name='Viewer', matriculate='VIEW001', phone='90000001', password='x', role='data_viewer')
+    lead = User(name='Chef', matriculate='TL001', phone='90000002', password='x', role='team_lead',
+                location_id=region.id)
+    db.session.add_all(districts + [viewer, lead])
+    db.session.commit()
+
+    client = app.test_client()
+    _login(client, viewer)
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        response = client.get('/api/locations')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+    assert response.status_code == 200
+    assert len([s for s in statements if 'FROM locations' in s]) == 1
+    tree = response.get_json()
+    assert [node['code'] for node in tree] == ['REG1']
+    assert tree[0]['team_lead'] == 'Chef'
+    assert [child['code'] for child in tree[0]['children']] == ['DIS0', 'DIS1', 'DIS2']
+
+    etag = response.headers['ETag']
+    cached = client.get('/api/locations', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.data == b''
+
+    db.session.add(Location(code='DIS9', name='District 9', type='DIS', parent_id=region.id))
+    db.session.commit()
+    changed = client.get('/api/locations', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+
+def test_new_and_promoted_regions_get_their_group_conversation(app):
+    from flask import g
+    from app.models import Conversation
+    from app.utils.conversations import participant_ids
+
+    district = Location(code='DIS1', name='District 1', type='DIS')
+    viewer = User(name='Viewer', matriculate='VIEW001', phone='90000001', password='x', role='data_viewer')
+    db.session.add_all([district, viewer])
+    db.session.commit()
+    app.config['WTF_CSRF_ENABLED'] = False
+    client = app.test_client()
+    _login(client, viewer)
+
+    created = client.post('/api/locations', json={'code': 'REG1', 'name': 'Région 1', 'type': 'REG'})
+    assert created.status_code == 201
+    client.put(f'/api/locations/{district.id}', json={'type': 'REG'})
+    g.pop('_login_user', None)  # le contexte d'application du test est partagé avec le client
+
+    for location_id in (created.get_json()['id'], district.id):
+        group = Conversation.query.filter_by(type='group', location_id=location_id).one()
+        assert participant_ids(group.id) == {viewer.id}
+
+
+def test_location_writes_need_a_data_viewer_and_a_csrf_token(app):
+    from flask import g
+
+    region = Location(code='REG1', name='Région 1', type='REG')
+    db.session.add(region)
+    db.session.flush()
+    district = Location(code='DIS1', name='District 1', type='DIS', parent_id=region.id)
+    empty = Location(code='REG2', name='Région 2', type='REG')
+    viewer = User(name='Viewer', matriculate='VIEW001', phone='90000001', password='x', role='data_viewer')
+    lead = User(name='Chef', matriculate='TL001', phone='90000002', password='x', role='team_lead',
+                location_id=region.id)
+    db.session.add_all([district, empty, viewer, lead])
+    db.session.commit()
+
+    lead_client = app.test_client()
+    _login(lead_client, lead)
+    assert lead_client.delete(f'/api/locations/{empty.id}').status_code == 403
+    g.pop('_login_user', None)  # le contexte d'application du test est partagé avec le client
+
+    client = app.test_client()
+    _login(client, viewer)
+    assert client.delete(f'/api/locations/{empty.id}').status_code == 400  # sans jeton CSRF
+    g.pop('_login_user', None)
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    assert client.delete(f'/api/locations/{region.id}').status_code == 400  # région avec districts
+    assert client.delete(f'/api/locations/{empty.id}').status_code == 200
+    g.pop('_login_user', None)
+    assert db.session.get(Location, empty.id) is None
@@ -0,0 +1,377 @@
+import os
+
+from flask import g
+from sqlalchemy import event, text
+
+from app import create_app, db
+from app.models import Location, User
+from app.routes.messages import can_access_conversation
+from app.utils.conversations import participant_ids, sync_user_memberships
+from config import TestingConfig
+from helpers import global_team_lead_group, group_conversation, private_conversation
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'migrations')
+
+
+def _user(name, role, location=None):
+    return User(name=name, matriculate=f'M{name}', phone=f'P{name}', password='x', role=role,
+                location_id=location.id if location else None)
+
+
+def _seed():
+    north = Location(code='NORD', name='Nord', type='REG')
+    south = Location(code='SUD', name='Sud', type='REG')
+    db.session.add_all([north, south])
+    db.session.flush()
+    district = Location(code='DIS1', name='District 1', type='DIS', parent_id=north.id)
+    db.session.add(district)
+    db.session.flush()
+    users = {
+        'entry': _user('entry', 'data_entry', district),
+        'lead': _user('lead', 'team_lead', north),
+        'other_lead': _user('other', 'team_lead', south),
+        'viewer': _user('viewer', 'data_viewer'),
+    }
+    db.session.add_all(users.values())
+    db.session.commit()
+    return north, south, users
+
+
+def test_access_check_is_a_single_lookup(app):
+    north, south, users = _seed()
+    private = private_conversation(users['entry'], users['lead'])
+    group = group_conversation(north)
+
+    assert participant_ids(private.id) == {users['entry'].id, users['lead'].id}
+    assert participant_ids(group.id) == {users['entry'].id, users['lead'].id, users['viewer'].id}
+    assert private_conversation(users['lead'], users['entry']).id == private.id
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        assert can_access_conversation(users['lead'], private)
+        assert not can_access_conversation(users['viewer'], private)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    assert len(statements) == 2
+
+
+def test_role_and_location_changes_update_group_membership(app):
+    north, south, users = _seed()
+    north_group = group_conversation(north)
+    south_group = group_conversation(south)
+    global_group = global_team_lead_group()
+    entry = users['entry']
+    assert not can_access_conversation(entry, global_group)
+
+    entry.role = 'team_lead'
+    entry.location_id = south.id
+    sync_user_memberships(entry)
+    db.session.commit()
+
+    assert not can_access_conversation(entry, north_group)
+    assert can_access_conversation(entry, south_group)
+    assert can_access_conversation(entry, global_group)
+
+
+def test_conversations_are_provisioned_on_writes_not_on_read(app):
+    from app.models import Conversation
+    from app.utils.conversations import get_private_conversations
+
+    north, south, users = _seed()
+    result = app.test_cli_runner().invoke(args=['provision-conversations'])
+    assert '3 conversations de groupe créées' in result.output
+    entry, lead, other_lead, viewer = users['entry'], users['lead'], users['other_lead'], users['viewer']
+    assert get_private_conversations(lead.id, [entry.id, viewer.id, other_lead.id]).keys() == {entry.id, viewer.id}
+    assert get_private_conversations(viewer.id, [lead.id, other_lead.id]).keys() == {lead.id, other_lead.id}
+
+    # Promotion : conversation privée avec les data_viewers et groupe de la nouvelle région
+    entry.role = 'team_lead'
+    entry.location_id = south.id
+    sync_user_memberships(entry)
+    db.session.commit()
+    assert viewer.id in get_private_conversations(entry.id, [viewer.id])
+    assert can_access_conversation(entry, Conversation.query.filter_by(location_id=south.id).one())
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(lead.id)
+    conversation_count = Conversation.query.count()
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        assert client.get('/messages').status_code == 200
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    g.pop('_login_user', None)
+    assert not [statement for statement in statements if not statement.lstrip().upper().startswith('SELECT')]
+    assert Conversation.query.count() == conversation_count
+
+
+def test_migration_backfills_participants(tmp_path):
+    from flask_migrate import upgrade
+
+    class MigrationConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'migrations.db'}"
+
+    app = create_app(MigrationConfig)
+    with app.app_context():
+        upgrade(directory=MIGRATIONS_DIR, revision='5c3e8f1a9d27')
+        statements = [
+            "INSERT INTO locations (id, code, name, type) VALUES (1, 'NORD', 'Nord', 'REG')",
+            "INSERT INTO locations (id, code, name, type, parent_id) VALUES (2, 'DIS1', 'District 1', 'DIS', 1)",
+            "INSERT INTO users (id, name, matriculate, phone, password, role, location_id) VALUES "
+            "(1, 'entry', 'M1', 'P1', 'x', 'data_entry', 2), (2, 'lead', 'M2', 'P2', 'x', 'team_lead', 1), "
+            "(3, 'viewer', 'M3', 'P3', 'x', 'data_viewer', NULL)",
+            "INSERT INTO conversations (id, type) VALUES (1, 'private')",
+            "INSERT INTO conversations (id, type, location_id) VALUES (2, 'group', 1)",
+            "INSERT INTO messages (id, conversation_id, sender_id, content) VALUES (1, 1, 1, 'Bonjour')",
+            "INSERT INTO notifications (user_id, message_id, notification_message, read) VALUES (2, 1, 'n', 0)",
+        ]
+        for statement in statements:
+            db.session.execute(text(statement))
+        db.session.commit()
+
+        upgrade(directory=MIGRATIONS_DIR)
+        rows = db.session.execute(text(
+            'SELECT conversation_id, user_id, last_read_message_id FROM conversation_participants '
+            'ORDER BY conversation_id, user_id'
+        )).all()
+        assert [tuple(row) for row in rows] == [(1, 1, 1), (1, 2, 0), (2, 1, None), (2, 2, None), (2, 3, None)]
+        keys = db.session.execute(text(
+            'SELECT id, user_low_id, user_high_id, last_message_id FROM conversations ORDER BY id'
+        )).all()
+        assert [tuple(row) for row in keys] == [(1, 1, 2, 1), (2, None, None, None)]
+
+
+def test_migration_reduces_legacy_private_conversations_to_their_pair(tmp_path):
+    from flask_migrate import upgrade
+
+    class MigrationConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'legacy.db'}"
+
+    app = create_app(MigrationConfig)
+    with app.app_context():
+        upgrade(directory=MIGRATIONS_DIR, revision='5c3e8f1a9d27')
+        statements = [
+            "INSERT INTO locations (id, code, name, type) VALUES (1, 'NORD', 'Nord', 'REG')",
+            "INSERT INTO locations (id, code, name, type, parent_id) VALUES (2, 'DIS1', 'District 1', 'DIS', 1)",
+            "INSERT INTO users (id, name, matriculate, phone, password, role, location_id) VALUES "
+            "(1, 'entry', 'M1', 'P1', 'x', 'data_entry', 2), (2, 'lead', 'M2', 'P2', 'x', 'team_lead', 1), "
+            "(3, 'viewer', 'M3', 'P3', 'x', 'data_viewer', NULL)",
+            "INSERT INTO conversations (id, type) VALUES (1, 'private'), (2, 'private'), (3, 'private'), (4, 'private')",
+            # 1 : entry → lead ; 2 : lead → viewer (notification) ; 3 : doublon de 1 ; 4 : lead seul
+            "INSERT INTO messages (id, conversation_id, sender_id, content) VALUES "
+            "(1, 1, 1, 'a'), (2, 2, 2, 'b'), (3, 3, 1, 'c'), (4, 4, 2, 'd')",
+            "INSERT INTO notifications (user_id, message_id, notification_message, read) VALUES "
+            "(2, 1, 'n', 1), (3, 2, 'n', 1), (2, 3, 'n', 0)",
+        ]
+        for statement in statements:
+            db.session.execute(text(statement))
+        db.session.commit()
+
+        upgrade(directory=MIGRATIONS_DIR)
+        rows = db.session.execute(text(
+            'SELECT conversation_id, user_id FROM conversation_participants ORDER BY conversation_id, user_id'
+        )).all()
+        assert [tuple(row) for row in rows] == [(1, 1), (1, 2), (2, 2), (2, 3), (4, 2)]
+        keys = db.session.execute(text('SELECT id, user_low_id, user_high_id FROM conversations ORDER BY id')).all()
+        assert [tuple(row) for row in keys] == [(1, 1, 2), (2, 2, 3), (4, None, None)]
+        moved = db.session.execute(text('SELECT id, conversation_id FROM messages ORDER BY id')).all()
+        assert [tuple(row) for row in moved] == [(1, 1), (2, 2), (3, 1), (4, 4)]
+        # Message fusionné non lu (notification non lue) : le dernier lu du lead le précède
+        marker = db.session.execute(text(
+            'SELECT last_read_message_id FROM conversation_participants WHERE conversation_id = 1 AND user_id = 2'
+        )).scalar()
+        assert marker == 2
+
+
+def test_private_conversations_are_keyed_by_pair(app):
+    from sqlalchemy.exc import IntegrityError
+
+    from app.models import Conversation, Message
+    from app.utils.conversations import get_or_create_private_conversations, get_private_conversations
+
+    north, south, users = _seed()
+    entry, lead, viewer = users['entry'], users['lead'], users['viewer']
+    private = private_conversation(lead, entry)
+    assert (private.user_low_id, private.user_high_id) == (entry.id, lead.id)
+    assert Message.query.count() == 0
+
+    # Une seule conversation par paire, quel que soit l'ordre des membres
+    duplicate = Conversation(type='private', user_low_id=entry.id, user_high_id=lead.id)
+    db.session.add(duplicate)
+    try:
+        db.session.commit()
+        assert False, "doublon accepté"
+    except IntegrityError:
+        db.session.rollback()
+    entry_id, lead_id, viewer_id, private_id = entry.id, lead.id, viewer.id, private.id
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        found = get_private_conversations(lead_id, [entry_id, viewer_id])
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    assert len(statements) == 1
+    assert {other_id: conversation.id for other_id, conversation in found.items()} == {entry_id: private_id}
+
+    conversations = get_or_create_private_conversations(lead_id, [entry_id, viewer_id])
+    assert conversations[entry_id].id == private_id
+    assert participant_ids(conversations[viewer_id].id) == {lead_id, viewer_id}
+    assert Conversation.query.filter_by(type='private').count() == 2
+
+
+def test_inbox_uses_a_constant_number_of_queries(app):
+    from datetime import datetime, timedelta
+
+    from app.models import Message, Notification
+    from app.utils.inbox import get_inbox
+
+    north, south, users = _seed()
+    lead = users['lead']
+    partners = [_user(f'entry{i}', 'data_entry') for i in range(6)]
+    db.session.add_all(partners)
+    db.session.commit()
+    start = datetime.utcnow() + timedelta(days=1)
+    for i, partner in enumerate(partners):
+        conversation = private_conversation(lead, partner)
+        message = Message(conversation_id=conversation.id, sender_id=partner.id, content=f'message {i}',
+                          timestamp=start + timedelta(hours=i))
+        db.session.add(message)
+        db.session.flush()
+        db.session.add(Notification(user_id=lead.id, message_id=message.id, notification_message='n'))
+    db.session.commit()
+    db.session.refresh(lead)
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        pagination, data = get_inbox(lead, page=1, per_page=4)
+        names = [item['other_user'].name for item in data]
+        contents = [item['last_message'].content for item in data]
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+    assert pagination.total == 6
+    assert names == ['entry5', 'entry4', 'entry3', 'entry2']
+    assert contents == ['message 5', 'message 4', 'message 3', 'message 2']
+    assert [item['unread_count'] for item in data] == [1, 1, 1, 1]
+    assert len(statements) == 5
+    # Tri sur l'horodatage tenu par conversation : aucun agrégat sur toute la table messages
+    assert not any('max(messages.timestamp)' in statement for statement in statements)
+    assert not any('row_number' in statement for statement in statements)
+    assert data[0]['conversation'].last_message_at == start + timedelta(hours=5)
+
+
+def test_conversation_pages_older_messages_by_cursor(app):
+    from datetime import datetime, timedelta
+
+    from app.models import Message
+    from app.utils.conversations import decode_cursor, get_message_page
+
+    north, south, users = _seed()
+    group = group_conversation(north)
+    start = datetime(2025, 1, 1)
+    # Deux messages partagent le même horodatage : l'id départage la clé
+    db.session.add_all([
+        Message(conversation_id=group.id, sender_id=users['entry'].id, content=f'message {i}',
+                timestamp=start + timedelta(minutes=i // 2 * 2))
+        for i in range(7)
+    ])
+    db.session.commit()
+
+    pages = []
+    cursor = None
+    while True:
+        messages, older = get_message_page(group.id, before=decode_cursor(cursor) if cursor else None, limit=3)
+        pages.append([message.content for message in messages])
+        if older is None:
+            break
+        cursor = older
+    assert pages == [
+        ['message 4', 'message 5', 'message 6'],
+        ['message 1', 'message 2', 'message 3'],
+        ['message 0'],
+    ]
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(users['viewer'].id)
+    first = client.get(f'/conversation/{group.id}/messages?limit=5').get_json()
+    assert [message['content'] for message in first['messages']] == [f'message {i}' for i in range(2, 7)]
+    assert first['messages'][0]['sender'] == 'District District 1'
+    older = client.get(f"/conversation/{group.id}/messages?before={first['next_cursor']}").get_json()
+    assert [message['content'] for message in older['messages']] == ['message 0', 'message 1']
+    assert older['next_cursor'] is None
+
+
+def test_mark_read_up_to_a_message(app):
+    from datetime import datetime, timedelta
+
+    from app.models import Message, Notification
+
+    north, south, users = _seed()
+    private = private_conversation(users['lead'], users['entry'])
+    start = datetime.utcnow() + timedelta(days=1)
+    messages = [
+        Message(conversation_id=private.id, sender_id=users['entry'].id, content=f'message {i}',
+                timestamp=start + timedelta(minutes=i), read=False)
+        for i in range(4)
+    ]
+    db.session.add_all(messages)
+    db.session.flush()
+    db.session.add_all([
+        Notification(user_id=users['lead'].id, message_id=message.id, notification_message='n', read=False)
+        for message in messages
+    ])
+    db.session.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(users['lead'].id)
+    response = client.post(f'/conversation/{private.id}/read', json={'up_to': messages[1].id})
+
+    assert response.get_json() == {'updated': 2}
+    read_flags = dict(db.session.execute(
+        db.select(Message.content, Message.read).where(Message.conversation_id == private.id)
+    ).all())
+    assert read_flags['message 1'] and not read_flags['message 2']
+    unread = Notification.query.filter_by(user_id=users['lead'].id, read=False).count()
+    assert unread == 2
+    assert client.post(f'/conversation/{private.id}/read', json={'up_to': 'x'}).status_code == 400
+
+
+def test_group_messages_are_counted_on_read(app):
+    from app.models import Message, Notification
+    from app.utils.conversations import unread_counts
+
+    north, south, users = _seed()
+    group = group_conversation(north)
+    private = private_conversation(users['entry'], users['lead'])
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(users['entry'].id)
+    for i in range(3):
+        client.post('/send', data={'conversation_id': group.id, 'content': f'groupe {i}'})
+    client.post('/send', data={'conversation_id': private.id, 'content': 'direct'})
+
+    # Aucune notification par destinataire pour le groupe, une seule pour le message direct
+    assert Notification.query.count() == 1
+    assert unread_counts(users['lead'].id) == {group.id: 3, private.id: 1}
+    assert unread_counts(users['viewer'].id) == {group.id: 3}
+    assert unread_counts(users['entry'].id) == {}
+
+    with client.session_transaction() as session:
+        session['_user_id'] = str(users['viewer'].id)
+    g.pop('_login_user', None)  # le contexte d'application du test est partagé avec le client
+    second = Message.query.filter_by(conversation_id=group.id, content='groupe 1').one()
+    client.post(f'/conversation/{group.id}/read', json={'up_to': second.id})
+    assert unread_counts(users['viewer'].id) == {group.id: 1}
+    assert unread_counts(users['lead'].id)[group.id] == 3
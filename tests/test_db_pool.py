@@ -0,0 +1,86 @@
+import threading
+
+from flask import g
+
+from app import create_app, db
+from app.models import User
+from app.utils.db_pool import InstrumentedQueuePool, _limit_statement_time, pool_status
+from config import TestingConfig, engine_options
+
+
+def test_engine_options_come_from_the_environment(monkeypatch):
+    assert engine_options('sqlite:///:memory:') == {}
+
+    monkeypatch.setenv('DB_POOL_SIZE', '3')
+    monkeypatch.setenv('DB_POOL_PRE_PING', 'false')
+    options = engine_options('postgresql://db/app', max_overflow=20)
+    assert options['pool_size'] == 3
+    assert options['max_overflow'] == 20
+    assert options['pool_pre_ping'] is False
+    # Pas de statement_timeout à la connexion : il toucherait aussi migrations, CLI et workers
+    assert 'connect_args' not in options
+
+
+def test_statement_timeout_only_applies_to_web_requests(app):
+    class PostgresConnection:
+        class dialect:
+            name = 'postgresql'
+
+        def __init__(self):
+            self.statements = []
+
+        def exec_driver_sql(self, statement):
+            self.statements.append(statement)
+
+    app.config['DB_STATEMENT_TIMEOUT'] = 5000
+    outside = PostgresConnection()
+    _limit_statement_time(db.session, None, outside)
+    assert outside.statements == []
+
+    inside = PostgresConnection()
+    with app.test_request_context('/'):
+        _limit_statement_time(db.session, None, inside)
+    assert inside.statements == ['SET LOCAL statement_timeout = 5000']
+
+
+def test_pool_reports_checkout_waits_and_saturation(tmp_path):
+    class PoolConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'pool.db'}"
+        SQLALCHEMY_ENGINE_OPTIONS = {'pool_size': 1, 'max_overflow': 0, 'pool_timeout': 5}
+
+    app = create_app(PoolConfig)
+    with app.app_context():
+        db.create_all()
+        viewer = User(name='Viewer', matriculate='V1', phone='P1', password='x', role='data_viewer')
+        db.session.add(viewer)
+        db.session.commit()
+        viewer_id = viewer.id
+        db.session.remove()
+        assert isinstance(db.engine.pool, InstrumentedQueuePool)
+
+        # Pool saturé : la seconde prise de connexion attend la libération de la première
+        held = db.engine.connect()
+        assert pool_status(db.engine)['saturation'] == 1.0
+        release = threading.Timer(0.05, held.close)
+        release.start()
+        db.engine.connect().close()
+        release.join()
+
+        status = pool_status(db.engine)
+        assert status['checked_out'] == 0
+        assert status['slow_checkouts'] == 1
+        assert status['wait_max_ms'] >= 40
+        assert status['peak_checked_out'] == 1
+
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(viewer_id)
+        response = client.get('/api/metrics/db-pool')
+        g.pop('_login_user', None)  # le contexte d'application du test est partagé avec le client
+        assert response.status_code == 200
+        assert response.json['primary']['size'] == 1
+        assert response.json['primary']['slow_checkouts'] == 1
+        assert response.json['replica'] is None
+
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+from app import db
+from app.models import DataEntry, Location, User
+from app.utils import exports
+from app.utils.exports import stream_csv
+
+
+def _login(client, user):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+
+
+def test_stream_csv_flushes_in_chunks(app, monkeypatch):
+    monkeypatch.setattr(exports, 'EXPORT_FLUSH_SIZE', 16)
+    rows = ([i, f'ligne {i}'] for i in range(10))
+
+    with app.test_request_context():
+        response = stream_csv(['Id', 'Texte'], rows, 'données.csv')
+        chunks = list(response.response)
+
+    assert response.is_streamed
+    assert len(chunks) > 1
+    content = ''.join(chunks)
+    assert content.startswith('\ufeffId,Texte\r\n0,ligne 0\r\n')
+    assert content.endswith('9,ligne 9\r\n')
+    assert "filename*=UTF-8''donn%C3%A9es.csv" in response.headers['Content-Disposition']
+
+
+def test_export_region_entries_streams_selected_columns(app):
+    region = Location(code='REG1', name='Région 1', type='REG')
+    db.session.add(region)
+    db.session.flush()
+    district = Location(code='DIS1', name='District 1', type='DIS', parent_id=region.id)
+    viewer = User(name='Viewer', matriculate='VIEW001', phone='90000001', password='x', role='data_viewer')
+    db.session.add_all([district, viewer])
+    db.session.flush()
+    db.session.add(DataEntry(
+        date=datetime(2025, 3, 2), members=6, children=1, men=2, women=3, tite=1500.0,
+        location_id=district.id, commentaire='RAS'
+    ))
+    db.session.commit()
+
+    client = app.test_client()
+    _login(client, viewer)
+    response = client.get(f'/export_region_entries/{region.id}')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines[1] == '2025-03-02,6,3,2,1,1500.0,RAS,N/A,District 1'
@@ -0,0 +1,69 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import inspect, text
+
+from app import create_app, db
+from app.models import ChangeRequest, DataEntry, Location, Message, Notification, PerformanceMetric, User
+from config import TestingConfig
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'migrations')
+
+HOT_PATH_INDEXES = {
+    'data_entries': {'ix_data_entries_location_id_date', 'ix_data_entries_user_id_date'},
+    'notifications': {'ix_notifications_user_id_read_message_id'},
+    'messages': {'ix_messages_conversation_id_timestamp', 'ix_messages_conversation_id_id'},
+    'users': {'ix_users_role_location_id'},
+    'locations': {'ix_locations_parent_id_type'},
+    'change_requests': {'ix_change_requests_status_target_district_id'},
+    'performance_metrics': {'ix_performance_metrics_region_id_created_at'},
+}
+
+
+def _query_plan(query):
+    """Retourne le plan d'exécution d'une requête (SQLite ou PostgreSQL)."""
+    statement = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    with db.engine.connect() as connection:
+        if db.engine.dialect.name == 'sqlite':
+            rows = connection.execute(text(f'EXPLAIN QUERY PLAN {statement}')).all()
+            return ' '.join(row[-1] for row in rows)
+        connection.execute(text('SET enable_seqscan = off'))
+        rows = connection.execute(text(f'EXPLAIN {statement}')).all()
+        return ' '.join(row[0] for row in rows)
+
+
+@pytest.mark.parametrize('name, build_query', [
+    ('ix_data_entries_location_id_date', lambda: DataEntry.query.filter(
+        DataEntry.location_id.in_([1, 2]), DataEntry.date >= datetime(2025, 1, 1))),
+    ('ix_data_entries_user_id_date', lambda: DataEntry.query.filter_by(user_id=1).order_by(DataEntry.date.desc())),
+    ('ix_notifications_user_id_read_message_id', lambda: Notification.query.filter_by(user_id=1, read=False).filter(
+        Notification.message_id.isnot(None))),
+    ('ix_messages_conversation_id_timestamp', lambda: Message.query.filter_by(conversation_id=1).order_by(
+        Message.timestamp.desc())),
+    ('ix_messages_conversation_id_id', lambda: Message.query.filter(
+        Message.conversation_id == 1, Message.id > 10)),
+    ('ix_users_role_location_id', lambda: User.query.filter_by(role='team_lead', location_id=1)),
+    ('ix_locations_parent_id_type', lambda: Location.query.filter_by(parent_id=1, type='DIS')),
+    ('ix_change_requests_status_target_district_id', lambda: ChangeRequest.query.filter(
+        ChangeRequest.status == 'pending_team_lead', ChangeRequest.target_district_id.in_([1, 2]))),
+    ('ix_performance_metrics_region_id_created_at', lambda: PerformanceMetric.query.filter(
+        PerformanceMetric.region_id.in_([1, 2]),
+        PerformanceMetric.created_at >= datetime.utcnow() - timedelta(hours=1))),
+])
+def test_dashboard_queries_use_indexes(app, name, build_query):
+    assert name in _query_plan(build_query())
+
+
+def test_migration_creates_hot_path_indexes(tmp_path):
+    from flask_migrate import upgrade
+
+    class MigrationConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'migrations.db'}"
+
+    app = create_app(MigrationConfig)
+    with app.app_context():
+        upgrade(directory=MIGRATIONS_DIR)
+        inspector = inspect(db.engine)
+        for table, expected in HOT_PATH_INDEXES.items():
+            assert expected <= {index['name'] for index in inspector.get_indexes(table)}
@@ -0,0 +1,75 @@
+from sqlalchemy import event
+
+from app import db
+from app.models import Location, LocationTreeVersion
+from app.utils import locations
+
+
+def _count_queries():
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    return statements
+
+
+def test_hierarchy_is_served_from_memory(app):
+    region = Location(code='REG1', name='Région 1', type='REG')
+    db.session.add(region)
+    db.session.flush()
+    db.session.add_all([
+        Location(code='DIS1', name='District 1', type='DIS', parent_id=region.id),
+        Location(code='DIS2', name='District 2', type='DIS', parent_id=region.id),
+    ])
+    db.session.commit()
+
+    assert [node.code for node in locations.get_districts(region.id)] == ['DIS1', 'DIS2']
+    statements = _count_queries()
+    district_id = locations.get_location_id_by_code('DIS2')
+    assert locations.get_region_id(district_id) == region.id
+    assert locations.get_region_location_ids(region.id) == locations.get_district_ids(region.id) + [region.id]
+    assert [node.id for node in locations.get_regions()] == [region.id]
+    assert statements == []
+
+
+def test_moves_and_promotions_invalidate_the_index(app):
+    region = Location(code='REG1', name='Région 1', type='REG')
+    db.session.add(region)
+    db.session.flush()
+    district = Location(code='DIS1', name='District 1', type='DIS', parent_id=region.id)
+    other = Location(code='DIS2', name='District 2', type='DIS', parent_id=region.id)
+    db.session.add_all([district, other])
+    db.session.commit()
+    assert locations.get_district_ids(region.id) == [district.id, other.id]
+
+    # Promotion d'un district en région (comme promote_district)
+    district.type = 'REG'
+    district.parent_id = None
+    other.parent_id = district.id
+    db.session.commit()
+
+    assert locations.get_district_ids(region.id) == []
+    assert locations.get_district_ids(district.id) == [other.id]
+    assert {node.id for node in locations.get_regions()} == {region.id, district.id}
+
+    # Une modification annulée ne laisse pas d'état non validé dans l'index
+    other.parent_id = region.id
+    db.session.flush()
+    db.session.rollback()
+    assert locations.get_district_ids(district.id) == [other.id]
+
+
+def test_changes_from_another_process_are_seen_through_the_shared_version(app):
+    region = Location(code='REG1', name='Région 1', type='REG')
+    db.session.add(region)
+    db.session.commit()
+    assert [node.code for node in locations.get_regions()] == ['REG1']
+
+    # Autre processus : écriture directe, sans passer par les événements de cette session
+    with db.engine.begin() as connection:
+        connection.execute(Location.__table__.insert().values(code='REG2', name='Région 2', type='REG'))
+        connection.execute(LocationTreeVersion.__table__.update().values(version=LocationTreeVersion.version + 1))
+    assert [node.code for node in locations.get_regions()] == ['REG1']  # dans l'intervalle de vérification
+
+    app.extensions['location_index'].checked_at -= app.config['LOCATION_VERSION_CHECK_INTERVAL']
+    assert [node.code for node in locations.get_regions()] == ['REG1', 'REG2']
+    # Validations et écritures lisent la base, sans attendre l'index
+    assert locations.load_location(locations.get_location_id_by_code('REG2')).type == 'REG'
@@ -0,0 +1,59 @@
+from sqlalchemy import event
+
+from app import db
+from app.models import Notification, User
+from app.utils.notifications import notification_row, notify
+
+
+def _users(count):
+    users = [User(name=f'user{i}', matriculate=f'M{i:04d}', phone=f'P{i:04d}', password='x', role='data_entry')
+             for i in range(count)]
+    db.session.add_all(users)
+    db.session.commit()
+    return [user.id for user in users]
+
+
+def test_notify_inserts_in_one_statement(app):
+    user_ids = _users(25)
+
+    inserts = []
+    listener = lambda conn, cursor, statement, *args: inserts.append(statement) if statement.startswith('INSERT') else None
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        notify(notification_row(user_id, 'Bonjour') for user_id in user_ids)
+        db.session.commit()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+    assert len(inserts) == 1
+    assert Notification.query.filter_by(notification_message='Bonjour', read=False).count() == 25
+
+
+def test_deferred_notifications_are_written_after_commit(app):
+    user_ids = _users(3)
+
+    notify([notification_row(user_id, 'Différée') for user_id in user_ids], defer=True)
+    assert db.session.info['deferred_notifications']
+    assert Notification.query.count() == 0
+
+    # La tâche Celery (exécutée immédiatement en test) écrit la file après le commit
+    db.session.commit()
+    assert Notification.query.filter_by(notification_message='Différée').count() == 3
+
+    notify([notification_row(user_ids[0], 'Annulée')], defer=True)
+    db.session.rollback()
+    db.session.commit()
+    assert Notification.query.filter_by(notification_message='Annulée').count() == 0
+
+
+def test_deferred_notifications_fall_back_to_a_direct_insert(app, monkeypatch):
+    from app.tasks import persist_notifications
+
+    def broker_down(*args, **kwargs):
+        raise ConnectionError('broker injoignable')
+    monkeypatch.setattr(persist_notifications, 'delay', broker_down)
+    user_ids = _users(2)
+
+    notify([notification_row(user_id, 'Secours') for user_id in user_ids], defer=True)
+    db.session.commit()
+    assert Notification.query.filter_by(notification_message='Secours').count() == 2
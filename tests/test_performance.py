@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+
+from app import create_app, db
+from app.models import DataEntry, Location, PerformanceMetric
+from app.utils.performance import (
+    calculate_regional_performance, calculate_regions_performance,
+    get_regional_performance, refresh_performance_snapshots
+)
+
+
+def _entry(location, tite, men, women, commentaire=None, days_ago=1):
+    return DataEntry(
+        date=datetime.utcnow() - timedelta(days=days_ago),
+        members=men + women, children=0, men=men, women=women,
+        tite=tite, location_id=location.id, commentaire=commentaire
+    )
+
+
+def _seed_regions():
+    north = Location(code='NRD', name='Nord', type='REG')
+    south = Location(code='SUD', name='Sud', type='REG')
+    db.session.add_all([north, south])
+    db.session.flush()
+    district = Location(code='NRD01', name='Nord 1', type='DIS', parent_id=north.id)
+    db.session.add(district)
+    db.session.flush()
+    db.session.add_all([
+        _entry(district, 200_000, 100, 150, 'RAS'),
+        _entry(district, 300_000, 50, 50, '   '),
+        _entry(north, 100_000, 20, 30),
+        _entry(district, 999_999, 500, 500, 'Trop ancien', days_ago=120),
+    ])
+    db.session.commit()
+    return north, south
+
+
+def test_regions_performance_uses_grouped_aggregate(app):
+    north, south = _seed_regions()
+
+    results = calculate_regions_performance()
+
+    assert set(results) == {north.id, south.id}
+    details = results[north.id]['details']
+    assert details['tite'] == 0.6
+    assert details['members'] == (250 + 100 + 50) / 3 / 500
+    assert details['submission'] == 3 / 12
+    assert details['comments'] == 1 / 3
+    assert results[north.id]['has_report'] is True
+    assert results[south.id]['total_score'] == 0
+    assert results[south.id]['has_report'] is False
+
+
+def test_single_region_matches_batch(app):
+    north, _ = _seed_regions()
+
+    assert calculate_regional_performance(north.id) == calculate_regions_performance([north.id])[north.id]
+
+
+def test_snapshot_is_served_until_stale(app):
+    north, south = _seed_regions()
+    assert refresh_performance_snapshots() == 2
+    assert PerformanceMetric.query.count() == 2
+    # Un rafraîchissement le même jour remplace l'instantané au lieu d'en ajouter un
+    assert refresh_performance_snapshots([north.id]) == 1
+    assert PerformanceMetric.query.count() == 2
+    live = calculate_regional_performance(north.id)
+
+    # Nouvelle donnée non encore reflétée dans l'instantané
+    db.session.add(_entry(north, 500_000, 10, 10))
+    db.session.commit()
+    assert get_regional_performance(north.id) == live
+
+    # Instantané périmé : recalcul direct
+    assert get_regional_performance(north.id, max_age=-1) == calculate_regional_performance(north.id)
+    assert get_regional_performance(north.id, max_age=-1) != live
+
+
+def test_celery_job_fans_out_region_chunks(app):
+    from app.tasks import chunk_region_ids, make_celery, update_performance_metrics
+
+    make_celery(app)
+    _seed_regions()
+
+    assert chunk_region_ids([1, 2, 3], 2) == [[1, 2], [3]]
+    assert update_performance_metrics.delay(chunk_size=1).get() == 2
+    assert PerformanceMetric.query.count() == 2
+
+
+def test_production_without_a_shared_broker_runs_tasks_in_process():
+    from config import ProductionConfig
+
+    class NoBrokerConfig(ProductionConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+        CELERY_BROKER_URL = None
+
+    class MemoryBrokerConfig(NoBrokerConfig):
+        CELERY_BROKER_URL = 'memory://'
+
+    for config_class in (NoBrokerConfig, MemoryBrokerConfig):
+        app = create_app(config_class)
+        assert app.config['CELERY_TASK_ALWAYS_EAGER']
+        assert app.extensions['celery'].conf.broker_url == 'memory://'
+
+    class RedisBrokerConfig(NoBrokerConfig):
+        CELERY_BROKER_URL = 'redis://broker:6379/0'
+
+    app = create_app(RedisBrokerConfig)
+    assert not app.config['CELERY_TASK_ALWAYS_EAGER']
@@ -0,0 +1,104 @@
+import os
+
+from PIL import Image
+
+from app import db
+from app.models import Conversation, ConversationParticipant, Message, User
+from app.utils.previews import generate_previews
+from app.utils.storage import get_storage
+
+
+def _message(app, attachment_path, attachment_type):
+    user = User(name='entry', matriculate='M1', phone='P1', password='x', role='data_entry')
+    conversation = Conversation(type='private')
+    db.session.add_all([user, conversation])
+    db.session.flush()
+    message = Message(conversation_id=conversation.id, sender_id=user.id,
+                      attachment_path=attachment_path, attachment_type=attachment_type)
+    db.session.add(message)
+    db.session.commit()
+    return message
+
+
+def test_image_previews_are_resized_webp(app, tmp_path):
+    app.config.update(ATTACHMENT_STORAGE_ROOT=str(tmp_path))
+    Image.new('RGB', (3000, 2000), 'red').save(tmp_path / 'photo.jpg')
+    key = get_storage().put_file(str(tmp_path / 'photo.jpg'), 'jpg')
+    message = _message(app, key, 'image')
+
+    thumbnail, preview = generate_previews(message)
+
+    assert thumbnail == key.replace('.jpg', '_thumb.webp')
+    assert (message.thumbnail_path, message.preview_path) == (thumbnail, preview)
+    with Image.open(get_storage().local_path(thumbnail)) as image:
+        assert image.format == 'WEBP' and image.size == (320, 213)
+    with Image.open(get_storage().local_path(preview)) as image:
+        assert image.size == (1280, 853)
+
+
+def test_legacy_attachment_previews_go_to_the_store(app, tmp_path):
+    app.config.update(ATTACHMENT_STORAGE_ROOT=str(tmp_path / 'store'), UPLOAD_FOLDER=str(tmp_path))
+    Image.new('RGB', (400, 400), 'green').save(tmp_path / 'old.png')
+    message = _message(app, 'uploads/messages/old.png', 'image')
+
+    thumbnail, preview = generate_previews(message)
+    assert get_storage().exists(thumbnail) and get_storage().exists(preview)
+
+
+def test_video_without_ffmpeg_keeps_the_original(app, tmp_path):
+    app.config.update(ATTACHMENT_STORAGE_ROOT=str(tmp_path), FFMPEG_BINARY='ffmpeg-introuvable')
+    (tmp_path / 'clip.mp4').write_bytes(b'\x00' * 16)
+    message = _message(app, get_storage().put_file(str(tmp_path / 'clip.mp4'), 'mp4'), 'video')
+
+    assert generate_previews(message) is None
+    assert message.thumbnail_path is None
+
+
+def test_previews_are_generated_after_sending(app, tmp_path):
+    app.config.update(ATTACHMENT_STORAGE_ROOT=str(tmp_path / 'store'))
+    user = User(name='entry', matriculate='M1', phone='P1', password='x', role='data_entry')
+    conversation = Conversation(type='private')
+    db.session.add_all([user, conversation])
+    db.session.flush()
+    db.session.add(ConversationParticipant(conversation_id=conversation.id, user_id=user.id))
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+
+    image_path = tmp_path / 'source.png'
+    Image.new('RGB', (800, 600), 'blue').save(image_path)
+    with open(image_path, 'rb') as upload:
+        client.post('/send', data={'conversation_id': conversation.id, 'file': (upload, 'source.png')})
+
+    message = Message.query.filter_by(conversation_id=conversation.id).one()
+    assert message.attachment_type == 'image'
+    assert message.thumbnail_path.endswith('_thumb.webp')
+    assert os.path.exists(get_storage().local_path(message.thumbnail_path))
+
+
+def test_message_is_sent_when_previews_cannot_be_queued(app, tmp_path, monkeypatch):
+    from app.tasks import generate_attachment_previews
+
+    def broker_down(*args, **kwargs):
+        raise ConnectionError('broker injoignable')
+    monkeypatch.setattr(generate_attachment_previews, 'delay', broker_down)
+    app.config.update(ATTACHMENT_STORAGE_ROOT=str(tmp_path / 'store'))
+    user = User(name='entry', matriculate='M1', phone='P1', password='x', role='data_entry')
+    conversation = Conversation(type='private')
+    db.session.add_all([user, conversation])
+    db.session.flush()
+    db.session.add(ConversationParticipant(conversation_id=conversation.id, user_id=user.id))
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+
+    image_path = tmp_path / 'source.png'
+    Image.new('RGB', (80, 60), 'blue').save(image_path)
+    with open(image_path, 'rb') as upload:
+        response = client.post('/send', data={'conversation_id': conversation.id, 'file': (upload, 'source.png')})
+
+    assert response.status_code == 302
+    message = Message.query.filter_by(conversation_id=conversation.id).one()
+    assert message.attachment_type == 'image' and message.thumbnail_path is None
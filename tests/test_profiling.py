@@ -0,0 +1,82 @@
+import logging
+
+import pytest
+from flask import g
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.models import Location, User
+
+
+def _viewer_client(app):
+    region = Location(code='REG1', name='Région 1', type='REG')
+    viewer = User(name='Viewer', matriculate='V1', phone='P1', password='x', role='data_viewer')
+    db.session.add_all([region, viewer])
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(viewer.id)
+    g.pop('_login_user', None)  # le contexte d'application du test est partagé avec le client
+    return client
+
+
+def test_server_timing_reports_the_request_queries(app):
+    app.config['SERVER_TIMING'] = True
+    client = _viewer_client(app)
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        response = client.get('/api/locations')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    g.pop('_login_user', None)
+
+    assert response.status_code == 200
+    timing = response.headers['Server-Timing']
+    assert timing.startswith('db;dur=')
+    assert f'desc="{len(statements)} requêtes"' in timing
+    assert ', app;dur=' in timing
+
+
+def test_requests_over_thresholds_are_logged_with_top_statements(app, caplog, monkeypatch):
+    # fileConfig des tests de migration désactive les journaux existants
+    monkeypatch.setattr(app.logger, 'disabled', False)
+    app.config.update(SLOW_REQUEST_QUERY_COUNT=1, SLOW_QUERY_THRESHOLD_MS=0)
+    client = _viewer_client(app)
+
+    with caplog.at_level(logging.WARNING, logger=app.logger.name):
+        response = client.get('/api/locations')
+    g.pop('_login_user', None)
+
+    assert response.status_code == 200
+    assert 'Server-Timing' not in response.headers
+    slow_request = [record.getMessage() for record in caplog.records if record.getMessage().startswith('Requête lente')]
+    assert len(slow_request) == 1
+    assert 'GET /api/locations (api.get_all_locations)' in slow_request[0]
+    assert 'FROM locations' in slow_request[0]
+    assert any(record.getMessage().startswith('Requête SQL lente') for record in caplog.records)
+
+
+def test_profiling_can_be_disabled(app, caplog, monkeypatch):
+    monkeypatch.setattr(app.logger, 'disabled', False)
+    app.config.update(SQL_PROFILING=False, SERVER_TIMING=True, SLOW_REQUEST_QUERY_COUNT=0)
+    client = _viewer_client(app)
+
+    with caplog.at_level(logging.WARNING, logger=app.logger.name):
+        response = client.get('/api/locations')
+    g.pop('_login_user', None)
+
+    assert 'Server-Timing' not in response.headers
+    assert not [record for record in caplog.records if 'lente' in record.getMessage()]
+
+
+def test_failed_statements_do_not_leak_start_times(app):
+    with db.engine.connect() as connection:
+        with pytest.raises(OperationalError):
+            connection.execute(text('SELECT * FROM table_absente'))
+        assert connection.info['query_started_at'] == []
+        connection.execute(text('SELECT 1'))
+        assert connection.info['query_started_at'] == []
@@ -0,0 +1,128 @@
+from datetime import datetime
+
+from flask import g, request
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app import create_app, db
+from app.models import DataEntry, Location, User
+from app.utils import replica
+from app.utils.db_pool import InstrumentedQueuePool
+from config import TestingConfig
+
+
+def _replica_app(tmp_path):
+    class ReplicaConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'primary.db'}"
+        REPLICA_DATABASE_URL = f"sqlite:///{tmp_path / 'replica.db'}"
+
+    return create_app(ReplicaConfig)
+
+
+def replica_engine(app):
+    return app.extensions['read_replica']['engine']
+
+
+def _seed(session, comment):
+    """Mêmes identifiants sur les deux bases ; seul le commentaire distingue la réplique."""
+    region = Location(id=1, code='REG1', name='Région 1', type='REG')
+    district = Location(id=2, code='DIS1', name='District 1', type='DIS', parent_id=1)
+    viewer = User(id=1, name='Viewer', matriculate='VIEW001', phone='90000001', password='x', role='data_viewer')
+    entry = DataEntry(date=datetime(2025, 3, 2), members=6, children=1, men=2, women=3, tite=1500.0,
+                      location_id=2, commentaire=comment)
+    session.add_all([region, district, viewer, entry])
+    session.commit()
+
+
+def _export(app):
+    g.pop('_login_user', None)  # le contexte d'application du test est partagé avec le client
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+    response = client.get('/export_region_entries/1')
+    assert response.status_code == 200
+    return response.get_data(as_text=True).splitlines()[1].split(',')[6]
+
+
+def test_read_only_views_are_served_by_the_replica(tmp_path, monkeypatch):
+    app = _replica_app(tmp_path)
+    with app.app_context():
+        db.create_all()
+        db.metadata.create_all(replica_engine(app))
+        _seed(db.session, 'principal')
+        with Session(replica_engine(app)) as session:
+            _seed(session, 'réplique')
+
+        assert _export(app) == 'réplique'
+
+        # Dans une vue marquée, les écritures restent sur la base principale
+        with app.test_request_context():
+            request.environ[replica.REPLICA_ENVIRON_KEY] = True
+            assert db.session.get(DataEntry, 1).commentaire == 'réplique'
+            db.session.add(Location(code='REG2', name='Région 2', type='REG'))
+            db.session.commit()
+            db.session.remove()
+        with Session(db.engine) as primary, Session(replica_engine(app)) as secondary:
+            assert primary.query(Location).filter_by(code='REG2').count() == 1
+            assert secondary.query(Location).filter_by(code='REG2').count() == 0
+
+        # Réplique trop en retard ou injoignable : retour sur la base principale
+        monkeypatch.setattr(replica, 'measure_replica_lag', lambda engine: 120.0)
+        app.extensions['read_replica']['checked_at'] = None
+        assert _export(app) == 'principal'
+
+        def unreachable(engine):
+            raise OperationalError('SELECT 1', {}, Exception('connexion refusée'))
+        monkeypatch.setattr(replica, 'measure_replica_lag', unreachable)
+        app.extensions['read_replica']['checked_at'] = None
+        assert _export(app) == 'principal'
+
+        db.session.remove()
+        db.drop_all()
+
+
+def test_lag_is_checked_at_most_once_per_interval(tmp_path, monkeypatch):
+    app = _replica_app(tmp_path)
+    calls = []
+    monkeypatch.setattr(replica, 'measure_replica_lag', lambda engine: calls.append(engine) or 0.0)
+    with app.app_context():
+        assert replica.replica_available()
+        assert replica.replica_available()
+        assert len(calls) == 1
+        app.extensions['read_replica']['checked_at'] -= app.config['REPLICA_LAG_CHECK_INTERVAL']
+        assert replica.replica_available()
+        assert len(calls) == 2
+
+
+def test_replica_pool_is_sized_from_its_own_url(tmp_path):
+    class ReplicaConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+        REPLICA_DATABASE_URL = f"sqlite:///{tmp_path / 'replica.db'}"
+
+    app = create_app(ReplicaConfig)
+    # Primaire en mémoire sans pool : la réplique garde son propre pool instrumenté
+    assert isinstance(replica_engine(app).pool, InstrumentedQueuePool)
+
+
+def test_without_replica_everything_uses_the_primary(app):
+    assert replica_engine(app) is None
+    assert not replica.replica_available()
+
+
+def test_location_index_is_never_built_from_the_replica(tmp_path, monkeypatch):
+    from app.utils import locations
+
+    app = _replica_app(tmp_path)
+    monkeypatch.setattr(replica, 'measure_replica_lag', lambda engine: 0.0)
+    with app.app_context():
+        db.create_all()
+        db.metadata.create_all(replica_engine(app))
+        with Session(replica_engine(app)) as session:
+            session.add(Location(code='REPL', name='Réplique seule', type='REG'))
+            session.commit()
+        with app.test_request_context():
+            request.environ[replica.REPLICA_ENVIRON_KEY] = True
+            assert locations.get_location_id_by_code('REPL') is None
+            assert locations.load_location(1) is None
+        db.session.remove()
+        db.drop_all()
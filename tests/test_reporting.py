@@ -0,0 +1,48 @@
+from datetime import datetime
+
+from sqlalchemy import event
+
+from app import db
+from app.models import DataEntry, Location, User
+from app.utils.reporting import get_users_activity
+
+
+def test_users_activity_runs_a_single_query(app):
+    region = Location(code='REG1', name='Région 1', type='REG')
+    db.session.add(region)
+    db.session.flush()
+    district = Location(code='DIS1', name='District 1', type='DIS', parent_id=region.id)
+    db.session.add(district)
+    db.session.flush()
+    writer = User(name='Saisie', matriculate='DE001', phone='90000001', password='x',
+                  role='data_entry', location_id=district.id)
+    lead = User(name='Chef', matriculate='TL001', phone='90000002', password='x',
+                role='team_lead', location_id=region.id)
+    idle = User(name='Visiteur', matriculate='DV001', phone='90000003', password='x', role='data_viewer')
+    db.session.add_all([writer, lead, idle])
+    db.session.flush()
+    for day, comment in [(1, 'premier rapport'), (5, 'dernier rapport de la semaine'), (3, 'milieu')]:
+        db.session.add(DataEntry(
+            date=datetime(2025, 3, day), members=1, children=0, men=1, women=0, tite=10.0,
+            location_id=district.id, user_id=writer.id, commentaire=comment
+        ))
+    db.session.commit()
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        activity = {data['user']['name']: data for data in get_users_activity()}
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+    assert len(statements) == 1
+    assert activity['Saisie']['total_entries'] == 3
+    assert activity['Saisie']['last_comment'] == 'dernier rapport de l'
+    assert activity['Saisie']['district']['name'] == 'District 1'
+    assert activity['Saisie']['region']['name'] == 'Région 1'
+    assert activity['Chef']['district'] is None
+    assert activity['Chef']['region']['name'] == 'Région 1'
+    assert activity['Visiteur']['total_entries'] == 0
+    assert activity['Visiteur']['last_comment'] == 'Aucun'
+    assert activity['Visiteur']['region'] is None
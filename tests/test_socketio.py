@@ -0,0 +1,190 @@
+import time
+
+import pytest
+from flask import g
+from sqlalchemy import event
+from socketio import KombuManager
+
+from app import create_app, db, socketio
+from app.models import Location, User
+# Import avant toute application : les gestionnaires SocketIO du module sont alors
+# enregistrés sur chaque serveur créé par init_app
+from app.routes import messages  # noqa: F401
+from config import TestingConfig
+from helpers import group_conversation
+
+
+class MemoryQueueConfig(TestingConfig):
+    SOCKETIO_MESSAGE_QUEUE = 'memory://'
+    SOCKETIO_CHANNEL = 'test-socketio'
+
+
+@pytest.fixture
+def queued_app():
+    app = create_app(MemoryQueueConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def test_default_config_has_no_message_queue(app):
+    assert not isinstance(socketio.server.manager, KombuManager)
+
+
+def test_emit_goes_through_memory_queue(queued_app, monkeypatch):
+    manager = socketio.server.manager
+    assert isinstance(manager, KombuManager)
+    assert manager.channel == 'test-socketio'
+
+    # Le thread d'écoute de la file relaie chaque emit vers les clients locaux
+    relayed = []
+    monkeypatch.setattr(manager, '_handle_emit', relayed.append)
+    time.sleep(0.2)
+    socketio.emit('ping_queue', {'ok': True}, to='42')
+    for _ in range(50):
+        if relayed:
+            break
+        time.sleep(0.05)
+    assert relayed and relayed[0]['event'] == 'ping_queue'
+    assert relayed[0]['data'] == {'ok': True} and relayed[0]['room'] == '42'
+
+
+def test_unread_counters_are_pushed_to_the_user_room(app):
+    region = Location(code='NORD', name='Nord', type='REG')
+    db.session.add(region)
+    db.session.flush()
+    lead = User(name='lead', matriculate='M1', phone='P1', password='x', role='team_lead', location_id=region.id)
+    viewer = User(name='viewer', matriculate='M2', phone='P2', password='x', role='data_viewer')
+    db.session.add_all([lead, viewer])
+    db.session.commit()
+    group = group_conversation(region)
+
+    viewer_http = app.test_client()
+    with viewer_http.session_transaction() as session:
+        session['_user_id'] = str(viewer.id)
+    viewer_socket = socketio.test_client(app, flask_test_client=viewer_http)
+    g.pop('_login_user', None)  # le contexte d'application du test est partagé avec les clients
+    initial = [event for event in viewer_socket.get_received() if event['name'] == 'unread_counts']
+    assert initial[0]['args'][0] == {'total': 0, 'conversations': {}}
+
+    lead_http = app.test_client()
+    with lead_http.session_transaction() as session:
+        session['_user_id'] = str(lead.id)
+    for i in range(2):
+        lead_http.post('/send', data={'conversation_id': group.id, 'content': f'groupe {i}'})
+    g.pop('_login_user', None)
+    increments = [event['args'][0] for event in viewer_socket.get_received() if event['name'] == 'unread_increment']
+    assert increments == [{'conversation_id': str(group.id)}] * 2
+
+    # Reconnexion (nouvelle page) : compteur stocké, sans comptage des messages
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    second_socket = _socket(app, viewer)
+    event.remove(db.engine, 'before_cursor_execute', listener)
+    assert _events(second_socket, 'unread_counts') == [{'total': 2, 'conversations': {str(group.id): 2}}]
+    assert not any('FROM messages' in statement for statement in statements)
+    second_socket.disconnect()
+
+    viewer_http.post(f'/conversation/{group.id}/read')
+    g.pop('_login_user', None)
+    counts = [event['args'][0] for event in viewer_socket.get_received() if event['name'] == 'unread_count']
+    assert counts == [{'conversation_id': str(group.id), 'count': 0}]
+    viewer_socket.disconnect()
+
+
+def _socket(app, user):
+    http = app.test_client()
+    with http.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+    g.pop('_login_user', None)
+    client = socketio.test_client(app, flask_test_client=http)
+    g.pop('_login_user', None)
+    return client
+
+
+def _emit(client, event, data):
+    client.emit(event, data)
+    g.pop('_login_user', None)  # le contexte d'application du test est partagé avec les clients
+
+
+def _events(client, name):
+    return [event['args'][0] for event in client.get_received() if event['name'] == name]
+
+
+def test_typing_is_coalesced_and_limited_to_members(app):
+    app.config.update(TYPING_EMIT_INTERVAL=60, TYPING_TIMEOUT=60)
+    north = Location(code='NORD', name='Nord', type='REG')
+    south = Location(code='SUD', name='Sud', type='REG')
+    db.session.add_all([north, south])
+    db.session.flush()
+    lead = User(name='lead', matriculate='M1', phone='P1', password='x', role='team_lead', location_id=north.id)
+    viewer = User(name='viewer', matriculate='M2', phone='P2', password='x', role='data_viewer')
+    outsider = User(name='other', matriculate='M3', phone='P3', password='x', role='team_lead', location_id=south.id)
+    db.session.add_all([lead, viewer, outsider])
+    db.session.commit()
+    group = group_conversation(north)
+
+    lead_socket, viewer_socket, outsider_socket = (_socket(app, user) for user in (lead, viewer, outsider))
+    for client in (lead_socket, viewer_socket, outsider_socket):
+        _emit(client, 'join', {'conversation_id': str(group.id)})
+        client.get_received()
+
+    for _ in range(10):
+        _emit(lead_socket, 'typing', {'conversation_id': str(group.id)})
+    assert _events(viewer_socket, 'typing') == [
+        {'conversation_id': str(group.id), 'user_id': lead.id, 'user_name': 'lead'}
+    ]
+    assert _events(lead_socket, 'typing') == []  # pas d'écho vers l'émetteur
+    assert _events(outsider_socket, 'typing') == []  # salon refusé au non-membre
+
+    # Le non-membre ne peut pas diffuser dans la conversation
+    _emit(outsider_socket, 'typing', {'conversation_id': str(group.id)})
+    assert _events(viewer_socket, 'typing') == []
+
+    _emit(lead_socket, 'stop_typing', {'conversation_id': str(group.id)})
+    _emit(lead_socket, 'stop_typing', {'conversation_id': str(group.id)})
+    assert _events(viewer_socket, 'stop_typing') == [{'conversation_id': str(group.id), 'user_id': lead.id}]
+
+    # Arrêt automatique sans nouvelle frappe
+    app.config.update(TYPING_TIMEOUT=0.1)
+    _emit(lead_socket, 'typing', {'conversation_id': str(group.id)})
+    stops = []
+    for _ in range(40):
+        stops = _events(viewer_socket, 'stop_typing')
+        if stops:
+            break
+        time.sleep(0.05)
+    assert stops == [{'conversation_id': str(group.id), 'user_id': lead.id}]
+    for client in (lead_socket, viewer_socket, outsider_socket):
+        client.disconnect()
+
+
+def test_user_and_conversation_rooms_do_not_collide(app):
+    from app.models import Conversation, ConversationParticipant
+    from app.utils.conversations import push_unread_counts
+
+    owner = User(name='owner', matriculate='M1', phone='P1', password='x', role='data_viewer')
+    member = User(name='member', matriculate='M2', phone='P2', password='x', role='data_viewer')
+    db.session.add_all([owner, member])
+    db.session.commit()
+    # Conversation dont l'id est celui d'un autre utilisateur, dont member est membre
+    conversation = Conversation(id=owner.id, type='group', title='Même id')
+    db.session.add(conversation)
+    db.session.add(ConversationParticipant(conversation_id=conversation.id, user_id=member.id))
+    db.session.commit()
+
+    owner_socket, member_socket = _socket(app, owner), _socket(app, member)
+    _emit(member_socket, 'join', {'conversation_id': str(conversation.id)})
+    owner_socket.get_received()
+    member_socket.get_received()
+
+    push_unread_counts(owner.id)
+    push_unread_counts(owner.id, [conversation.id])
+    assert _events(member_socket, 'unread_counts') == []
+    assert _events(member_socket, 'unread_count') == []
+    assert _events(owner_socket, 'unread_counts') == [{'total': 0, 'conversations': {}}]
+    owner_socket.disconnect()
+    member_socket.disconnect()
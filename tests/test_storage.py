@@ -0,0 +1,103 @@
+import hashlib
+import io
+
+import pytest
+
+from app import db
+from app.models import User
+from app.utils.storage import AttachmentStorage, get_storage
+
+
+def _client(app, tmp_path):
+    app.config.update(ATTACHMENT_STORAGE_ROOT=str(tmp_path))
+    user = User(name='entry', matriculate='M1', phone='P1', password='x', role='data_entry')
+    db.session.add(user)
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+    return client
+
+
+def test_identical_content_is_stored_once(app, tmp_path):
+    app.config.update(ATTACHMENT_STORAGE_ROOT=str(tmp_path))
+    storage = get_storage()
+    sha256 = hashlib.sha256(b'contenu').hexdigest()
+
+    first = storage.put_stream(io.BytesIO(b'contenu'), 'TXT')
+    second = storage.put_stream(io.BytesIO(b'contenu'), 'txt')
+
+    assert first == second == f'{sha256[:2]}/{sha256[2:4]}/{sha256}.txt'
+    assert sorted(path.name for path in tmp_path.rglob('*') if path.is_file()) == [f'{sha256}.txt']
+
+
+def test_interrupted_stream_leaves_no_partial_file(app, tmp_path):
+    app.config.update(ATTACHMENT_STORAGE_ROOT=str(tmp_path))
+
+    class BrokenStream(io.BytesIO):
+        def read(self, size=-1):
+            if self.tell():
+                raise OSError('connexion interrompue')
+            return super().read(4)
+
+    with pytest.raises(OSError):
+        get_storage().put_stream(BrokenStream(b'contenu'), 'txt')
+    assert list(tmp_path.iterdir()) == []
+    with pytest.raises(TypeError):
+        AttachmentStorage()
+
+
+def test_attachment_serving_supports_range_and_etag(app, tmp_path):
+    client = _client(app, tmp_path)
+    key = get_storage().put_stream(io.BytesIO(b'0123456789'), 'mp4')
+
+    full = client.get(f'/attachments/{key}')
+    assert full.status_code == 200 and full.data == b'0123456789'
+    assert 'immutable' in full.headers['Cache-Control'] and 'private' in full.headers['Cache-Control']
+    assert 'max-age=31536000' in full.headers['Cache-Control']
+
+    partial = client.get(f'/attachments/{key}', headers={'Range': 'bytes=2-5'})
+    assert partial.status_code == 206 and partial.data == b'2345'
+    assert partial.headers['Content-Range'] == 'bytes 2-5/10'
+
+    cached = client.get(f'/attachments/{key}', headers={'If-None-Match': full.headers['ETag']})
+    assert cached.status_code == 304
+
+    assert client.get('/attachments/../../etc/passwd').status_code == 404
+    assert client.get('/attachments/aa/bb/inconnu.mp4').status_code == 404
+
+
+def test_attachment_serving_can_be_delegated_to_nginx(app, tmp_path):
+    client = _client(app, tmp_path)
+    app.config.update(ATTACHMENT_ACCEL_REDIRECT='/protected/')
+    key = get_storage().put_stream(io.BytesIO(b'video'), 'mp4')
+
+    response = client.get(f'/attachments/{key}')
+    assert response.headers['X-Accel-Redirect'] == f'/protected/{key}'
+    assert response.data == b'' and response.mimetype == 'video/mp4'
+
+
+def test_legacy_attachments_are_migrated_to_the_store(app, tmp_path):
+    from app.models import Conversation, Message
+
+    app.config.update(ATTACHMENT_STORAGE_ROOT=str(tmp_path / 'store'), UPLOAD_FOLDER=str(tmp_path))
+    for name in ('message_1_a.txt', 'message_1_b.txt'):
+        (tmp_path / name).write_bytes(b'doublon')
+    user = User(name='entry', matriculate='M1', phone='P1', password='x', role='data_entry')
+    conversation = Conversation(type='private')
+    db.session.add_all([user, conversation])
+    db.session.flush()
+    db.session.add_all([
+        Message(conversation_id=conversation.id, sender_id=user.id, attachment_type='file',
+                attachment_path=f'uploads/messages/{name}')
+        for name in ('message_1_a.txt', 'message_1_b.txt')
+    ])
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['migrate-attachments'])
+
+    assert '2 pièces jointes' in result.output
+    keys = set(db.session.scalars(db.select(Message.attachment_path)))
+    sha256 = hashlib.sha256(b'doublon').hexdigest()
+    assert keys == {f'{sha256[:2]}/{sha256[2:4]}/{sha256}.txt'}
+    assert not (tmp_path / 'message_1_a.txt').exists()
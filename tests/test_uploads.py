@@ -0,0 +1,104 @@
+import hashlib
+import os
+
+from app import db
+from app.models import Conversation, ConversationParticipant, Message, Upload, User
+
+
+def _setup(app, tmp_path):
+    app.config.update(
+        ATTACHMENT_STORAGE_ROOT=str(tmp_path / 'store'), UPLOAD_TMP_FOLDER=str(tmp_path / 'tmp'),
+        UPLOAD_CHUNK_SIZE=4, UPLOAD_DAILY_QUOTA=20
+    )
+    user = User(name='entry', matriculate='M1', phone='P1', password='x', role='data_entry')
+    conversation = Conversation(type='private')
+    db.session.add_all([user, conversation])
+    db.session.flush()
+    db.session.add(ConversationParticipant(conversation_id=conversation.id, user_id=user.id))
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+    return client, user, conversation
+
+
+def _put(client, upload_id, data, start, total):
+    return client.put(f'/uploads/{upload_id}', data=data,
+                      headers={'Content-Range': f'bytes {start}-{start + len(data) - 1}/{total}'})
+
+
+def test_chunked_upload_resumes_and_deduplicates(app, tmp_path):
+    client, user, conversation = _setup(app, tmp_path)
+    content = b'0123456789'
+
+    started = client.post('/uploads', json={'conversation_id': conversation.id, 'filename': 'note.txt', 'size': 10})
+    assert started.status_code == 201
+    upload_id = started.get_json()['upload_id']
+
+    assert _put(client, upload_id, content[:4], 0, 10).get_json()['offset'] == 4
+    # Morceau rejoué après une coupure : refusé avec la position de reprise
+    replay = _put(client, upload_id, content[:4], 0, 10)
+    assert replay.status_code == 409 and replay.get_json()['offset'] == 4
+    assert client.get(f'/uploads/{upload_id}').get_json()['offset'] == 4
+    assert _put(client, upload_id, content[4:9], 4, 10).status_code == 413  # morceau trop grand
+
+    _put(client, upload_id, content[4:8], 4, 10)
+    done = _put(client, upload_id, content[8:], 8, 10).get_json()
+    sha256 = hashlib.sha256(content).hexdigest()
+    assert done['complete'] and done['attachment_path'] == f'{sha256[:2]}/{sha256[2:4]}/{sha256}.txt'
+
+    # Même contenu : un seul fichier stocké
+    second = client.post('/uploads', json={'conversation_id': conversation.id, 'filename': 'copie.txt', 'size': 10})
+    second_id = second.get_json()['upload_id']
+    _put(client, second_id, content[:4], 0, 10)
+    _put(client, second_id, content[4:8], 4, 10)
+    assert _put(client, second_id, content[8:], 8, 10).get_json()['attachment_path'] == done['attachment_path']
+    assert os.listdir(tmp_path / 'store' / sha256[:2] / sha256[2:4]) == [f'{sha256}.txt']
+    assert os.listdir(app.config['UPLOAD_TMP_FOLDER']) == []
+
+    client.post('/send', data={'conversation_id': conversation.id, 'content': '', 'upload_id': upload_id})
+    message = Message.query.filter_by(conversation_id=conversation.id).one()
+    assert (message.attachment_path, message.attachment_type) == (done['attachment_path'], 'file')
+
+
+def test_upload_quota_and_extension_are_checked_upfront(app, tmp_path):
+    client, user, conversation = _setup(app, tmp_path)
+
+    refused = client.post('/uploads', json={'conversation_id': conversation.id, 'filename': 'script.exe', 'size': 5})
+    assert refused.status_code == 400
+    assert client.post('/uploads', json={
+        'conversation_id': conversation.id, 'filename': 'a.txt', 'size': 15
+    }).status_code == 201
+    over_quota = client.post('/uploads', json={'conversation_id': conversation.id, 'filename': 'b.txt', 'size': 6})
+    assert over_quota.status_code == 413
+    assert Upload.query.count() == 1
+
+
+def test_completion_is_idempotent_and_abandoned_uploads_expire(app, tmp_path):
+    from datetime import datetime, timedelta
+    from app.utils.uploads import complete_upload, purge_abandoned_uploads
+
+    client, user, conversation = _setup(app, tmp_path)
+    finished_id = client.post('/uploads', json={
+        'conversation_id': conversation.id, 'filename': 'a.txt', 'size': 3
+    }).get_json()['upload_id']
+    _put(client, finished_id, b'abc', 0, 3)
+    finished = db.session.get(Upload, finished_id)
+    # Second dernier morceau concurrent : l'envoi déjà terminé n'est pas rangé une seconde fois
+    assert complete_upload(finished).attachment_path == finished.attachment_path
+
+    abandoned_id = client.post('/uploads', json={
+        'conversation_id': conversation.id, 'filename': 'b.txt', 'size': 8
+    }).get_json()['upload_id']
+    _put(client, abandoned_id, b'abcd', 0, 8)
+    orphan = tmp_path / 'tmp' / 'orphelin.part'
+    orphan.write_bytes(b'x')
+    os.utime(orphan, (0, 0))
+
+    assert purge_abandoned_uploads() == 1  # fichier orphelin ancien ; l'envoi en cours est conservé
+    db.session.get(Upload, abandoned_id).created_at = datetime.utcnow() - timedelta(days=2)
+    db.session.commit()
+    assert purge_abandoned_uploads() == 1
+    assert os.listdir(tmp_path / 'tmp') == []
+    assert db.session.get(Upload, abandoned_id) is None
+    assert db.session.get(Upload, finished_id) is not None